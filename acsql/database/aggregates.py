@@ -0,0 +1,454 @@
+#! /usr/bin/env python
+
+"""Maintains and reads the ``aggregate_counts`` table of the ``acsql``
+database, which holds running counts that would otherwise require a
+full table scan to compute.
+
+The following categories of counts are kept:
+
+    - ``detector_filter`` - the number of observations for each
+      ``<detector>/<filter1>/<filter2>`` combination
+    - ``month`` - the number of observations for each ``YYYY-MM`` month
+      of ``date_obs``
+    - ``proposal_type`` - the number of observations for each proposal
+      type
+    - ``table`` - the number of records in each of the tables that are
+      populated by ingestion (e.g. ``wfc_raw_0``)
+
+The counts are updated incrementally during ingestion (see
+``acsql.ingest.ingest``), so that reading them only requires retrieving
+a handful of rows.  They can be recomputed from scratch with
+``rebuild_aggregates``.
+
+Within a long transaction (see ``acsql.ingest.ingest.ingest_group``),
+the increments can be collected in memory with ``defer_counts`` and
+applied just before the transaction is committed with
+``apply_deferred_counts``, so that the rows of the table are only
+locked briefly.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported and used as such:
+    ::
+
+        from acsql.database.aggregates import get_filter_distribution
+        from acsql.database.aggregates import get_table_counts
+
+        filter_distribution = get_filter_distribution('WFC')
+        table_counts = get_table_counts()
+
+    The counts can be rebuilt from the command line as such:
+    ::
+
+        python aggregates.py
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``sqlalchemy``
+"""
+
+from collections import OrderedDict
+import logging
+import os
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from acsql.database import database_interface
+from acsql.database.database_interface import AggregateCounts
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import Observations
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import setup_logging
+from acsql.utils.utils import TABLE_DEFS
+
+# The tables (other than the header tables) whose records are counted
+COUNTED_TABLES = ['master', 'datasets', 'observations']
+
+# The increments of the current transaction of this process that have
+# not been applied yet, keyed by (category, name), or ``None`` if
+# increments are applied immediately (see ``defer_counts``)
+DEFERRED_COUNTS = [None]
+
+
+def _apply_counts(deltas, connection):
+    """Add the given amounts to the corresponding counts, in the order
+    of the ``deltas``.
+
+    Parameters
+    ----------
+    deltas : dict
+        A dictionary whose keys are ``(category, name)`` tuples and
+        whose values are the amounts to add to the counts.
+    connection : obj
+        The ``sqlalchemy`` connection or engine with which to update
+        the counts.
+    """
+
+    table = AggregateCounts.__table__
+
+    for (category, name), delta in deltas.items():
+        update = table.update()\
+            .where(table.c.category == category)\
+            .where(table.c.name == name)\
+            .values(total=table.c.total + delta)
+        if connection.execute(update).rowcount:
+            continue
+
+        # The count does not exist yet, unless another process has
+        # just inserted it
+        try:
+            connection.execute(table.insert(), {'category': category,
+                                                'name': name, 'total': delta})
+        except IntegrityError:
+            connection.execute(update)
+
+
+def _get_count_names(data_dict):
+    """Return the ``(category, name)`` pairs of the counts that the
+    given ``observations`` table entry contributes to.
+
+    Parameters
+    ----------
+    data_dict : dict
+        The column/value pairs of an ``observations`` table entry.
+
+    Returns
+    -------
+    count_names : list
+        A list of ``(category, name)`` tuples.
+    """
+
+    date_obs = data_dict.get('date_obs')
+
+    count_names = [
+        ('detector_filter', '{}/{}/{}'.format(data_dict.get('detector'),
+                                              data_dict.get('filter1'),
+                                              data_dict.get('filter2'))),
+        ('month', str(date_obs)[:7] if date_obs else 'None'),
+        ('proposal_type', str(data_dict.get('proposal_type')))]
+
+    return count_names
+
+
+def apply_deferred_counts(connection):
+    """Apply the increments collected since ``defer_counts`` was called,
+    and apply any further increments immediately.
+
+    The counts are updated in order of their ``(category, name)``, so
+    that concurrent transactions lock the rows of the table in the same
+    order and do not deadlock.
+
+    Parameters
+    ----------
+    connection : obj
+        The ``sqlalchemy`` connection of the transaction.
+    """
+
+    deltas = DEFERRED_COUNTS[0] or {}
+    DEFERRED_COUNTS[0] = None
+
+    _apply_counts(OrderedDict(sorted((key, value)
+                                     for key, value in deltas.items()
+                                     if value)), connection)
+
+
+def defer_counts():
+    """Collect the increments made with a connection (see
+    ``increment_counts``) in memory instead of applying them, until
+    ``apply_deferred_counts`` or ``discard_deferred_counts`` is called.
+    """
+
+    DEFERRED_COUNTS[0] = {}
+
+
+def discard_deferred_counts():
+    """Discard the increments collected since ``defer_counts`` was
+    called (e.g. after their transaction was rolled back), and apply
+    any further increments immediately.
+    """
+
+    DEFERRED_COUNTS[0] = None
+
+
+def get_counts(category):
+    """Return the counts of the given ``category``.
+
+    Parameters
+    ----------
+    category : str
+        The category of counts (e.g. ``month``).
+
+    Returns
+    -------
+    counts : dict
+        A dictionary whose keys are the names of the counts and whose
+        values are the counts.  Counts of zero are omitted.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    results = session.query(AggregateCounts.name, AggregateCounts.total)\
+        .filter(AggregateCounts.category == category)\
+        .filter(AggregateCounts.total > 0).all()
+    session.close()
+    engine.dispose()
+
+    counts = dict(results)
+
+    return counts
+
+
+def get_filter_distribution(detector):
+    """Return the number of observations of each ``filter1``/``filter2``
+    combination for the given ``detector``.
+
+    Parameters
+    ----------
+    detector : str
+        The detector (e.g. ``WFC``).
+
+    Returns
+    -------
+    filter_distribution : list
+        A list of ``(filter1, filter2, count)`` tuples, sorted by
+        decreasing count.
+    """
+
+    filter_distribution = []
+    for name, total in get_counts('detector_filter').items():
+        name_detector, filter1, filter2 = name.split('/', 2)
+        if name_detector == detector.upper():
+            filter_distribution.append((filter1, filter2, total))
+
+    return sorted(filter_distribution, key=lambda item: item[2], reverse=True)
+
+
+def get_monthly_counts():
+    """Return the number of observations in each month of ``date_obs``.
+
+    Returns
+    -------
+    monthly_counts : OrderedDict
+        A dictionary whose keys are ``YYYY-MM`` months (in order) and
+        whose values are the counts.
+    """
+
+    counts = get_counts('month')
+    monthly_counts = OrderedDict([(month, counts[month])
+                                  for month in sorted(counts)])
+
+    return monthly_counts
+
+
+def get_observation_count_names(rootname):
+    """Return the ``(category, name)`` pairs of the counts that the
+    existing ``observations`` table entry for the given ``rootname``
+    contributes to.
+
+    This is used during ingestion to determine which counts to
+    decrement when an existing entry is updated.
+
+    Parameters
+    ----------
+    rootname : str
+        The rootname of the observation.
+
+    Returns
+    -------
+    count_names : list
+        A list of ``(category, name)`` tuples, which is empty if there
+        is no entry for the ``rootname``.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    result = session.query(Observations.detector, Observations.filter1,
+                           Observations.filter2, Observations.date_obs,
+                           Observations.proposal_type)\
+        .filter(Observations.rootname == rootname).first()
+    session.close()
+    engine.dispose()
+
+    if result is None:
+        return []
+
+    data_dict = dict(zip(['detector', 'filter1', 'filter2', 'date_obs',
+                          'proposal_type'], result))
+
+    return _get_count_names(data_dict)
+
+
+def get_proposal_type_counts():
+    """Return the number of observations of each proposal type.
+
+    Returns
+    -------
+    proposal_type_counts : dict
+        A dictionary whose keys are proposal types and whose values are
+        the counts.
+    """
+
+    return get_counts('proposal_type')
+
+
+def get_table_counts():
+    """Return the number of records in each of the tables that are
+    populated by ingestion.
+
+    Returns
+    -------
+    table_counts : dict
+        A dictionary whose keys are (lowercase) table names and whose
+        values are the counts.
+    """
+
+    return get_counts('table')
+
+
+def increment_counts(deltas, connection=None):
+    """Add the given amounts to the corresponding counts.
+
+    Each count is incremented with a single ``UPDATE`` statement, so
+    that concurrent ingestion processes do not overwrite each other's
+    increments.  If the increments are deferred (see ``defer_counts``)
+    and a ``connection`` is supplied, they are instead collected until
+    the end of the transaction.
+
+    Parameters
+    ----------
+    deltas : dict
+        A dictionary whose keys are ``(category, name)`` tuples and
+        whose values are the amounts to add to the counts.
+    connection : obj, optional
+        If supplied, the counts are updated with the given
+        ``sqlalchemy`` connection, as part of its current transaction.
+    """
+
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    if connection is not None and DEFERRED_COUNTS[0] is not None:
+        for key, value in deltas.items():
+            DEFERRED_COUNTS[0][key] = DEFERRED_COUNTS[0].get(key, 0) + value
+        return
+
+    if connection is None:
+        session, base, engine = load_connection(SETTINGS['connection_string'])
+        _apply_counts(deltas, engine)
+        session.close()
+        engine.dispose()
+        return
+
+    _apply_counts(deltas, connection)
+
+
+def increment_table_count(table, connection=None):
+    """Increment the record count of the given ``table`` by one.
+
+    Parameters
+    ----------
+    table : str
+        The name of the table (e.g. ``WFC_raw_0``).
+    connection : obj, optional
+        If supplied, the count is updated with the given
+        ``sqlalchemy`` connection, as part of its current transaction.
+    """
+
+    increment_counts({('table', table.lower()): 1}, connection)
+
+
+def rebuild_aggregates(engine):
+    """Delete all rows from the ``aggregate_counts`` table and
+    recompute the counts from the ``observations`` table and the
+    tables populated by ingestion.
+
+    Parameters
+    ----------
+    engine : obj
+        The ``engine`` used to connect to the ``acsql`` database.
+    """
+
+    observations = Observations.__table__
+    columns = observations.c
+    statements = {
+        'detector_filter': select([columns.detector, columns.filter1,
+                                   columns.filter2, func.count()])
+            .group_by(columns.detector, columns.filter1, columns.filter2),
+        'month': select([func.substr(columns.date_obs, 1, 7), func.count()])
+            .group_by(func.substr(columns.date_obs, 1, 7)),
+        'proposal_type': select([columns.proposal_type, func.count()])
+            .group_by(columns.proposal_type)}
+
+    with engine.begin() as connection:
+        connection.execute(AggregateCounts.__table__.delete())
+
+        rows = []
+        for category, statement in statements.items():
+            for result in connection.execute(statement).fetchall():
+                if category == 'detector_filter':
+                    name = '{}/{}/{}'.format(*result[:3])
+                else:
+                    name = str(result[0])
+                rows.append({'category': category, 'name': name,
+                             'total': result[-1]})
+
+        tables = database_interface.base.metadata.tables
+        for table_name in sorted(TABLE_DEFS) + COUNTED_TABLES:
+            table = tables.get(table_name)
+            if table is None:
+                continue
+            total = connection.execute(
+                select([func.count()]).select_from(table)).scalar()
+            rows.append({'category': 'table', 'name': table_name,
+                         'total': total})
+
+        if rows:
+            connection.execute(AggregateCounts.__table__.insert(), rows)
+
+    logging.info('Rebuilt {} aggregate counts'.format(len(rows)))
+
+
+def update_observation_counts(previous_count_names, data_dict,
+                              connection=None):
+    """Update the observation counts for an ``observations`` table
+    entry that was just inserted or updated.
+
+    Parameters
+    ----------
+    previous_count_names : list
+        The ``(category, name)`` pairs that the entry contributed to
+        before it was updated (see ``get_observation_count_names``),
+        or an empty list if the entry was inserted.
+    data_dict : dict
+        The column/value pairs of the ``observations`` table entry.
+    connection : obj, optional
+        If supplied, the counts are updated with the given
+        ``sqlalchemy`` connection, as part of its current transaction.
+    """
+
+    deltas = {}
+    for count_name in previous_count_names:
+        deltas[count_name] = deltas.get(count_name, 0) - 1
+    for count_name in _get_count_names(data_dict):
+        deltas[count_name] = deltas.get(count_name, 0) + 1
+
+    increment_counts(deltas, connection)
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    rebuild_aggregates(engine)
+    session.close()
+    engine.dispose()
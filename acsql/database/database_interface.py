@@ -33,7 +33,16 @@ Use
         from acsql.database.database_interface import engine
         from acsql.database.database_interface import session
         from acsql.database.database_interface import Master
+        from acsql.database.database_interface import AggregateCounts
         from acsql.database.database_interface import Datasets
+        from acsql.database.database_interface import FileFingerprints
+        from acsql.database.database_interface import Headers
+        from acsql.database.database_interface import MissingKeywords
+        from acsql.database.database_interface import Observations
+        from acsql.database.database_interface import Proposals
+        from acsql.database.database_interface import ReferenceFiles
+        from acsql.database.database_interface import NameIndex
+        from acsql.database.database_interface import NameTrigrams
         from acsql.database.database_interface import <header_table>
 
 Dependencies
@@ -45,8 +54,13 @@ Dependencies
     - ``sqlalchemy``
 """
 
+from collections import OrderedDict
+import fnmatch
+import math
 import os
+import sqlite3
 
+from sqlalchemy import BigInteger
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import create_engine
@@ -54,9 +68,11 @@ from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import Index
 from sqlalchemy import Enum
+from sqlalchemy import event
 from sqlalchemy import ForeignKey
 from sqlalchemy import ForeignKeyConstraint
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import String
 from sqlalchemy import Text
@@ -64,8 +80,65 @@ from sqlalchemy import Time
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.types import Float
 
+from acsql.utils.utils import INDEX_DEFS
 from acsql.utils.utils import SETTINGS
 
+# The number of seconds that a SQLite connection waits for a lock
+SQLITE_BUSY_TIMEOUT = 60
+
+# The pragmas set on each SQLite connection: write-ahead logging, so that
+# readers do not block the writer (and vice versa), with fewer fsyncs,
+# a 64 MB page cache, and 256 MB of memory-mapped I/O
+SQLITE_PRAGMAS = OrderedDict([('journal_mode', 'WAL'),
+                              ('synchronous', 'NORMAL'),
+                              ('cache_size', -65536),
+                              ('mmap_size', 268435456),
+                              ('temp_store', 'MEMORY')])
+
+
+def define_column(keyword, keyword_type):
+    """Return the column for the given header ``keyword`` of the given
+    table definition data type.
+
+    Parameters
+    ----------
+    keyword : str
+        The (uppercase) header keyword.
+    keyword_type : str
+        The data type (e.g. ``Float``), as stored in the
+        ``table_definitions`` files.
+
+    Returns
+    -------
+    column : obj
+        A SQLAlchemy ``Column`` object for the given ``keyword``.
+    """
+
+    special_keywords = ['RULEFILE', 'FWERROR', 'FW2ERROR', 'PROPTTL1',
+                        'TARDESCR', 'QUALCOM2']
+
+    if keyword in special_keywords:
+        return get_special_column(keyword)
+    elif keyword_type == 'Integer':
+        return Column(Integer())
+    elif keyword_type == 'String':
+        return Column(Text(50))
+    elif keyword_type == 'Float':
+        return Column(Float(precision=32))
+    elif keyword_type == 'Decimal':
+        return Column(Float(precision='13,8'))
+    elif keyword_type == 'Date':
+        return Column(Date())
+    elif keyword_type == 'Time':
+        return Column(Time())
+    elif keyword_type == 'DateTime':
+        return Column(DateTime)
+    elif keyword_type == 'Bool':
+        return Column(Boolean)
+    else:
+        raise ValueError('unrecognized header keyword type: {}:{}'.format(
+            keyword, keyword_type))
+
 
 def define_columns(data_dict, class_name):
     """Dynamically define the class attributes for the ORM
@@ -84,35 +157,12 @@ def define_columns(data_dict, class_name):
         definitions added.
     """
 
-    special_keywords = ['RULEFILE', 'FWERROR', 'FW2ERROR', 'PROPTTL1',
-                        'TARDESCR', 'QUALCOM2']
-
     with open(os.path.join(os.path.split(__file__)[0], 'table_definitions',
                            class_name.lower() + '.txt'), 'r') as f:
         data = f.readlines()
     keywords = [item.strip().split(', ') for item in data]
     for keyword in keywords:
-        if keyword[0] in special_keywords:
-            data_dict[keyword[0].lower()] = get_special_column(keyword[0])
-        elif keyword[1] == 'Integer':
-            data_dict[keyword[0].lower()] = Column(Integer())
-        elif keyword[1] == 'String':
-            data_dict[keyword[0].lower()] = Column(Text(50))
-        elif keyword[1] == 'Float':
-            data_dict[keyword[0].lower()] = Column(Float(precision=32))
-        elif keyword[1] == 'Decimal':
-            data_dict[keyword[0].lower()] = Column(Float(precision='13,8'))
-        elif keyword[1] == 'Date':
-            data_dict[keyword[0].lower()] = Column(Date())
-        elif keyword[1] == 'Time':
-            data_dict[keyword[0].lower()] = Column(Time())
-        elif keyword[1] == 'DateTime':
-            data_dict[keyword[0].lower()] = Column(DateTime)
-        elif keyword[1] == 'Bool':
-            data_dict[keyword[0].lower()] = Column(Boolean)
-        else:
-            raise ValueError('unrecognized header keyword type: {}:{}'.format(
-                keyword[0], keyword[1]))
+        data_dict[keyword[0].lower()] = define_column(keyword[0], keyword[1])
 
         if 'aperture' in data_dict:
             data_dict['aperture'] = Column(String(50), index=True)
@@ -120,6 +170,43 @@ def define_columns(data_dict, class_name):
     return data_dict
 
 
+def define_indexes(data_dict, class_name):
+    """Return the indexes for the ORM with the given ``class_name``,
+    as defined by the ``index_definitions.yaml`` file.
+
+    Indexes whose columns do not all exist in the ORM are skipped.
+    Columns stored as ``Text`` are given a prefix length so that they
+    can be indexed by ``MySQL``.
+
+    Parameters
+    ----------
+    data_dict : dict
+        A dictionary containing the ORM definitions
+    class_name : str
+        The name of the class/ORM.
+
+    Returns
+    -------
+    indexes : list
+        A list of SQLAlchemy ``Index`` objects.
+    """
+
+    table_name = class_name.lower()
+    indexes = []
+    for pattern, index_list in INDEX_DEFS.items():
+        if not fnmatch.fnmatch(table_name, pattern):
+            continue
+        for columns in index_list:
+            if not all([column in data_dict for column in columns]):
+                continue
+            name = 'ix_{}_{}'.format(table_name, '_'.join(columns))
+            mysql_length = {column: 50 for column in columns
+                            if isinstance(data_dict[column].type, Text)}
+            indexes.append(Index(name, *columns, mysql_length=mysql_length))
+
+    return indexes
+
+
 def get_special_column(keyword):
     """Treat specific keywords separately.
 
@@ -142,6 +229,52 @@ def get_special_column(keyword):
         return Column(Text(50))
 
 
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Set the ``SQLITE_PRAGMAS`` (updated with the ``sqlite_pragmas``
+    setting, if any) on a new ``SQLite`` connection.
+
+    Parameters
+    ----------
+    dbapi_connection : obj
+        The ``sqlite3`` connection.
+    connection_record : obj
+        The ``sqlalchemy`` record of the connection (unused).
+    """
+
+    pragmas = OrderedDict(SQLITE_PRAGMAS)
+    pragmas.update(SETTINGS.get('sqlite_pragmas') or {})
+
+    cursor = dbapi_connection.cursor()
+    for pragma, value in pragmas.items():
+        cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+    cursor.close()
+
+
+def _add_sqlite_math_functions(dbapi_connection, connection_record):
+    """Add the ``sin``, ``cos``, and ``radians`` functions used by cone
+    searches (see ``acsql.database.sky_index.get_cone_clause``) to a
+    new ``SQLite`` connection, if ``SQLite`` was built without them.
+
+    Parameters
+    ----------
+    dbapi_connection : obj
+        The ``sqlite3`` connection.
+    connection_record : obj
+        The ``sqlalchemy`` record of the connection (unused).
+    """
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT sin(0), cos(0), radians(0)')
+    except sqlite3.OperationalError:
+        for name in ['sin', 'cos', 'radians']:
+            function = getattr(math, name)
+            dbapi_connection.create_function(
+                name, 1, lambda x, function=function:
+                    None if x is None else function(x))
+    cursor.close()
+
+
 def load_connection(connection_string):
     """Return ``session``, ``base``, and ``engine`` objects for
     connecting to the ``acsql`` database.
@@ -151,6 +284,13 @@ def load_connection(connection_string):
     instance of the ``session`` class. Return the ``session``,
     ``base``, and ``engine`` instances.
 
+    For ``SQLite`` databases, each connection waits up to
+    ``sqlite_busy_timeout`` seconds (a setting) for a lock instead of
+    failing with "database is locked", is tuned for concurrent
+    ingestion with the ``SQLITE_PRAGMAS`` (see ``_set_sqlite_pragmas``),
+    and has the math functions used by cone searches (see
+    ``_add_sqlite_math_functions``).
+
     Parameters
     ----------
     connection_string : str
@@ -169,7 +309,11 @@ def load_connection(connection_string):
         Provides a source of database connectivity and behavior.
     """
     if 'sqlite' in connection_string:
-        engine = create_engine(connection_string, echo=False)
+        timeout = SETTINGS.get('sqlite_busy_timeout', SQLITE_BUSY_TIMEOUT)
+        engine = create_engine(connection_string, echo=False,
+                               connect_args={'timeout': timeout})
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+        event.listen(engine, 'connect', _add_sqlite_math_functions)
     elif 'mysql' in connection_string:
         engine = create_engine(connection_string, echo=False, pool_timeout=100000)
     else:
@@ -205,7 +349,9 @@ def orm_factory(class_name):
                                    nullable=False)
     data_dict['filename'] = Column(String(18), nullable=False, unique=True)
     data_dict = define_columns(data_dict, class_name)
-    data_dict['__table_args__'] = {'mysql_row_format': 'DYNAMIC'}
+    indexes = define_indexes(data_dict, class_name)
+    data_dict['__table_args__'] = tuple(indexes) + \
+        ({'mysql_row_format': 'DYNAMIC'},)
 
     return type(class_name.upper(), (base,), data_dict)
 
@@ -221,12 +367,17 @@ class Master(base):
     first_ingest_date = Column(Date, nullable=False)
     last_ingest_date = Column(Date, nullable=False)
     detector = Column(Enum('WFC', 'HRC', 'SBC'), nullable=False)
+    proposid = Column(Integer, nullable=True)
     proposal_type = Column(Enum('CAL/ACS', 'CAL/OTA', 'CAL/STIS', 'CAL/WFC3',
                                 'ENG/ACS', 'GO', 'GO/DD', 'GO/PAR', 'GTO/ACS',
                                 'GTO/COS', 'NASA', 'SM3/ACS', 'SM3/ERO',
                                 'SM4/ACS', 'SM4/COS', 'SM4/ERO', 'SNAP'),
                            nullable=True)
 
+    # Allows for ordered rootname lookups within a proposal
+    __table_args__ = (Index('ix_master_proposid_rootname', 'proposid',
+                            'rootname'),)
+
 
 class Drizzle(base):
     """ORM for the drizzle data table."""
@@ -257,6 +408,180 @@ class Drizzle(base):
     wtsc = Column(Integer(), nullable=True)
 
 
+class Observations(base):
+    """ORM for the observations table, a denormalized summary of the
+    ``master`` and ``<detector>_raw_0`` tables with one row per
+    rootname across all detectors."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'observations'
+    rootname = Column(String(8), ForeignKey('master.rootname'),
+                      primary_key=True, index=True, nullable=False)
+    filename = Column(String(18), nullable=False)
+    detector = Column(String(3), nullable=False)
+    proposal_type = Column(String(10), nullable=True)
+    proposid = Column(Integer, nullable=True)
+    targname = Column(String(50), nullable=True)
+    filter1 = Column(String(50), nullable=True)
+    filter2 = Column(String(50), nullable=True)
+    aperture = Column(String(50), nullable=True)
+    exptime = Column(Float(precision=32), nullable=True)
+    date_obs = Column(String(10), nullable=True)
+    time_obs = Column(String(8), nullable=True)
+    expstart = Column(Float(precision=53), nullable=True)
+    pr_inv_l = Column(String(50), nullable=True)
+    pr_inv_f = Column(String(50), nullable=True)
+    ra_targ = Column(Float(precision=53), nullable=True)
+    dec_targ = Column(Float(precision=53), nullable=True)
+    sky_pixel = Column(Integer, nullable=True)
+    obstype = Column(String(50), nullable=True)
+    obsmode = Column(String(50), nullable=True)
+    subarray = Column(Boolean, nullable=True)
+    imagetyp = Column(String(50), nullable=True)
+    asn_id = Column(String(10), nullable=True)
+
+    __table_args__ = (
+        Index('ix_observations_targname_date_obs', 'targname', 'date_obs'),
+        Index('ix_observations_date_obs', 'date_obs', 'detector'),
+        Index('ix_observations_filters', 'filter1', 'filter2', 'detector'),
+        Index('ix_observations_proposid_rootname', 'proposid', 'rootname'),
+        Index('ix_observations_detector_date_obs', 'detector', 'date_obs'),
+        Index('ix_observations_exptime', 'exptime'),
+        Index('ix_observations_aperture', 'aperture'),
+        Index('ix_observations_imagetyp', 'imagetyp'),
+        Index('ix_observations_filter2', 'filter2'),
+        Index('ix_observations_obstype', 'obstype'),
+        Index('ix_observations_proposal_type', 'proposal_type'),
+        Index('ix_observations_pi', 'pr_inv_l', 'pr_inv_f'),
+        Index('ix_observations_pr_inv_f', 'pr_inv_f'),
+        Index('ix_observations_sky_pixel', 'sky_pixel', 'ra_targ',
+              'dec_targ'))
+
+
+class Proposals(base):
+    """ORM for the proposals table."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'proposals'
+    proposid = Column(Integer, primary_key=True, nullable=False)
+    title = Column(Text(500), nullable=True)
+    cycle = Column(String(10), nullable=True)
+    schedule = Column(String(50), nullable=True)
+    last_updated = Column(DateTime, nullable=False)
+
+
+class NameIndex(base):
+    """ORM for the name_index table, which holds the distinct values of
+    the wildcard-searchable name columns (e.g. ``targname``) of the
+    ``observations`` table."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'name_index'
+    column = Column(String(10), primary_key=True, nullable=False)
+    name = Column(String(50), primary_key=True, nullable=False)
+
+
+class NameTrigrams(base):
+    """ORM for the name_trigrams table, which maps the (uppercase)
+    trigrams of each entry of the ``name_index`` table to its name."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'name_trigrams'
+    column = Column(String(10), primary_key=True, nullable=False)
+    trigram = Column(String(3), primary_key=True, nullable=False)
+    name = Column(String(50), primary_key=True, nullable=False)
+
+
+class AggregateCounts(base):
+    """ORM for the aggregate_counts table, which holds running counts
+    of observations (e.g. by detector/filter combination) and of the
+    records in each table, keyed by ``category`` and ``name``."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'aggregate_counts'
+    category = Column(String(20), primary_key=True, nullable=False)
+    name = Column(String(120), primary_key=True, nullable=False)
+    total = Column(Integer, nullable=False)
+
+
+class MissingKeywords(base):
+    """ORM for the missing_keywords table, a registry of the header
+    keywords found during ingestion that do not yet have a column in
+    the corresponding header table."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'missing_keywords'
+    table_name = Column(String(20), primary_key=True, nullable=False)
+    keyword = Column(String(70), primary_key=True, nullable=False)
+    keyword_type = Column(Enum('String', 'Integer', 'Float', 'Bool'),
+                          nullable=False)
+    sample_file = Column(String(18), nullable=False)
+    total = Column(Integer, nullable=False)
+    last_seen_date = Column(Date, nullable=False)
+
+
+class ReferenceFiles(base):
+    """ORM for the reference_files table, an inverted index of the
+    calibration reference files (e.g. ``DARKFILE``) recorded in the
+    header tables, with one row per reference file keyword per
+    ingested header."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'reference_files'
+    reference_file = Column(String(50), primary_key=True, nullable=False)
+    keyword = Column(String(8), primary_key=True, nullable=False)
+    table_name = Column(String(20), primary_key=True, nullable=False)
+    filename = Column(String(18), primary_key=True, nullable=False)
+    rootname = Column(String(8), ForeignKey('master.rootname'),
+                      nullable=False)
+
+    __table_args__ = (
+        Index('ix_reference_files_filename_table_name', 'filename',
+              'table_name'),)
+
+
+class Headers(base):
+    """ORM for the headers table, which holds the complete header of
+    each extension of each ingested file as ``zlib``-compressed text,
+    so that headers can be displayed without reading the FITS
+    files."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'headers'
+    filename = Column(String(18), primary_key=True, nullable=False)
+    ext = Column(Integer, primary_key=True, nullable=False)
+    rootname = Column(String(8), ForeignKey('master.rootname'),
+                      index=True, nullable=False)
+    header = Column(LargeBinary(length=16777215), nullable=False)
+    checksum = Column(String(32), nullable=False)
+
+
+class FileFingerprints(base):
+    """ORM for the file_fingerprints table, which holds the size,
+    modification time, and (optionally) a hash of the headers of each
+    ingested file, so that unchanged files can be skipped when they
+    are re-ingested."""
+    def __init__(self, data_dict):
+        self.__dict__.update(data_dict)
+
+    __tablename__ = 'file_fingerprints'
+    filename = Column(String(18), primary_key=True, nullable=False)
+    rootname = Column(String(8), ForeignKey('master.rootname'),
+                      index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    mtime = Column(Float(precision=53), nullable=False)
+    header_hash = Column(String(32), nullable=True)
+    last_ingest_date = Column(Date, nullable=False)
+
+
 class Datasets(base):
     """ORM for the datasets table."""
     def __init__(self, data_dict):
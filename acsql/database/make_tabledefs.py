@@ -4,6 +4,12 @@
 data types for each ACS filetype (and each extension).  Each text file
 corresponds to a header table in the ``acsql`` database.
 
+The keywords are gathered with a single survey of the filesystem: each
+FITS file is opened only once, and the ``(table, keyword, type)``
+entries of all of its extensions are collected.  The files are
+surveyed in chunks by a pool of ``ncores`` processes, and the results
+of each chunk are merged once the survey is complete.
+
 Authors
 -------
     - Sara Ogaz
@@ -21,88 +27,215 @@ Dependencies
     External library dependencies include:
 
     - ``acsql``
-    - ``numpy``
-    - ``stak`` (``https://github.com/spacetelescope/stak``)
-
-Notes
------
-    The ``stak.Hselect`` dependency still depends on Python 2 at the
-    time of this writing.
+    - ``astropy``
 """
 
+from collections import OrderedDict
 import glob
+import logging
+import multiprocessing
 import os
+import time
 
-import numpy as np
+from astropy.io import fits
 
 from acsql.utils import utils
-from acsql.utils.utils import get_files_with_ftype
-from acsql.utils.utils import filter_files_by_size
-from acsql.utils.utils import build_keyword_list
+from acsql.utils.utils import get_keyword_type
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import setup_logging
+from acsql.utils.utils import widen_keyword_type
+
+# The number of files surveyed by each task of the process pool
+SURVEY_CHUNK_SIZE = 500
 
 
-def make_tabledefs(detector):
+def _get_survey_detector(filename, header):
+    """Return the detector of the given file, as determined from its
+    primary header.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the file.
+    header : obj
+        The primary header of the file.
+
+    Returns
+    -------
+    detector : str or None
+        The lowercase detector (e.g. ``wfc``), or ``None`` if the file
+        is not of an ACS detector.
     """
-    Function to auto-produce the table_definition files.
 
-    Note that due to how ``hselect`` handles ``ASN`` files, they must
-    be handeled separately.
+    if os.path.basename(filename).split('.')[0][10:] in ['jif', 'jit']:
+        detector = header['CONFIG']
+        if detector == 'S/C':  # FGS observation
+            return None
+        return detector.lower().split('/')[1]
+    else:
+        return header['DETECTOR'].lower()
+
+
+def merge_keyword_types(keyword_types, new_keyword_types):
+    """Merge the ``(table, keyword)`` data types of
+    ``new_keyword_types`` into ``keyword_types``.
+
+    If a keyword is found with two different data types, the type that
+    can hold both is used (see ``widen_keyword_type``).
+
+    Parameters
+    ----------
+    keyword_types : OrderedDict
+        A dictionary whose keys are table names (e.g. ``wfc_flt_1``)
+        and whose values are ``OrderedDict`` objects of keyword/data
+        type pairs.  This dictionary is updated in place.
+    new_keyword_types : OrderedDict
+        A dictionary of the same form, to merge into
+        ``keyword_types``.
+
+    Returns
+    -------
+    keyword_types : OrderedDict
+        The merged dictionary.
+    """
+
+    for table, keywords in new_keyword_types.items():
+        table_keywords = keyword_types.setdefault(table, OrderedDict())
+        for keyword, keyword_type in keywords.items():
+            existing_type = table_keywords.setdefault(keyword, keyword_type)
+            table_keywords[keyword] = widen_keyword_type(existing_type,
+                                                         keyword_type)
+
+    return keyword_types
+
+
+def survey_files(filenames):
+    """Return the data types of the header keywords of each extension
+    of the given files, opening each file only once.
 
     Parameters
     ----------
-    detector : str
-        The detector (e.g. ``wfc``).
+    filenames : list
+        The paths to the FITS files.
+
+    Returns
+    -------
+    keyword_types : OrderedDict
+        A dictionary whose keys are table names (e.g. ``wfc_flt_1``)
+        and whose values are ``OrderedDict`` objects of keyword/data
+        type pairs, in the order in which they were first found.
     """
 
-    file_exts = getattr(utils, '{}_FILE_EXTS'.format(detector.upper()))
-    foreign_keys = getattr(utils, 'FOREIGN_KEY_HEADER_KEYWORDS')
-    skippable_keys = getattr(utils, 'SKIPPABLE_HEADER_KEYWORDS')
+    skippable_keys = getattr(utils, 'EXCLUDED_HEADER_KEYWORDS')
     drizzle_exp = getattr(utils, 'DRIZZLE_EXP')
+
+    keyword_types = OrderedDict()
+
+    for filename in filenames:
+        ftype = os.path.basename(filename).split('.')[0][10:]
+
+        try:
+            with fits.open(filename) as hdulist:
+                detector = _get_survey_detector(filename, hdulist[0].header)
+                if detector is None:
+                    continue
+                file_exts = getattr(utils, '{}_FILE_EXTS'.format(
+                    detector.upper()))
+                exts = [ext for ext in file_exts.get(ftype, [])
+                        if ext < len(hdulist)]
+
+                file_keyword_types = OrderedDict()
+                for ext in exts:
+                    table = '{}_{}_{}'.format(detector, ftype, ext)
+                    keywords = file_keyword_types.setdefault(table,
+                                                             OrderedDict())
+                    for card in hdulist[ext].header.cards:
+                        keyword = card.keyword.upper()
+                        if keyword in skippable_keys \
+                                or drizzle_exp.match(keyword) is not None:
+                            continue
+
+                        keyword_type = get_keyword_type(card.value)
+                        if keyword_type is None:
+                            logging.warning('Could not find type match: {}:{}'
+                                            .format(keyword, type(card.value)))
+                            continue
+
+                        # If the column has a hyphen, switch it to underscore
+                        keyword = keyword.replace('-', '_')
+                        keywords.setdefault(keyword, keyword_type)
+
+        except (AttributeError, KeyError, OSError) as e:
+            logging.warning('Unable to survey {}: {}'.format(filename, e))
+            continue
+
+        merge_keyword_types(keyword_types, file_keyword_types)
+
+    return keyword_types
+
+
+def make_tabledefs(detectors=None):
+    """
+    Function to auto-produce the table_definition files.
+
+    Every FITS file in the filesystem is surveyed once, in parallel,
+    and a table definition file is written for each table of the
+    given ``detectors`` for which keywords were found.
+
+    Parameters
+    ----------
+    detectors : list, optional
+        The detectors (e.g. ``['wfc']``) whose table definition files
+        are written.  By default, the files of every detector are
+        written.
+    """
+
+    if detectors is None:
+        detectors = ['wfc', 'sbc', 'hrc']
+
+    start = time.time()
     local_dir = os.path.realpath(os.path.dirname(__file__))
     table_def_dir = os.path.join(local_dir, 'table_definitions')
-    file_dir = getattr(utils, "SETTINGS")['filesystem']
-
-    for ftype in file_exts:
-        
-        all_files = get_files_with_ftype(ftype)
-
-        for ext in file_exts[ftype]:
-        
-            all_files = filter_files_by_size(all_files, ext)
-
-            filename = '{}_{}_{}.txt'.format(detector, ftype, ext)
-            key_list = build_keyword_list(all_files, ext)
-
-            print('Making file {}'.format(filename))
-            with open(os.path.join(table_def_dir, filename), 'w') as f:
-                for keyword,keytype in key_list:
-                    if keyword in foreign_keys:
-                        continue
-                    elif keyword in skippable_keys:
-                        continue
-                    elif drizzle_exp.match(keyword) is not None:
-                        continue
-                    elif keytype == str:
-                        ptype = 'String'
-                    elif keytype == int:
-                        ptype = 'Integer'
-                    elif keytype == bool:
-                        ptype = 'Bool'
-                    elif keytype == float:
-                        ptype = 'Float'
-                    else:
-                        error_str = 'Could not find type match: {}:{}'
-                        print(error_str.format(keyword, keytype))
-
-                    # If the column has a hyphen, switch it to underscore
-                    if '-' in keyword:
-                        keyword = keyword.replace('-', '_')
 
-                    f.write('{}, {}\n'.format(keyword, ptype))
+    # Gather the files of all filetypes with a single pass
+    filetypes = set()
+    for detector in detectors:
+        filetypes |= set(getattr(utils, '{}_FILE_EXTS'.format(
+            detector.upper())))
+    filenames = glob.glob(os.path.join(SETTINGS['filesystem'], 'j*', '*',
+                                       '*.fits'))
+    filenames = sorted([filename for filename in filenames if
+                        os.path.basename(filename).split('.')[0][10:]
+                        in filetypes])
+    logging.info('Surveying {} files'.format(len(filenames)))
+
+    # Survey the files in chunks, then merge the results of each chunk
+    chunks = [filenames[i:i + SURVEY_CHUNK_SIZE]
+              for i in range(0, len(filenames), SURVEY_CHUNK_SIZE)]
+    pool = multiprocessing.Pool(processes=SETTINGS['ncores'])
+    keyword_types = OrderedDict()
+    for chunk_keyword_types in pool.imap(survey_files, chunks):
+        merge_keyword_types(keyword_types, chunk_keyword_types)
+    pool.close()
+    pool.join()
+
+    for table in sorted(keyword_types):
+        if table.split('_')[0] not in detectors:
+            continue
+
+        filename = '{}.txt'.format(table)
+        logging.info('Making file {}'.format(filename))
+        with open(os.path.join(table_def_dir, filename), 'w') as f:
+            for keyword, keyword_type in keyword_types[table].items():
+                f.write('{}, {}\n'.format(keyword, keyword_type))
+
+    logging.info('Surveyed {} files in {:.1f} s'.format(len(filenames),
+                                                      time.time() - start))
 
 
 if __name__ == '__main__':
 
-    make_tabledefs('wfc')
-    make_tabledefs('sbc')
-    make_tabledefs('hrc')
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    make_tabledefs()
@@ -0,0 +1,267 @@
+#! /usr/bin/env python
+
+"""Creates and reports on the indexes of the ``acsql`` database.
+
+The indexes of the header tables are defined declaratively in the
+``index_definitions.yaml`` file (see ``database_interface.
+define_indexes``), and are created along with the tables by
+``reset_database.py``.  This module can be used to create any indexes
+that are missing from an existing database (``apply``), and to report
+which of the commonly performed queries (i.e. the ``/database/`` form
+filters and the ``queries`` module functions) lack index support, as
+determined by the database's ``EXPLAIN`` output (``report``).
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be used from the command line as such:
+    ::
+
+        python manage_indexes.py apply [--dry_run]
+        python manage_indexes.py report
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``sqlalchemy``
+"""
+
+import argparse
+
+from sqlalchemy import inspect
+
+from acsql.database import query_builders
+from acsql.database.database_interface import base
+from acsql.database.database_interface import engine
+from acsql.website.query_lib import _build_observations_query
+from acsql.website.query_lib import _convert_query_form_dict
+
+
+# Example data of the /database/ form, as returned by ``form.to_dict()``
+FORM_DATA = {'rootname': ['jabc01abq'], 'targname': ['NGC104'],
+             'proposid': ['12345'], 'proposal_type': ['GO'],
+             'detector': ['WFC'], 'obstype': ['IMAGING'],
+             'aperture': ['WFC'], 'filter1': ['F606W'],
+             'filter2': ['CLEAR2L'], 'imagetyp': ['EXT'],
+             'pr_inv_l': ['Smith'], 'pr_inv_f': ['John'],
+             'date_obs-op': ['between'], 'date_obs-val1': ['2005-01-01'],
+             'date_obs-val2': ['2006-01-01'], 'exptime-op': ['between'],
+             'exptime-val1': ['100'], 'exptime-val2': ['200'],
+             'cone_ra': ['6.02'], 'cone_dec': ['-72.08'],
+             'cone_radius': ['5']}
+
+
+def apply_indexes(dry_run=False):
+    """Create any indexes that are defined for the ``acsql`` tables
+    but do not yet exist in the database.
+
+    Parameters
+    ----------
+    dry_run : bool
+        If ``True``, only print the indexes that would be created.
+
+    Returns
+    -------
+    missing_indexes : list
+        A list of the names of indexes that were (or would be) created.
+    """
+
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    missing_indexes = []
+    for table in base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = set([item['name'] for item in
+                                inspector.get_indexes(table.name)])
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            missing_indexes.append(index.name)
+            if dry_run:
+                print('Would create {} on {}'.format(index.name, table.name))
+            else:
+                print('Creating {} on {}'.format(index.name, table.name))
+                index.create(engine)
+
+    print('{} missing indexes'.format(len(missing_indexes)))
+
+    return missing_indexes
+
+
+def explain(statement):
+    """Return the query plan for the given ``statement`` and whether
+    or not it requires a full table scan.
+
+    Parameters
+    ----------
+    statement : obj
+        A ``SQLAlchemy`` selectable.
+
+    Returns
+    -------
+    full_scan : bool
+        ``True`` if any table in the query plan is fully scanned.
+    plan : list
+        The rows of the query plan, as strings.
+    """
+
+    compiled = statement.compile(dialect=engine.dialect)
+    if compiled.positional:
+        params = tuple([compiled.params[name] for name in compiled.positiontup])
+    else:
+        params = compiled.params
+
+    if engine.dialect.name == 'sqlite':
+        explain_sql = 'EXPLAIN QUERY PLAN {}'.format(compiled)
+    else:
+        explain_sql = 'EXPLAIN {}'.format(compiled)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(explain_sql, params)
+        columns = [item[0].lower() for item in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+    if engine.dialect.name == 'sqlite':
+        plan = [row['detail'] for row in rows]
+        full_scan = any([detail.startswith('SCAN') and 'INDEX' not in detail
+                         for detail in plan])
+    else:
+        plan = ['{}: type={} key={}'.format(row['table'], row['type'],
+                row['key']) for row in rows]
+        full_scan = any([row['type'] == 'ALL' for row in rows])
+
+    return full_scan, plan
+
+
+def get_report_statements():
+    """Return the statements that are checked for index support.
+
+    These consist of the ``/database/`` form filters and the queries
+    performed by the ``queries`` module (for each of the detectors),
+    as built by the web application (see
+    ``acsql.website.query_lib``) and the ``query_builders`` module, so
+    that the report checks the statements that are actually performed.
+
+    Returns
+    -------
+    statements : list
+        A list of ``(name, statement)`` tuples.
+    """
+
+    statements = []
+
+    # Form filters, each applied on its own (the raw operator fields,
+    # e.g. date_obs-op, are combined into their own key when converted)
+    query_form_dict = _convert_query_form_dict(dict(FORM_DATA))
+    for key, value in query_form_dict.items():
+        if '-' in key:
+            continue
+        query = _build_observations_query(['rootname'], {key: value})
+        statements.append(('form: {}'.format(key), query.statement))
+
+    # queries module functions
+    statements.append(('all_filenames',
+        query_builders.all_filenames('jabc01ab').statement))
+    statements.append(('filenames_for_calibration',
+        query_builders.filenames_for_calibration(
+            'darkfile', 'jref$abc_drk.fits').statement))
+    statements.append(('files_for_reference_file',
+        query_builders.files_for_reference_file('abc_drk.fits').statement))
+    for detector in ['WFC', 'HRC', 'SBC']:
+        queries = [
+            ('filters_for_rootname',
+             query_builders.filters_for_rootname('jabc01ab', detector)),
+            ('filter_distribution',
+             query_builders.filter_distribution(detector)),
+            ('rootnames_for_target',
+             query_builders.rootnames_for_target('NGC104', detector)),
+            ('goodmean_for_dataset',
+             query_builders.goodmean_for_dataset('jabc', detector)),
+            ('rootnames_with_postflash',
+             query_builders.rootnames_with_postflash(detector)),
+            ('non_asn_rootnames',
+             query_builders.non_asn_rootnames(detector)),
+            ('filenames_in_date_range',
+             query_builders.filenames_in_date_range('2005-01-01',
+                                                    '2006-01-01', detector))]
+        for name, query in queries:
+            statements.append(('{} ({})'.format(name, detector),
+                               query.statement))
+
+    return statements
+
+
+def report_indexes():
+    """Print a report of which form filters and ``queries`` functions
+    require a full table scan.
+
+    Returns
+    -------
+    unsupported : list
+        The names of the statements that require a full table scan.
+    """
+
+    unsupported = []
+    for name, statement in get_report_statements():
+        full_scan, plan = explain(statement)
+        status = 'FULL SCAN' if full_scan else 'indexed'
+        print('{:<50} {:<10} {}'.format(name, status, '; '.join(plan)))
+        if full_scan:
+            unsupported.append(name)
+
+    print('\n{} queries lack index support'.format(len(unsupported)))
+
+    return unsupported
+
+
+def parse_args():
+    """Parse command line arguments. Returns ``args`` object
+
+    Returns
+    -------
+    args : obj
+        An argparse object containing all of the arguments
+    """
+
+    # Create help strings
+    command_help = 'Either "apply" to create any missing indexes, or '
+    command_help += '"report" to report which queries lack index support.'
+    dry_run_help = 'Only print the indexes that would be created.'
+
+    # Add arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command',
+                        action='store',
+                        choices=['apply', 'report'],
+                        help=command_help)
+    parser.add_argument('--dry_run',
+                        dest='dry_run',
+                        action='store_true',
+                        default=False,
+                        help=dry_run_help)
+
+    # Parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+
+    if args.command == 'apply':
+        apply_indexes(args.dry_run)
+    else:
+        report_indexes()
@@ -0,0 +1,206 @@
+"""Maintains and reads the ``missing_keywords`` table of the ``acsql``
+database, a registry of the header keywords found during ingestion
+that do not yet have a column in the corresponding header table.
+
+Each entry holds the header table, the keyword, its data type (as
+inferred from its values), a sample file containing the keyword, the
+number of times the keyword has been found, and the date it was last
+found.
+
+During ingestion (see ``acsql.ingest.ingest.update_header_table``),
+missing keywords are aggregated in memory by each process with
+``record_missing_keyword``, and written to the table in batches with
+``flush_missing_keywords``.  Any pending entries are also written when
+the process exits.  The registry is then used by ``update_tabledefs``
+to add the keywords to the ``table_definitions`` files.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported and used as such:
+    ::
+
+        from acsql.database.missing_keywords import flush_missing_keywords
+        from acsql.database.missing_keywords import get_missing_keywords
+        from acsql.database.missing_keywords import record_missing_keyword
+
+        record_missing_keyword('WFC_raw_0', 'NEWKEY', 1.5,
+                               'jabc01aaq_raw.fits')
+        flush_missing_keywords()
+        missing_keywords = get_missing_keywords()
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``sqlalchemy``
+"""
+
+from datetime import date
+import logging
+from multiprocessing.util import Finalize
+import os
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import MissingKeywords
+from acsql.utils.utils import get_keyword_type
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import widen_keyword_type
+
+# The number of pending entries at which they are written to the table
+MISSING_KEYWORDS_BATCH_SIZE = 200
+
+# The number of seconds after which pending entries are written to the
+# table, regardless of their number
+MISSING_KEYWORDS_FLUSH_INTERVAL = 60
+
+# The entries of this process that have not been written yet, keyed by
+# (table_name, keyword)
+PENDING = {}
+
+# The time at which the pending entries were last written
+LAST_FLUSH = [time.time()]
+
+# The ID of the process that registered the exit-time flush (which must
+# be registered again by each forked process, e.g. each pool worker)
+FINALIZER_PID = [None]
+
+
+def flush_missing_keywords(force=True):
+    """Write the pending entries of this process to the
+    ``missing_keywords`` table.
+
+    The count of each entry is incremented with a single ``UPDATE``
+    statement, so that concurrent ingestion processes do not overwrite
+    each other's counts.
+
+    Parameters
+    ----------
+    force : bool, optional
+        If ``False``, the entries are only written if there are at
+        least ``MISSING_KEYWORDS_BATCH_SIZE`` of them, or if they were
+        last written more than ``MISSING_KEYWORDS_FLUSH_INTERVAL``
+        seconds ago.
+    """
+
+    if not PENDING:
+        return
+    if not force and len(PENDING) < MISSING_KEYWORDS_BATCH_SIZE and \
+            time.time() - LAST_FLUSH[0] < MISSING_KEYWORDS_FLUSH_INTERVAL:
+        return
+
+    entries = list(PENDING.values())
+    PENDING.clear()
+    LAST_FLUSH[0] = time.time()
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    table = MissingKeywords.__table__
+
+    for entry in entries:
+        where = (table.c.table_name == entry['table_name']) & \
+            (table.c.keyword == entry['keyword'])
+        select_type = select([table.c.keyword_type]).where(where)
+
+        existing_type = engine.execute(select_type).scalar()
+        if existing_type is None:
+            try:
+                engine.execute(table.insert(), entry)
+                continue
+            except IntegrityError:
+                # The entry has just been inserted by another process
+                existing_type = engine.execute(select_type).scalar()
+
+        engine.execute(table.update().where(where).values(
+            keyword_type=widen_keyword_type(existing_type,
+                                            entry['keyword_type']),
+            total=table.c.total + entry['total'],
+            last_seen_date=entry['last_seen_date']))
+
+    session.close()
+    engine.dispose()
+
+    logging.info('Wrote {} missing keyword entries'.format(len(entries)))
+
+
+def get_missing_keywords(table_name=None, minimum_count=1):
+    """Return the entries of the ``missing_keywords`` table.
+
+    Parameters
+    ----------
+    table_name : str, optional
+        If supplied, only the entries of the given header table (e.g.
+        ``wfc_raw_0``) are returned.
+    minimum_count : int, optional
+        Only the entries that have been found at least this many times
+        are returned.
+
+    Returns
+    -------
+    missing_keywords : list
+        A list of dictionaries with ``table_name``, ``keyword``,
+        ``keyword_type``, ``sample_file``, ``total``, and
+        ``last_seen_date`` keys, sorted by table and keyword.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    query = session.query(MissingKeywords)\
+        .filter(MissingKeywords.total >= minimum_count)
+    if table_name:
+        query = query.filter(MissingKeywords.table_name == table_name.lower())
+    results = query.order_by(MissingKeywords.table_name,
+                             MissingKeywords.keyword).all()
+    session.close()
+    engine.dispose()
+
+    columns = MissingKeywords.__table__.columns.keys()
+    missing_keywords = [{column: getattr(result, column) for column in columns}
+                        for result in results]
+
+    return missing_keywords
+
+
+def record_missing_keyword(table_name, keyword, value, filename):
+    """Record that the given ``keyword`` was found in the header of
+    the given file but does not exist in the given header table.
+
+    The entry is held in memory until ``flush_missing_keywords`` is
+    called.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the header table (e.g. ``WFC_raw_0``).
+    keyword : str
+        The header keyword.
+    value : obj
+        The value of the keyword, used to infer its data type.
+    filename : str
+        The name of the file (e.g. ``jabc01aaq_raw.fits``).
+    """
+
+    # Write any pending entries when the process (or pool worker) exits
+    if FINALIZER_PID[0] != os.getpid():
+        Finalize(None, flush_missing_keywords, exitpriority=10)
+        FINALIZER_PID[0] = os.getpid()
+
+    keyword_type = get_keyword_type(value) or 'String'
+    key = (table_name.lower(), keyword.upper())
+
+    entry = PENDING.get(key)
+    if entry is None:
+        PENDING[key] = {'table_name': key[0], 'keyword': key[1],
+                        'keyword_type': keyword_type,
+                        'sample_file': filename, 'total': 1,
+                        'last_seen_date': date.today()}
+    else:
+        entry['keyword_type'] = widen_keyword_type(entry['keyword_type'],
+                                                   keyword_type)
+        entry['total'] += 1
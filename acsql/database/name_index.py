@@ -0,0 +1,235 @@
+"""Provides a trigram index of the wildcard-searchable name columns of
+the ``observations`` table (i.e. ``targname``, ``pr_inv_l``, and
+``pr_inv_f``), which allows for fast wildcard searches.
+
+A wildcard search such as ``*NGC*104`` cannot use a regular index, and
+so would otherwise require a scan of every observation.  Instead, the
+distinct values of each name column are stored in the ``name_index``
+table, and the (uppercase) trigrams of each name are stored in the
+``name_trigrams`` table.  A search first determines the candidate names
+that contain every trigram of the literal parts of the pattern, and
+then matches the candidates against the pattern itself.  The matching
+names can then be filtered on with a regular (indexed) ``IN`` clause.
+Matching is case-insensitive, and leading wildcards are supported.
+
+The index is kept up to date during ingestion (see
+``acsql.ingest.ingest.update_observations_table``), and can be rebuilt
+from the ``observations`` table with ``rebuild_name_index``.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported and used by the ``ingest``
+    module and the web application as such:
+    ::
+
+        from acsql.database.name_index import find_names
+        from acsql.database.name_index import update_name_index
+
+        update_name_index(data_dict)
+        names = find_names('targname', '*ngc*104')
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``sqlalchemy``
+"""
+
+import logging
+import re
+
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import NameIndex
+from acsql.database.database_interface import NameTrigrams
+from acsql.database.database_interface import Observations
+from acsql.database.database_interface import session
+from acsql.utils.utils import SETTINGS
+
+# The columns of the observations table that are indexed
+NAME_INDEX_COLUMNS = ['targname', 'pr_inv_l', 'pr_inv_f']
+
+
+def _get_pattern_regex(pattern):
+    """Return a compiled, case-insensitive regular expression that
+    matches the given wildcard ``pattern``, in which ``*`` or ``%``
+    match any number of characters.
+
+    Parameters
+    ----------
+    pattern : str
+        The wildcard pattern.
+
+    Returns
+    -------
+    regex : obj
+        The compiled regular expression.
+    """
+
+    parts = re.split(r'[*%]', pattern)
+    regex = re.compile('^{}$'.format('.*'.join([re.escape(part)
+                       for part in parts])), re.IGNORECASE | re.DOTALL)
+
+    return regex
+
+
+def _insert_name(connection, column, name):
+    """Insert the given ``name`` and its trigrams into the
+    ``name_index`` and ``name_trigrams`` tables.
+
+    Parameters
+    ----------
+    connection : obj
+        The connection (or session) used to execute the inserts.
+    column : str
+        The name column (e.g. ``targname``).
+    name : str
+        The name to insert.
+    """
+
+    connection.execute(NameIndex.__table__.insert(),
+                       {'column': column, 'name': name})
+
+    rows = [{'column': column, 'trigram': trigram, 'name': name}
+            for trigram in sorted(get_trigrams(name))]
+    if rows:
+        connection.execute(NameTrigrams.__table__.insert(), rows)
+
+
+def find_names(column, pattern):
+    """Return the distinct values of the given name ``column`` of the
+    ``observations`` table that match the given wildcard ``pattern``.
+
+    Parameters
+    ----------
+    column : str
+        The name column (e.g. ``targname``).
+    pattern : str
+        The case-insensitive wildcard pattern, in which ``*`` or ``%``
+        match any number of characters (e.g. ``*ngc*104``).
+
+    Returns
+    -------
+    names : list
+        The matching names.
+    """
+
+    fragments = [fragment for fragment in re.split(r'[*%]', pattern) if fragment]
+    trigrams = set()
+    for fragment in fragments:
+        trigrams |= get_trigrams(fragment)
+
+    # Determine the candidates, i.e. the names containing every trigram
+    if trigrams:
+        query = session.query(NameTrigrams.name)\
+            .filter(NameTrigrams.column == column)\
+            .filter(NameTrigrams.trigram.in_(trigrams))\
+            .group_by(NameTrigrams.name)\
+            .having(func.count(NameTrigrams.trigram) == len(trigrams))
+    else:
+        query = session.query(NameIndex.name).filter(NameIndex.column == column)
+    candidates = [item[0] for item in query.all()]
+    session.close()
+
+    regex = _get_pattern_regex(pattern)
+    names = [name for name in candidates if regex.match(name)]
+
+    return names
+
+
+def get_trigrams(name):
+    """Return the set of uppercase trigrams (i.e. three character
+    substrings) of the given ``name``.
+
+    Parameters
+    ----------
+    name : str
+        The name.
+
+    Returns
+    -------
+    trigrams : set
+        The trigrams of the name.  Names shorter than three characters
+        have no trigrams.
+    """
+
+    name = name.upper()
+    trigrams = set([name[i:i + 3] for i in range(len(name) - 2)])
+
+    return trigrams
+
+
+def rebuild_name_index(engine):
+    """Delete all rows from the ``name_index`` and ``name_trigrams``
+    tables and repopulate them from the ``observations`` table.
+
+    Parameters
+    ----------
+    engine : obj
+        The ``engine`` used to connect to the ``acsql`` database.
+    """
+
+    observations = Observations.__table__
+
+    with engine.begin() as connection:
+        connection.execute(NameTrigrams.__table__.delete())
+        connection.execute(NameIndex.__table__.delete())
+
+        for column in NAME_INDEX_COLUMNS:
+            results = connection.execute(
+                select([observations.c[column]]).distinct()
+                .where(observations.c[column].isnot(None))).fetchall()
+            for item in results:
+                _insert_name(connection, column, item[0])
+            logging.info('Indexed {} distinct {} values'.format(len(results),
+                                                                column))
+
+
+def update_name_index(data_dict, connection=None):
+    """Add any new values of the name columns in the given
+    ``data_dict`` to the ``name_index`` and ``name_trigrams`` tables.
+
+    Parameters
+    ----------
+    data_dict : dict
+        The column/value pairs of an ``observations`` table entry.
+    connection : obj, optional
+        If supplied, the names are added with the given ``sqlalchemy``
+        connection, as part of its current transaction.  By default,
+        they are added in a transaction of their own.
+    """
+
+    names = [(column, data_dict.get(column)) for column in NAME_INDEX_COLUMNS
+             if data_dict.get(column)]
+    if not names:
+        return
+
+    if connection is None:
+        session, base, engine = load_connection(SETTINGS['connection_string'])
+        with engine.begin() as connection:
+            update_name_index(data_dict, connection)
+        session.close()
+        engine.dispose()
+        return
+
+    for column, name in names:
+        exists = connection.execute(select([NameIndex.name])
+            .where(NameIndex.column == column)
+            .where(NameIndex.name == name)).first()
+        if exists is not None:
+            continue
+
+        # The name may have been added by another ingestion process, in
+        # which case the first insert fails and nothing is added
+        try:
+            _insert_name(connection, column, name)
+        except IntegrityError:
+            pass
@@ -0,0 +1,634 @@
+#! /usr/bin/env python
+
+"""Maintains and reads a columnar (Parquet) mirror of the header tables
+of the ``acsql`` database, for fast scans of whole columns across the
+archive (e.g. every ``goodmean`` of the ``flt_1`` tables).
+
+The mirror is kept in the directory given by the ``parquet_dir``
+setting.  Each header table is mirrored into a dataset named after its
+filetype and extension (e.g. the ``wfc_flt_1`` and ``hrc_flt_1`` tables
+are both mirrored into the ``flt_1`` dataset), which is partitioned by
+``detector`` and by observation ``year`` (from ``DATE-OBS``) as such:
+::
+
+    <parquet_dir>/flt_1/detector=WFC/year=2005/jabc01aaq_flt.parquet
+    <parquet_dir>/flt_1/detector=WFC/year=2005/compacted.parquet
+
+Every file of a dataset has the same schema, i.e. the union of the
+columns of the dataset's tables across detectors.  Observations whose
+year cannot be determined are placed in the ``year=0`` partition.
+
+During ingestion (see ``acsql.ingest.ingest``), each ingested file is
+written to its own small Parquet file in its partition, and the
+``compacted.parquet`` file is never modified, so that concurrent
+ingestion workers never write to the same file.  A re-ingested file
+may therefore be present both in its own Parquet file and in the
+``compacted.parquet`` file of its partition, in which case its own
+Parquet file takes precedence (both when reading and when compacting).
+``compact_parquet_mirror`` merges the Parquet files of each partition
+into a single ``compacted.parquet`` file, and ``rebuild_parquet_mirror``
+exports the header tables from scratch.  Compaction should not be run
+while ingestion is in progress.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported and used as such:
+    ::
+
+        from acsql.database.parquet_mirror import read_columns
+
+        table = read_columns('flt_1', ['rootname', 'goodmean'],
+                             detectors=['WFC'], years=[2005, 2006])
+        dataframe = table.to_pandas()
+
+    The mirror can be rebuilt and compacted from the command line with
+    the ``rebuild_parquet_mirror.py`` script.
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``astropy``
+    - ``pyarrow``
+    - ``sqlalchemy``
+"""
+
+import glob
+import logging
+import os
+import shutil
+
+from astropy.io import fits
+from sqlalchemy import Boolean
+from sqlalchemy import Date
+from sqlalchemy import Float
+from sqlalchemy import Integer
+from sqlalchemy import select
+
+from acsql.database import database_interface
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import Observations
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import TABLE_DEFS
+
+# The name of the merged Parquet file of each partition
+COMPACTED_FILENAME = 'compacted.parquet'
+
+# The detectors that have header tables
+DETECTORS = ['WFC', 'HRC', 'SBC']
+
+
+def _import_pyarrow():
+    """Return the ``pyarrow`` module, raising an ``ImportError`` with a
+    helpful message if it is not installed.
+
+    Returns
+    -------
+    pyarrow : module
+        The ``pyarrow`` module.
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('pyarrow is required for the Parquet mirror.')
+
+    return pyarrow
+
+
+def _get_arrow_type(column):
+    """Return the ``pyarrow`` type used to store the given column.
+
+    ``Date`` columns are stored as dates, while ``Time`` and
+    ``DateTime`` columns are stored as strings.
+
+    Parameters
+    ----------
+    column : obj
+        The ``sqlalchemy`` ``Column``.
+
+    Returns
+    -------
+    arrow_type : obj
+        The ``pyarrow`` data type.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    if isinstance(column.type, Boolean):
+        return pyarrow.bool_()
+    elif isinstance(column.type, Integer):
+        return pyarrow.int64()
+    elif isinstance(column.type, Float):
+        return pyarrow.float64()
+    elif isinstance(column.type, Date):
+        return pyarrow.date32()
+    else:
+        return pyarrow.string()
+
+
+def _get_dataset_dir(name):
+    """Return the directory of the given mirror dataset.
+
+    Parameters
+    ----------
+    name : str
+        The filetype and extension of the dataset (e.g. ``flt_1``).
+
+    Returns
+    -------
+    dataset_dir : str
+        The path to the dataset directory.
+    """
+
+    parquet_dir = SETTINGS.get('parquet_dir')
+    if not parquet_dir:
+        raise ValueError('The parquet_dir setting is not configured.')
+
+    return os.path.join(parquet_dir, name)
+
+
+def _get_fragment_filenames(paths):
+    """Return the values of the ``filename`` column of the given
+    (per-file) Parquet files.
+
+    Parameters
+    ----------
+    paths : list
+        The paths to the Parquet files.
+
+    Returns
+    -------
+    filenames : obj
+        The ``pyarrow`` ``Array`` of the filenames.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    filenames = set()
+    for path in paths:
+        table = pyarrow.parquet.read_table(path, columns=['filename'])
+        filenames.update(table.column('filename').to_pylist())
+
+    return pyarrow.array(sorted(filenames), type=pyarrow.string())
+
+
+def _get_partition_dir(name, detector, year):
+    """Return the directory of the given partition of the given mirror
+    dataset.
+
+    Parameters
+    ----------
+    name : str
+        The filetype and extension of the dataset (e.g. ``flt_1``).
+    detector : str
+        The detector (e.g. ``WFC``).
+    year : int
+        The observation year.
+
+    Returns
+    -------
+    partition_dir : str
+        The path to the partition directory.
+    """
+
+    return os.path.join(_get_dataset_dir(name),
+                        'detector={}'.format(detector.upper()),
+                        'year={}'.format(year))
+
+
+def _get_year(date_obs):
+    """Return the year of the given ``DATE-OBS`` value.
+
+    Parameters
+    ----------
+    date_obs : str or obj
+        The ``DATE-OBS`` value (e.g. ``2005-03-04``), or ``None``.
+
+    Returns
+    -------
+    year : int
+        The year, or 0 if it cannot be determined.
+    """
+
+    try:
+        return int(str(date_obs)[:4])
+    except ValueError:
+        return 0
+
+
+def _make_arrow_table(rows, schema):
+    """Return a ``pyarrow`` ``Table`` of the given ``rows`` with the
+    given ``schema``.
+
+    Parameters
+    ----------
+    rows : list
+        A list of dictionaries of column/value pairs.  Columns that
+        are not in the ``schema`` are ignored, and columns that are
+        missing are set to null.
+    schema : obj
+        The ``pyarrow`` ``Schema`` of the table.
+
+    Returns
+    -------
+    table : obj
+        The ``pyarrow`` ``Table``.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    converters = {pyarrow.bool_(): bool, pyarrow.int64(): int,
+                  pyarrow.float64(): float, pyarrow.string(): str,
+                  pyarrow.date32(): str}
+
+    arrays = []
+    for field in schema:
+        converter = converters[field.type]
+        values = []
+        for row in rows:
+            value = row.get(field.name)
+            try:
+                values.append(None if value is None else converter(value))
+            except ValueError:
+                values.append(None)
+
+        if field.type == pyarrow.date32():
+            array = pyarrow.array(values, type=pyarrow.string())\
+                .cast(pyarrow.date32())
+        else:
+            array = pyarrow.array(values, type=field.type)
+        arrays.append(array)
+
+    table = pyarrow.Table.from_arrays(arrays, schema=schema)
+
+    return table
+
+
+def _write_table(table, path):
+    """Write the given ``pyarrow`` ``Table`` to the given ``path``.
+    The file is written to a hidden temporary file first, so that
+    readers never see a partially written file.
+
+    Parameters
+    ----------
+    table : obj
+        The ``pyarrow`` ``Table``.
+    path : str
+        The path of the Parquet file.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = os.path.join(os.path.dirname(path), '.{}.{}.tmp'.format(
+        os.path.basename(path), os.getpid()))
+    pyarrow.parquet.write_table(table, temp_path)
+    os.replace(temp_path, path)
+
+
+def get_dataset_name(table):
+    """Return the name of the mirror dataset and the detector of the
+    given header ``table``.
+
+    Parameters
+    ----------
+    table : str
+        The name of the header table (e.g. ``WFC_flt_1``).
+
+    Returns
+    -------
+    name : str
+        The filetype and extension of the table (e.g. ``flt_1``).
+    detector : str
+        The detector of the table (e.g. ``WFC``).
+    """
+
+    detector, name = table.split('_', 1)
+
+    return name.lower(), detector.upper()
+
+
+def get_schema(name):
+    """Return the schema of the files of the given mirror dataset,
+    i.e. the union of the columns of the dataset's header tables.
+
+    If a column has a different type for different detectors, it is
+    stored as a string.
+
+    Parameters
+    ----------
+    name : str
+        The filetype and extension of the dataset (e.g. ``flt_1``).
+
+    Returns
+    -------
+    schema : obj
+        The ``pyarrow`` ``Schema``.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    tables = database_interface.base.metadata.tables
+    fields = {}
+    for detector in DETECTORS:
+        table = tables.get('{}_{}'.format(detector.lower(), name))
+        if table is None:
+            continue
+        for column in table.columns:
+            if column.name == 'detector':
+                continue  # Stored as a partition
+            arrow_type = _get_arrow_type(column)
+            if fields.setdefault(column.name, arrow_type) != arrow_type:
+                fields[column.name] = pyarrow.string()
+
+    schema = pyarrow.schema(list(fields.items()))
+
+    return schema
+
+
+def compact_parquet_mirror(names=None):
+    """Merge the Parquet files of each partition of the given mirror
+    datasets into a single ``compacted.parquet`` file.
+
+    Parameters
+    ----------
+    names : list, optional
+        The datasets (e.g. ``flt_1``) to compact.  By default, every
+        dataset is compacted.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    if names is None:
+        names = sorted(set([get_dataset_name(table)[0] for table in TABLE_DEFS]))
+
+    for name in names:
+        schema = get_schema(name)
+        partition_dirs = glob.glob(os.path.join(_get_dataset_dir(name),
+                                                'detector=*', 'year=*'))
+        for partition_dir in sorted(partition_dirs):
+            paths = sorted(glob.glob(os.path.join(partition_dir, '*.parquet')))
+            fragments = [path for path in paths
+                         if os.path.basename(path) != COMPACTED_FILENAME]
+            if not fragments:
+                continue
+
+            # Drop the entries of the compacted file that were since
+            # re-ingested into files of their own
+            tables = [pyarrow.parquet.read_table(path, schema=schema)
+                      for path in fragments]
+            compacted_path = os.path.join(partition_dir, COMPACTED_FILENAME)
+            if os.path.exists(compacted_path):
+                compacted = pyarrow.parquet.read_table(compacted_path,
+                                                       schema=schema)
+                mask = pyarrow.compute.invert(pyarrow.compute.is_in(
+                    compacted.column('filename'),
+                    value_set=_get_fragment_filenames(fragments)))
+                tables.insert(0, compacted.filter(mask))
+            _write_table(pyarrow.concat_tables(tables), compacted_path)
+            for path in fragments:
+                os.remove(path)
+
+            logging.info('Compacted {} files in {}'.format(len(paths),
+                                                          partition_dir))
+
+
+def read_columns(name, columns=None, detectors=None, years=None,
+                 where=None):
+    """Read the given columns of the given mirror dataset.
+
+    Only the partitions of the given ``detectors`` and ``years`` are
+    read.
+
+    Parameters
+    ----------
+    name : str
+        The filetype and extension of the dataset (e.g. ``flt_1``).  A
+        header table name (e.g. ``wfc_flt_1``) may also be given, in
+        which case only that table's detector is read.
+    columns : list, optional
+        The columns to read.  ``detector`` and ``year`` may also be
+        given.  By default, every column is read.
+    detectors : list, optional
+        The detectors (e.g. ``['WFC']``) to read.  By default, every
+        detector is read.
+    years : list, optional
+        The observation years (e.g. ``[2005]``) to read.  By default,
+        every year is read.
+    where : obj, optional
+        An additional ``pyarrow.dataset.Expression`` to filter the
+        rows with (e.g. ``pyarrow.dataset.field('goodmean') > 100``).
+
+    Returns
+    -------
+    table : obj
+        The ``pyarrow`` ``Table`` of the results.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    if name.split('_', 1)[0].upper() in DETECTORS:
+        name, detector = get_dataset_name(name)
+        detectors = [detector]
+
+    partitioning = pyarrow.dataset.partitioning(
+        pyarrow.schema([('detector', pyarrow.string()),
+                        ('year', pyarrow.int32())]), flavor='hive')
+    schema = get_schema(name)
+    schema = schema.append(pyarrow.field('detector', pyarrow.string()))
+    schema = schema.append(pyarrow.field('year', pyarrow.int32()))
+
+    dataset_dir = _get_dataset_dir(name)
+    if not os.path.isdir(dataset_dir):
+        return schema.empty_table().select(columns or schema.names)
+
+    paths = sorted(glob.glob(os.path.join(dataset_dir, 'detector=*',
+                                          'year=*', '*.parquet')))
+    compacted_paths = [path for path in paths
+                       if os.path.basename(path) == COMPACTED_FILENAME]
+    fragments = [path for path in paths
+                 if os.path.basename(path) != COMPACTED_FILENAME]
+
+    expressions = []
+    if detectors is not None:
+        expressions.append(pyarrow.dataset.field('detector')
+                           .isin([detector.upper() for detector in detectors]))
+    if years is not None:
+        expressions.append(pyarrow.dataset.field('year')
+                           .isin([int(year) for year in years]))
+    if where is not None:
+        expressions.append(where)
+
+    # Entries of the compacted files that were since re-ingested into
+    # files of their own are read from those files instead
+    compacted_expressions = list(expressions)
+    if fragments and compacted_paths:
+        compacted_expressions.append(~pyarrow.dataset.field('filename')
+            .isin(_get_fragment_filenames(fragments)))
+
+    tables = []
+    for dataset_paths, filters in [(compacted_paths, compacted_expressions),
+                                   (fragments, expressions)]:
+        if not dataset_paths:
+            continue
+
+        expression = None
+        for item in filters:
+            expression = item if expression is None else expression & item
+
+        dataset = pyarrow.dataset.dataset(dataset_paths, schema=schema,
+                                          format='parquet',
+                                          partitioning=partitioning,
+                                          partition_base_dir=dataset_dir)
+        tables.append(dataset.to_table(columns=columns, filter=expression))
+
+    if not tables:
+        return schema.empty_table().select(columns or schema.names)
+
+    table = pyarrow.concat_tables(tables)
+
+    return table
+
+
+def read_dataframe(name, columns=None, detectors=None, years=None,
+                   where=None):
+    """Read the given columns of the given mirror dataset into a
+    ``pandas`` ``DataFrame``.  See ``read_columns`` for a description
+    of the parameters.
+
+    Returns
+    -------
+    dataframe : obj
+        The ``pandas`` ``DataFrame`` of the results.
+    """
+
+    table = read_columns(name, columns=columns, detectors=detectors,
+                         years=years, where=where)
+
+    return table.to_pandas()
+
+
+def rebuild_parquet_mirror(names=None, chunk_size=10000):
+    """Delete the given mirror datasets and export them from the header
+    tables, writing one ``compacted.parquet`` file per partition.
+
+    The observation year of each row is determined from the
+    ``date_obs`` column of the ``observations`` table.
+
+    Parameters
+    ----------
+    names : list, optional
+        The datasets (e.g. ``flt_1``) to rebuild.  By default, every
+        dataset is rebuilt.
+    chunk_size : int, optional
+        The number of rows to fetch from the database at a time.
+    """
+
+    pyarrow = _import_pyarrow()
+
+    if names is None:
+        names = sorted(set([get_dataset_name(table)[0] for table in TABLE_DEFS]))
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    tables = database_interface.base.metadata.tables
+    observations = Observations.__table__
+
+    for name in names:
+        schema = get_schema(name)
+        dataset_dir = _get_dataset_dir(name)
+        if os.path.isdir(dataset_dir):
+            shutil.rmtree(dataset_dir)
+
+        for detector in DETECTORS:
+            table = tables.get('{}_{}'.format(detector.lower(), name))
+            if table is None:
+                continue
+
+            query = select([table, observations.c.date_obs.label('mirror_date_obs')])\
+                .select_from(table.outerjoin(
+                    observations, table.c.rootname == observations.c.rootname))
+            result_proxy = engine.execute(query)
+
+            # Write each partition incrementally, one chunk at a time
+            writers = {}
+            num_rows = 0
+            while True:
+                results = result_proxy.fetchmany(chunk_size)
+                if not results:
+                    break
+                partitions = {}
+                for result in results:
+                    row = dict(result)
+                    year = _get_year(row.pop('mirror_date_obs'))
+                    partitions.setdefault(year, []).append(row)
+
+                for year, rows in partitions.items():
+                    if year not in writers:
+                        partition_dir = _get_partition_dir(name, detector, year)
+                        os.makedirs(partition_dir, exist_ok=True)
+                        writers[year] = pyarrow.parquet.ParquetWriter(
+                            os.path.join(partition_dir, COMPACTED_FILENAME),
+                            schema)
+                    writers[year].write_table(_make_arrow_table(rows, schema))
+                num_rows += len(results)
+
+            for writer in writers.values():
+                writer.close()
+
+            logging.info('Exported {} rows of {}_{}'.format(
+                num_rows, detector.lower(), name))
+
+    session.close()
+    engine.dispose()
+
+
+def update_parquet_mirror(file_dict, table, data_dict):
+    """Write the given header table entry to the mirror, as a Parquet
+    file of its own that supersedes any existing entry for the same
+    file in the ``compacted.parquet`` file of its partition.
+
+    Nothing is done if the ``parquet_dir`` setting is not configured.
+
+    Parameters
+    ----------
+    file_dict : dict
+        A dictionary containing various data useful for the ingestion
+        process.
+    table : str
+        The name of the header table (e.g. ``WFC_flt_1``).
+    data_dict : dict
+        The column/value pairs of the header table entry.
+    """
+
+    if not SETTINGS.get('parquet_dir'):
+        return
+
+    _import_pyarrow()
+
+    # Determine the observation year, which is only in the primary header
+    if 'year' not in file_dict:
+        date_obs = data_dict.get('date_obs')
+        if date_obs is None:
+            try:
+                date_obs = fits.getval(file_dict['filename'], 'DATE-OBS', 0)
+            except (KeyError, OSError):
+                date_obs = None
+        file_dict['year'] = _get_year(date_obs)
+
+    name, detector = get_dataset_name(table)
+    schema = get_schema(name)
+    partition_dir = _get_partition_dir(name, detector, file_dict['year'])
+    filename = data_dict['filename']
+
+    path = os.path.join(partition_dir,
+                        '{}.parquet'.format(filename.split('.fits')[0]))
+    _write_table(_make_arrow_table([data_dict], schema), path)
@@ -14,6 +14,8 @@ The available queries are:
     7. ``rootnames_with_postflash()``
     8. ``non_asn_rootnames()``
     9. ``filenames_in_date_rage()``
+    10. ``cone_search(ra, dec, radius)``
+    11. ``files_for_reference_file(reference_file)``
 
 See each function's docstrings for further details.
 
@@ -44,6 +46,12 @@ Use
 
         results = query.all()
 
+    Queries of detector-specific tables accept a ``detector`` argument
+    (``WFC`` by default, or ``None`` for all detectors).  To build a
+    query without performing it or printing its results (e.g. to stream
+    the results or to return them as a ``pandas`` ``DataFrame``), see
+    the ``query_builders`` module.
+
 Dependencies
 ------------
     External library dependencies include:
@@ -52,17 +60,11 @@ Dependencies
     - ``sqlalchemy``
 """
 
-from sqlalchemy import and_
-from sqlalchemy import exists
-from sqlalchemy import func
-
+from acsql.database import query_builders
 from acsql.database.database_interface import session
-from acsql.database.database_interface import Master
-from acsql.database.database_interface import Datasets
-from acsql.database.database_interface import WFC_asn_0
-from acsql.database.database_interface import WFC_raw_0
-from acsql.database.database_interface import WFC_flt_1
-from acsql.database.database_interface import WFC_flt_4
+from acsql.database.database_interface import Observations
+from acsql.database.sky_index import angular_separation
+from acsql.database.sky_index import get_cone_clause
 
 
 def all_filenames(dataset):
@@ -81,8 +83,7 @@ def all_filenames(dataset):
         performing the query.
     """
 
-    query = session.query(Datasets)\
-        .filter(Datasets.rootname.like('{}%'.format(dataset)))
+    query = query_builders.all_filenames(dataset)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -95,7 +96,7 @@ def all_filenames(dataset):
     return query
 
 
-def filters_for_rootname(rootname):
+def filters_for_rootname(rootname, detector='WFC'):
     """Queries for the FILTER1/FILTER2 combination for the geven
     observation.
 
@@ -103,6 +104,8 @@ def filters_for_rootname(rootname):
     ----------
     rootname : str
         The rootname to query by.
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
 
     Returns
     -------
@@ -111,8 +114,7 @@ def filters_for_rootname(rootname):
         performing the query.
     """
 
-    query = session.query(WFC_raw_0.filter1, WFC_raw_0.filter2)\
-        .filter(WFC_raw_0.rootname == rootname)
+    query = query_builders.filters_for_rootname(rootname, detector)
     query_results = query.one()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -121,14 +123,19 @@ def filters_for_rootname(rootname):
     return query
 
 
-def filter_distribution():
-    """Queries for the FILTER1/FILTER2 combination for the given
-    observation.
+def filter_distribution(detector='WFC'):
+    """Queries for the distribution of FILTER1/FILTER2 combinations of
+    observations of the given detector.
+
+    The distribution is read from the ``aggregate_counts`` table (see
+    ``acsql.database.aggregates``), which is kept up to date during
+    ingestion, rather than computed from the ``<detector>_raw_0``
+    table.
 
     Parameters
     ----------
-    rootname : str
-        The rootname to query by.
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
 
     Returns
     -------
@@ -137,28 +144,28 @@ def filter_distribution():
         performing the query.
     """
 
-    query = session.query(WFC_raw_0.filter1, WFC_raw_0.filter2,
-        func.count(WFC_raw_0.filter1))\
-            .group_by(WFC_raw_0.filter1, WFC_raw_0.filter2)
+    query = query_builders.filter_distribution(detector)
     query_results = query.all()
-    db_count = session.query(WFC_raw_0).count()
+    db_count = sum([result[1] for result in query_results])
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
 
     for result in query_results:
-        perc_used = round((result[2] / db_count) * 100., 2)
-        print('\t{}/{}: {}%'.format(result[0], result[1], perc_used))
+        perc_used = round((result[1] / db_count) * 100., 2)
+        print('\t{}: {}%'.format(result[0], perc_used))
 
     return query
 
 
-def rootnames_for_target(targname):
+def rootnames_for_target(targname, detector='WFC'):
     """Queries for the rootname and filename for a given target.
 
     Parameters
     ----------
     targname : str
         The target name (e.g. 'NGC104')
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
 
     Returns
     -------
@@ -167,9 +174,7 @@ def rootnames_for_target(targname):
         performing the query.
     """
 
-    query = session.query(WFC_raw_0.rootname, WFC_raw_0.filename,
-        WFC_raw_0.targname)\
-            .filter(WFC_raw_0.targname == targname)
+    query = query_builders.rootnames_for_target(targname, detector)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -185,7 +190,9 @@ def filenames_for_calibration(calibration_keyword, value):
 
     The 'calibration' mode is defined by the type of calibration and
     the calibration reference file used
-    (e.g. 'BIASFILE = jref$06u15056j_bia.fits')
+    (e.g. 'BIASFILE = jref$06u15056j_bia.fits').  Files of every
+    detector and filetype are searched, using the ``reference_files``
+    table.
 
     Parameters
     ----------
@@ -201,9 +208,8 @@ def filenames_for_calibration(calibration_keyword, value):
         performing the query.
     """
 
-    calibration_keyword_obj = getattr(WFC_raw_0, calibration_keyword)
-    query = session.query(WFC_raw_0.filename)\
-        .filter(calibration_keyword_obj == value)
+    query = query_builders.filenames_for_calibration(calibration_keyword,
+                                                     value)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -214,7 +220,36 @@ def filenames_for_calibration(calibration_keyword, value):
     return query
 
 
-def goodmean_for_dataset(dataset):
+def files_for_reference_file(reference_file):
+    """Queries for every file (of any detector and filetype) whose
+    headers record the given calibration reference file, e.g. to
+    determine the exposures affected by a bad reference file.
+
+    Parameters
+    ----------
+    reference_file : str
+        The reference file, with or without its path prefix (e.g.
+        jref$06u15056j_bia.fits or 06u15056j_bia.fits)
+
+    Returns
+    -------
+    query : obj
+        The query object that contains attributes and methods for
+        performing the query.
+    """
+
+    query = query_builders.files_for_reference_file(reference_file)
+    query_results = query.all()
+
+    print('\nQuery performed:\n\n{}\n'.format(str(query)))
+
+    for result in query_results:
+        print(result)
+
+    return query
+
+
+def goodmean_for_dataset(dataset, detector='WFC'):
     """Queries for the GOODMEAN values for a given dataset
 
     The GOODMEAN describes the mean of all 'good' (i.e. non-flagged)
@@ -225,6 +260,8 @@ def goodmean_for_dataset(dataset):
     dataset : str
         Any portion of (or entire) rootname (e.g. 'jd2615qi', or
         'jd2615').
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
 
     Returns
     -------
@@ -233,11 +270,7 @@ def goodmean_for_dataset(dataset):
         performing the query.
     """
 
-    query = session.query(Master.rootname, WFC_flt_1.goodmean,
-        WFC_flt_4.goodmean)\
-            .join(WFC_flt_1)\
-            .join(WFC_flt_4)\
-            .filter(Master.rootname.like('{}%'.format(dataset)))
+    query = query_builders.goodmean_for_dataset(dataset, detector)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -248,10 +281,15 @@ def goodmean_for_dataset(dataset):
     return query
 
 
-def rootnames_with_postflash():
+def rootnames_with_postflash(detector='WFC'):
     """Queries for rootnames and FLASHDURs for non-DARK observations
     that have a FLASHDUR > 0.
 
+    Parameters
+    ----------
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
+
     Returns
     -------
     query : obj
@@ -259,11 +297,7 @@ def rootnames_with_postflash():
         performing the query.
     """
 
-    query = session.query(Master.rootname, WFC_raw_0.flashdur)\
-        .join(WFC_raw_0)\
-        .filter(WFC_raw_0.flashdur > 0)\
-        .filter(WFC_raw_0.targname != 'DARK')
-
+    query = query_builders.rootnames_with_postflash(detector)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -274,9 +308,14 @@ def rootnames_with_postflash():
     return query
 
 
-def non_asn_rootnames():
+def non_asn_rootnames(detector='WFC'):
     """Queries for rootnames that are not part of an association.
 
+    Parameters
+    ----------
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
+
     Returns
     -------
     query : obj
@@ -284,8 +323,7 @@ def non_asn_rootnames():
         performing the query.
     """
 
-    query = session.query(Master.rootname)\
-        .filter(~exists().where(and_(Master.rootname == WFC_asn_0.rootname)))
+    query = query_builders.non_asn_rootnames(detector)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -296,7 +334,7 @@ def non_asn_rootnames():
     return query
 
 
-def filenames_in_date_range(begin_date, end_date):
+def filenames_in_date_range(begin_date, end_date, detector='WFC'):
     """Queries for filenames for observations that occur between the
     ``begin_date`` and ``end_date``.
 
@@ -306,6 +344,8 @@ def filenames_in_date_range(begin_date, end_date):
         The start of the date range (in the format YYYY-MM-DD).
     end_date : str
         The end of the date range (in the format YYYY-MM-DD).
+    detector : str or None
+        The detector (e.g. 'WFC'), or None for all detectors.
 
     Returns
     -------
@@ -314,9 +354,8 @@ def filenames_in_date_range(begin_date, end_date):
         performing the query.
     """
 
-    query = session.query(WFC_raw_0.filename)\
-        .filter(WFC_raw_0.date_obs >= begin_date)\
-        .filter(WFC_raw_0.date_obs <= end_date)
+    query = query_builders.filenames_in_date_range(begin_date, end_date,
+                                                   detector)
     query_results = query.all()
 
     print('\nQuery performed:\n\n{}\n'.format(str(query)))
@@ -325,3 +364,74 @@ def filenames_in_date_range(begin_date, end_date):
         print(result[0])
 
     return query
+
+
+def rootnames_in_cone(ra, dec, radius):
+    """Return the rootnames of observations whose target coordinates
+    are within ``radius`` degrees of the given position.
+
+    Candidate observations are retrieved using the ``sky_pixel`` index
+    of the ``observations`` table (see ``acsql.database.sky_index``),
+    and are then refined by their exact angular distance.  Nothing is
+    printed.
+
+    Parameters
+    ----------
+    ra : float
+        The right ascension (in degrees) of the center of the cone.
+    dec : float
+        The declination (in degrees) of the center of the cone.
+    radius : float
+        The radius (in degrees) of the cone.
+
+    Returns
+    -------
+    rootnames : list
+        The rootnames within the cone.
+    """
+
+    clause = get_cone_clause(Observations.sky_pixel, Observations.dec_targ,
+                             ra, dec, radius)
+    candidates = session.query(Observations.rootname, Observations.ra_targ,
+                               Observations.dec_targ).filter(clause).all()
+
+    rootnames = [rootname for rootname, ra_targ, dec_targ in candidates
+                 if ra_targ is not None and dec_targ is not None
+                 and angular_separation(ra, dec, ra_targ, dec_targ) <= radius]
+
+    return rootnames
+
+
+def cone_search(ra, dec, radius):
+    """Queries for the rootnames, filenames, target names and target
+    coordinates of observations within ``radius`` degrees of the given
+    position.
+
+    Parameters
+    ----------
+    ra : float
+        The right ascension (in degrees) of the center of the cone.
+    dec : float
+        The declination (in degrees) of the center of the cone.
+    radius : float
+        The radius (in degrees) of the cone.
+
+    Returns
+    -------
+    query : obj
+        The query object that contains attributes and methods for
+        performing the query.
+    """
+
+    rootnames = rootnames_in_cone(ra, dec, radius)
+    query = session.query(Observations.rootname, Observations.filename,
+        Observations.targname, Observations.ra_targ, Observations.dec_targ)\
+            .filter(Observations.rootname.in_(rootnames))
+    query_results = query.all()
+
+    print('\nQuery performed:\n\n{}\n'.format(str(query)))
+
+    for result in query_results:
+        print(result)
+
+    return query
@@ -0,0 +1,622 @@
+"""Contains non-printing builders for the queries of the ``queries``
+module, along with functions to stream their results in chunks or to
+return them as ``pandas`` or ``pyarrow`` tables.
+
+Unlike the ``queries`` module functions, the builders do not perform
+the query; they only return the ``sqlalchemy.query`` object.  Each
+builder that queries a detector-specific table accepts a ``detector``
+argument (``WFC``, ``HRC``, or ``SBC``).  If ``detector`` is ``None``,
+the queries of all three detectors are combined with ``UNION ALL``.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported as such:
+    ::
+
+        from acsql.database import query_builders
+
+    The results of a query can then be streamed in chunks, e.g.:
+    ::
+
+        query = query_builders.non_asn_rootnames(detector=None)
+        for result in query_builders.stream_results(query):
+            ...
+
+    or returned as a ``pandas`` ``DataFrame`` or ``pyarrow`` ``Table``:
+    ::
+
+        dataframe = query_builders.to_dataframe(query)
+        table = query_builders.to_arrow(query)
+
+    Any header table can be queried across detectors with
+    ``detector_union``, in which the filters are applied to each
+    detector's table before the results are combined, e.g.:
+    ::
+
+        query = query_builders.detector_union('flt_1',
+            ['rootname', 'goodmean'], where=lambda t: t.goodmean > 100)
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``sqlalchemy``
+    - ``pandas`` (optional)
+    - ``pyarrow`` (optional)
+"""
+
+from sqlalchemy import exists
+from sqlalchemy import literal
+from sqlalchemy import null
+
+from acsql.database import database_interface
+from acsql.database.database_interface import session
+from acsql.database.database_interface import AggregateCounts
+from acsql.database.database_interface import Datasets
+from acsql.database.database_interface import Master
+from acsql.database.database_interface import ReferenceFiles
+
+DETECTORS = ['WFC', 'HRC', 'SBC']
+
+
+def _build_for_detectors(builder, detector):
+    """Return the query built by ``builder`` for the given
+    ``detector``, or the ``UNION ALL`` of the queries for all
+    detectors if ``detector`` is ``None``.
+
+    Parameters
+    ----------
+    builder : function
+        A function that takes a detector and returns a query.
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    if detector:
+        return builder(detector.upper())
+
+    queries = [builder(item) for item in DETECTORS]
+
+    return queries[0].union_all(*queries[1:])
+
+
+def _get_column_names(query, result_proxy):
+    """Return the names of the columns of the results of the given
+    ``query``.
+
+    The columns are named as in the query (e.g. ``rootname`` rather
+    than the ``master_rootname`` label of a ``UNION ALL`` query),
+    unless it queries entire tables, in which case they are named as in
+    the executed statement, with one column per table column.
+
+    Parameters
+    ----------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    result_proxy : obj
+        The ``sqlalchemy`` ``ResultProxy`` of the executed query.
+
+    Returns
+    -------
+    columns : list
+        The names of the columns.
+    """
+
+    columns = list(result_proxy.keys())
+    if len(query.column_descriptions) == len(columns):
+        columns = [item['name'] for item in query.column_descriptions]
+
+    return columns
+
+
+def _get_table(detector, table):
+    """Return the ORM of the given header ``table`` for the given
+    ``detector``.
+
+    Parameters
+    ----------
+    detector : str
+        The detector (e.g. ``WFC``).
+    table : str
+        The filetype and extension of the table (e.g. ``raw_0``).
+
+    Returns
+    -------
+    table_obj : obj
+        The ORM of the table (e.g. ``WFC_raw_0``).
+    """
+
+    return getattr(database_interface, '{}_{}'.format(detector, table))
+
+
+def all_filenames(dataset):
+    """Build the query for all filenames that exist for the given
+    dataset.
+
+    Parameters
+    ----------
+    dataset : str
+        Any portion of (or entire) rootname (e.g. 'jd2615qi', or
+        'jd2615').
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    query = session.query(Datasets)\
+        .filter(Datasets.rootname.like('{}%'.format(dataset)))
+
+    return query
+
+
+def filters_for_rootname(rootname, detector='WFC'):
+    """Build the query for the FILTER1/FILTER2 combination for the
+    given observation.
+
+    Parameters
+    ----------
+    rootname : str
+        The rootname to query by.
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    def builder(detector):
+        raw_0 = _get_table(detector, 'raw_0')
+        return session.query(raw_0.filter1, raw_0.filter2)\
+            .filter(raw_0.rootname == rootname)
+
+    return _build_for_detectors(builder, detector)
+
+
+def filter_distribution(detector='WFC'):
+    """Build the query for the distribution of FILTER1/FILTER2
+    combinations, as ``(<detector>/<filter1>/<filter2>, count)`` rows
+    read from the ``aggregate_counts`` table.
+
+    Parameters
+    ----------
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    query = session.query(AggregateCounts.name, AggregateCounts.total)\
+        .filter(AggregateCounts.category == 'detector_filter')\
+        .filter(AggregateCounts.total > 0)\
+        .order_by(AggregateCounts.total.desc())
+    if detector:
+        query = query.filter(AggregateCounts.name.like('{}/%'.format(
+            detector.upper())))
+
+    return query
+
+
+def rootnames_for_target(targname, detector='WFC'):
+    """Build the query for the rootname and filename for a given
+    target.
+
+    Parameters
+    ----------
+    targname : str
+        The target name (e.g. 'NGC104')
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    def builder(detector):
+        raw_0 = _get_table(detector, 'raw_0')
+        return session.query(raw_0.rootname, raw_0.filename, raw_0.targname)\
+            .filter(raw_0.targname == targname)
+
+    return _build_for_detectors(builder, detector)
+
+
+def filenames_for_calibration(calibration_keyword, value):
+    """Build the query for the filenames (of any detector and
+    filetype) that used a given calibration mode.
+
+    Parameters
+    ----------
+    calibration_keyword : str
+        The calibration file to query on (e.g. DARKFILE, BIASFILE)
+    value : str
+        The calibration file value (e.g. jref$06u15056j_bia.fits)
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    reference_file = value.split('$')[-1].strip()
+    query = session.query(ReferenceFiles.filename).distinct()\
+        .filter(ReferenceFiles.reference_file == reference_file)\
+        .filter(ReferenceFiles.keyword == calibration_keyword.lower())
+
+    return query
+
+
+def files_for_reference_file(reference_file):
+    """Build the query for every file (of any detector and filetype)
+    whose headers record the given calibration reference file.
+
+    Parameters
+    ----------
+    reference_file : str
+        The reference file, with or without its path prefix (e.g.
+        jref$06u15056j_bia.fits or 06u15056j_bia.fits)
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    reference_file = reference_file.split('$')[-1].strip()
+    query = session.query(ReferenceFiles.keyword, ReferenceFiles.rootname,
+        ReferenceFiles.filename, ReferenceFiles.table_name)\
+            .filter(ReferenceFiles.reference_file == reference_file)
+
+    return query
+
+
+def goodmean_for_dataset(dataset, detector='WFC'):
+    """Build the query for the GOODMEAN values for a given dataset.
+
+    WFC observations have a GOODMEAN for each of its two chips (i.e.
+    the ``SCI`` extensions 1 and 4).  HRC and SBC observations only
+    have a single chip, so their second GOODMEAN is ``None``.
+
+    Parameters
+    ----------
+    dataset : str
+        Any portion of (or entire) rootname (e.g. 'jd2615qi', or
+        'jd2615').
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    def builder(detector):
+        flt_1 = _get_table(detector, 'flt_1')
+        if detector == 'WFC':
+            flt_4 = _get_table(detector, 'flt_4')
+            query = session.query(Master.rootname,
+                flt_1.goodmean.label('goodmean_1'),
+                flt_4.goodmean.label('goodmean_4'))\
+                    .join(flt_1)\
+                    .join(flt_4)
+        else:
+            query = session.query(Master.rootname,
+                flt_1.goodmean.label('goodmean_1'),
+                null().label('goodmean_4'))\
+                    .join(flt_1)
+        return query.filter(Master.rootname.like('{}%'.format(dataset)))
+
+    return _build_for_detectors(builder, detector)
+
+
+def rootnames_with_postflash(detector='WFC'):
+    """Build the query for rootnames and FLASHDURs for non-DARK
+    observations that have a FLASHDUR > 0.
+
+    Parameters
+    ----------
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    def builder(detector):
+        raw_0 = _get_table(detector, 'raw_0')
+        return session.query(Master.rootname, raw_0.flashdur)\
+            .join(raw_0)\
+            .filter(raw_0.flashdur > 0)\
+            .filter(raw_0.targname != 'DARK')
+
+    return _build_for_detectors(builder, detector)
+
+
+def non_asn_rootnames(detector='WFC'):
+    """Build the query for rootnames of the given ``detector`` that
+    are not part of an association.
+
+    Parameters
+    ----------
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    def builder(detector):
+        asn_0 = _get_table(detector, 'asn_0')
+        return session.query(Master.rootname)\
+            .filter(Master.detector == detector)\
+            .filter(~exists().where(Master.rootname == asn_0.rootname))
+
+    return _build_for_detectors(builder, detector)
+
+
+def filenames_in_date_range(begin_date, end_date, detector='WFC'):
+    """Build the query for filenames for observations that occur
+    between the ``begin_date`` and ``end_date``.
+
+    Parameters
+    ----------
+    begin_date : str
+        The start of the date range (in the format YYYY-MM-DD).
+    end_date : str
+        The end of the date range (in the format YYYY-MM-DD).
+    detector : str or None
+        The detector (e.g. ``WFC``), or ``None`` for all detectors.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    def builder(detector):
+        raw_0 = _get_table(detector, 'raw_0')
+        return session.query(raw_0.filename)\
+            .filter(raw_0.date_obs >= begin_date)\
+            .filter(raw_0.date_obs <= end_date)
+
+    return _build_for_detectors(builder, detector)
+
+
+def get_common_columns(table, detectors=None):
+    """Return the names of the columns that the given header ``table``
+    has for every detector.
+
+    Parameters
+    ----------
+    table : str
+        The filetype and extension of the table (e.g. ``raw_0``).
+    detectors : list, optional
+        The detectors to consider.  By default, every detector that
+        has the table is considered.
+
+    Returns
+    -------
+    common_columns : list
+        The column names, in the column order of the table of the
+        first detector.
+    """
+
+    tables = database_interface.base.metadata.tables
+    table_objs = [tables[name] for name in
+                  ['{}_{}'.format(detector.lower(), table)
+                   for detector in (detectors or DETECTORS)]
+                  if name in tables]
+    if not table_objs:
+        return []
+
+    common_names = set.intersection(*[set(table_obj.columns.keys())
+                                      for table_obj in table_objs])
+    common_columns = [name for name in table_objs[0].columns.keys()
+                      if name in common_names]
+
+    return common_columns
+
+
+def detector_union(table, columns=None, where=None, filter_by=None,
+                   detectors=None):
+    """Build a query of the given header ``table`` (e.g. ``raw_0``)
+    across detectors, as the ``UNION ALL`` of one query per detector.
+
+    The filters are applied within each detector's query (rather than
+    to the union as a whole), so that each of them can use the indexes
+    of its own table.  The first column of the results is the
+    ``detector`` of each row.
+
+    Parameters
+    ----------
+    table : str
+        The filetype and extension of the table (e.g. ``raw_0``).
+    columns : list, optional
+        The names of the columns to query.  By default, all of the
+        columns common to the detectors' tables are queried.
+    where : function, optional
+        A function that takes the ORM of a detector's table (e.g.
+        ``WFC_raw_0``) and returns a filter clause (or a list of them)
+        to apply to it, e.g. ``lambda t: t.exptime > 100``.
+    filter_by : dict, optional
+        Column/value pairs that the results must be equal to.
+    detectors : list, optional
+        The detectors to query.  By default, every detector that has
+        the table is queried.
+
+    Returns
+    -------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    """
+
+    tables = database_interface.base.metadata.tables
+    detectors = [detector.upper() for detector in (detectors or DETECTORS)
+                 if '{}_{}'.format(detector.lower(), table) in tables]
+    if columns is None:
+        columns = [column for column in get_common_columns(table, detectors)
+                   if column != 'detector']
+
+    queries = []
+    for detector in detectors:
+        table_obj = _get_table(detector, table)
+        query = session.query(literal(detector).label('detector'),
+            *[getattr(table_obj, column).label(column) for column in columns])
+
+        for column, value in (filter_by or {}).items():
+            query = query.filter(getattr(table_obj, column) == value)
+        if where is not None:
+            clauses = where(table_obj)
+            if not isinstance(clauses, (list, tuple)):
+                clauses = [clauses]
+            query = query.filter(*clauses)
+
+        queries.append(query)
+
+    return queries[0].union_all(*queries[1:])
+
+
+def stream_results(query, chunk_size=1000):
+    """Yield the results of the given ``query``, fetching them from
+    the database ``chunk_size`` rows at a time rather than all at once.
+
+    Parameters
+    ----------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    chunk_size : int, optional
+        The number of rows to fetch at a time.
+
+    Yields
+    ------
+    result : obj
+        Each result of the query.
+    """
+
+    for result in query.yield_per(chunk_size):
+        yield result
+
+
+def to_arrow(query, chunk_size=10000):
+    """Perform the given ``query`` and return its results as a
+    ``pyarrow`` ``Table``, built from the results in chunks of
+    ``chunk_size`` rows.
+
+    Parameters
+    ----------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    chunk_size : int, optional
+        The number of rows to fetch at a time.
+
+    Returns
+    -------
+    table : obj
+        The ``pyarrow.Table`` of the results, with one column per
+        column of the query.
+    """
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is required to return pyarrow tables.')
+
+    # Use a server-side cursor, so that only one chunk of rows is held
+    # by the database driver at a time
+    result_proxy = session.execute(
+        query.statement.execution_options(stream_results=True))
+    columns = _get_column_names(query, result_proxy)
+
+    chunks = [[] for column in columns]
+    while True:
+        rows = result_proxy.fetchmany(chunk_size)
+        if not rows:
+            break
+        for i, chunk in enumerate(chunks):
+            chunk.append(pyarrow.array([row[i] for row in rows]))
+    session.close()
+
+    # Chunks of only NULL values have the null type, so cast them to
+    # the type of the rest of the column
+    arrays = []
+    for chunk in chunks:
+        types = [array.type for array in chunk if array.type != pyarrow.null()]
+        column_type = types[0] if types else pyarrow.null()
+        arrays.append(pyarrow.chunked_array(
+            [array.cast(column_type) for array in chunk], type=column_type))
+
+    table = pyarrow.Table.from_arrays(arrays, names=columns)
+
+    return table
+
+
+def to_dataframe(query, chunk_size=None):
+    """Perform the given ``query`` and return its results as a
+    ``pandas`` ``DataFrame``, built from the rows of a server-side
+    database cursor (as in ``to_arrow``).
+
+    Parameters
+    ----------
+    query : obj
+        The ``sqlalchemy.query`` object.
+    chunk_size : int, optional
+        If supplied, an iterator of ``DataFrame`` objects of (at most)
+        ``chunk_size`` rows is returned instead.
+
+    Returns
+    -------
+    dataframe : obj
+        The ``pandas.DataFrame`` of the results (or an iterator of
+        them), with one column per column of the query.
+    """
+
+    try:
+        import pandas
+    except ImportError:
+        raise ImportError('pandas is required to return DataFrames.')
+
+    result_proxy = session.execute(
+        query.statement.execution_options(stream_results=True))
+    columns = _get_column_names(query, result_proxy)
+
+    def make_dataframe(rows):
+        return pandas.DataFrame.from_records([tuple(row) for row in rows],
+                                             columns=columns)
+
+    def iterate_chunks():
+        while True:
+            rows = result_proxy.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield make_dataframe(rows)
+        session.close()
+
+    if chunk_size:
+        return iterate_chunks()
+
+    dataframe = make_dataframe(result_proxy.fetchall())
+    session.close()
+
+    return dataframe
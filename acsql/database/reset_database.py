@@ -2,6 +2,10 @@
 
 """Reset all tables in the ``acsql`` database.
 
+Tables are created along with their indexes, including those defined
+in ``index_definitions.yaml``.  To add indexes to an existing database
+without resetting it, see ``manage_indexes.py``.
+
 Authors
 -------
     Matthew Bourque, 2017
@@ -0,0 +1,261 @@
+"""Provides a sky pixelization used to index observations by their
+target coordinates, which allows for fast cone searches.
+
+The sky is divided into declination zones of height ``ZONE_HEIGHT``
+degrees.  Each zone is divided into right ascension cells whose width
+(in degrees on the sky) is roughly equal to the zone height, so that
+pixels are approximately square and of equal area.  The pixel of a
+given position is ``zone * ZONE_SIZE + cell``.
+
+A cone search first determines the (small) set of pixels that overlap
+the search cone (``get_cone_pixels``), so that only observations in
+those pixels need to be retrieved from the database using the index on
+the ``sky_pixel`` column.  The candidates are then refined by their
+exact angular distance from the center of the cone, either in Python
+(``angular_separation``) or in the database (``get_cone_clause`` with
+an ``ra_column``).
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported and used by the ``ingest``
+    and ``queries`` modules, as well as the web application, as such:
+    ::
+
+        from acsql.database.sky_index import get_cone_clause
+        from acsql.database.sky_index import get_cone_pixels
+        from acsql.database.sky_index import get_sky_pixel
+
+        pixel = get_sky_pixel(ra, dec)
+        pixels = get_cone_pixels(ra, dec, radius)
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``sqlalchemy``
+"""
+
+import math
+
+from sqlalchemy import and_
+from sqlalchemy import func
+
+# The height (in degrees) of each declination zone
+ZONE_HEIGHT = 0.1
+
+# The number of pixel IDs reserved for each zone
+ZONE_SIZE = 10000
+
+# The number of declination zones
+NUM_ZONES = int(round(180. / ZONE_HEIGHT))
+
+# Cones that would overlap more than this many pixels fall back to
+# filtering on declination only
+MAX_CONE_PIXELS = 20000
+
+
+def _get_zone(dec):
+    """Return the declination zone of the given ``dec``.
+
+    Parameters
+    ----------
+    dec : float
+        The declination (in degrees).
+
+    Returns
+    -------
+    zone : int
+        The declination zone.
+    """
+
+    zone = int(math.floor((dec + 90.) / ZONE_HEIGHT))
+
+    return min(max(zone, 0), NUM_ZONES - 1)
+
+
+def _get_num_cells(zone):
+    """Return the number of right ascension cells in the given
+    ``zone``.
+
+    Parameters
+    ----------
+    zone : int
+        The declination zone.
+
+    Returns
+    -------
+    num_cells : int
+        The number of right ascension cells.
+    """
+
+    # Use the edge of the zone that is closest to the equator
+    dec_low = -90. + zone * ZONE_HEIGHT
+    dec_high = dec_low + ZONE_HEIGHT
+    min_abs_dec = 0. if dec_low <= 0. <= dec_high else min(abs(dec_low), abs(dec_high))
+    num_cells = int(360. * math.cos(math.radians(min_abs_dec)) / ZONE_HEIGHT)
+
+    return max(num_cells, 1)
+
+
+def angular_separation(ra1, dec1, ra2, dec2):
+    """Return the angular separation (in degrees) between two
+    positions, using the haversine formula.
+
+    Parameters
+    ----------
+    ra1, dec1 : float
+        The coordinates (in degrees) of the first position.
+    ra2, dec2 : float
+        The coordinates (in degrees) of the second position.
+
+    Returns
+    -------
+    separation : float
+        The angular separation (in degrees).
+    """
+
+    ra1, dec1, ra2, dec2 = map(math.radians, [ra1, dec1, ra2, dec2])
+    sin_ddec = math.sin((dec2 - dec1) / 2.)
+    sin_dra = math.sin((ra2 - ra1) / 2.)
+    value = sin_ddec ** 2 + math.cos(dec1) * math.cos(dec2) * sin_dra ** 2
+    separation = 2. * math.asin(min(1., math.sqrt(value)))
+
+    return math.degrees(separation)
+
+
+def get_cone_clause(pixel_column, dec_column, ra, dec, radius,
+                    ra_column=None):
+    """Return a ``SQLAlchemy`` clause that selects the candidate rows
+    for a cone search, i.e. those in the sky pixels overlapping the
+    cone and within the declination range of the cone.
+
+    Unless an ``ra_column`` is supplied, the candidates must then be
+    refined by their exact angular distance from the center of the
+    cone.
+
+    Parameters
+    ----------
+    pixel_column : obj
+        The ``SQLAlchemy`` column holding the sky pixel.
+    dec_column : obj
+        The ``SQLAlchemy`` column holding the declination.
+    ra : float
+        The right ascension (in degrees) of the center of the cone.
+    dec : float
+        The declination (in degrees) of the center of the cone.
+    radius : float
+        The radius (in degrees) of the cone.
+    ra_column : obj, optional
+        The ``SQLAlchemy`` column holding the right ascension.  If
+        supplied, the clause also compares the exact angular distance
+        (as computed by ``angular_separation``) of the candidates with
+        the ``radius``, so that it selects exactly the rows in the
+        cone.
+
+    Returns
+    -------
+    clause : obj
+        The ``SQLAlchemy`` clause.
+    """
+
+    clause = dec_column.between(dec - radius, dec + radius)
+    pixels = get_cone_pixels(ra, dec, radius)
+    if pixels is not None:
+        clause = and_(pixel_column.in_(pixels), clause)
+
+    if ra_column is not None:
+        dec1 = math.radians(dec)
+        sin_ddec = func.sin((func.radians(dec_column) - dec1) / 2.)
+        sin_dra = func.sin((func.radians(ra_column) - math.radians(ra)) / 2.)
+        value = sin_ddec * sin_ddec \
+            + math.cos(dec1) * func.cos(func.radians(dec_column)) \
+            * sin_dra * sin_dra
+        max_value = math.sin(math.radians(min(radius, 180.)) / 2.) ** 2
+        clause = and_(clause, value <= max_value)
+
+    return clause
+
+
+def get_cone_pixels(ra, dec, radius):
+    """Return the sky pixels that overlap the cone with the given
+    center and ``radius``.
+
+    Parameters
+    ----------
+    ra : float
+        The right ascension (in degrees) of the center of the cone.
+    dec : float
+        The declination (in degrees) of the center of the cone.
+    radius : float
+        The radius (in degrees) of the cone.
+
+    Returns
+    -------
+    pixels : list or None
+        A list of sky pixels, or ``None`` if the cone overlaps more
+        than ``MAX_CONE_PIXELS`` pixels.
+    """
+
+    pixels = []
+    dec_min = max(dec - radius, -90.)
+    dec_max = min(dec + radius, 90.)
+
+    for zone in range(_get_zone(dec_min), _get_zone(dec_max) + 1):
+
+        # Determine the right ascension half-width of the cone at the
+        # most poleward declination of the cone within the zone
+        zone_low = max(-90. + zone * ZONE_HEIGHT, dec_min)
+        zone_high = min(zone_low + ZONE_HEIGHT, dec_max)
+        max_abs_dec = max(abs(zone_low), abs(zone_high))
+        cos_dec = math.cos(math.radians(max_abs_dec))
+        sin_radius = math.sin(math.radians(radius))
+        if dec_max >= 90. or dec_min <= -90. or sin_radius >= cos_dec:
+            half_width = 180.
+        else:
+            half_width = math.degrees(math.asin(sin_radius / cos_dec))
+
+        num_cells = _get_num_cells(zone)
+        if half_width >= 180.:
+            cells = range(num_cells)
+        else:
+            cell_width = 360. / num_cells
+            first = int(math.floor((ra - half_width) / cell_width))
+            last = int(math.floor((ra + half_width) / cell_width))
+            cells = set([cell % num_cells for cell in range(first, last + 1)])
+
+        pixels.extend([zone * ZONE_SIZE + cell for cell in cells])
+
+        if len(pixels) > MAX_CONE_PIXELS:
+            return None
+
+    return sorted(pixels)
+
+
+def get_sky_pixel(ra, dec):
+    """Return the sky pixel of the given position.
+
+    Parameters
+    ----------
+    ra : float
+        The right ascension (in degrees).
+    dec : float
+        The declination (in degrees).
+
+    Returns
+    -------
+    pixel : int or None
+        The sky pixel, or ``None`` if either coordinate is missing.
+    """
+
+    if ra is None or dec is None:
+        return None
+
+    zone = _get_zone(dec)
+    num_cells = _get_num_cells(zone)
+    cell = int(math.floor((ra % 360.) / (360. / num_cells))) % num_cells
+
+    return zone * ZONE_SIZE + cell
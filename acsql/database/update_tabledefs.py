@@ -1,20 +1,30 @@
 #! /usr/bin/env python
 
-"""Updates the ``table_definitions`` text files that store header
+"""Adds new header keywords to the header tables of the ``acsql``
+database and to the ``table_definitions`` text files that store header
 keyword/data type pairs (see ``make_tabledefs.py`` module documentation
 for further details).
 
-A given ``logfile`` is used to scrape for logging ``WARNINGS`` that
-warn of missing ``acsql`` database columns (i.e. header keywords that
-exist in the file header but does not exist as a database column in the
-appropriate header table).  The new header keywords are appended to the
-appropriate ``table_definitions`` text file based on the ``detector``,
-``filetype`` and ``extension`` (e.g. ``WFC_raw_0.txt``).
-
-Additionally, the ``ALTER TABLE`` commands needed to add the
-corresponding columns are printed to the standard output.  ``acsql``
-users can then use these commands within ``MySQL`` to add the
-appropriate columns.
+The ``missing_keywords`` table (see ``acsql.database.missing_keywords``)
+is used to determine the header keywords that exist in the file headers
+but do not exist as a database column in the appropriate header table.
+The data type of each keyword is the one inferred from its values
+during ingestion.  Keywords that are never header table columns (see
+``acsql.utils.utils.EXCLUDED_HEADER_KEYWORDS``) and tables that have no
+``table_definitions`` text file are skipped.
+
+The new columns of each header table are added with a single
+``ALTER TABLE`` statement with one ``ADD`` clause per column, so that
+each table is only rebuilt once (``SQLite`` does not support multiple
+``ADD`` clauses, so one statement per column is used there).  The new
+header keywords are then appended to the appropriate
+``table_definitions`` text file based on the ``detector``, ``filetype``
+and ``extension`` (e.g. ``wfc_raw_0.txt``), their ``missing_keywords``
+entries are removed, and the table definitions and ORMs of the running
+process are updated.  Other running processes (e.g. the web
+application) must be restarted to use the new columns.
+
+In dry-run mode, the ``ALTER TABLE`` statements are only printed.
 
 Authors
 -------
@@ -27,35 +37,109 @@ Use
     be used from the command line as such:
     ::
 
-        python update_tabledefs.py <logfile>
-
-    Required arguments:
-    ::
+        python update_tabledefs.py [-t|--table] [-m|--minimum_count]
+            [-d|--dry_run]
 
-        logfile: The path to an ``acsql.ingest.ingest.py`` log to be
-            used to determine new header keywords.
+    Parameters:
+    (Optional) [-t|--table] - Only add the keywords of the given header
+        table (e.g. ``wfc_raw_0``).  By default, the keywords of every
+        table are added.
+    (Optional) [-m|--minimum_count] - Only add the keywords that have
+        been found at least this many times.  The default is 1.
+    (Optional) [-d|--dry_run] - Only print the ``ALTER TABLE``
+        statements, without applying them.
 
 Dependencies
 ------------
     External library dependencies include:
 
     - ``acsql``
-    - ``numpy``
-    - ``stak`` (``https://github.com/spacetelescope/stak``)
-
-Notes
------
-    The ``stak.Hselect`` dependency still depends on Python 2 at the
-    time of this writing.
+    - ``sqlalchemy``
 """
 
 import argparse
+from collections import OrderedDict
+import logging
 import os
+import time
+
+from sqlalchemy import inspect
+
+from acsql.database import database_interface
+from acsql.database.database_interface import define_column
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import MissingKeywords
+from acsql.database.missing_keywords import flush_missing_keywords
+from acsql.database.missing_keywords import get_missing_keywords
+from acsql.utils import utils
+from acsql.utils.utils import get_table_defs
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import setup_logging
+from acsql.utils.utils import TABLE_DEFS
 
-import numpy as np
-from ccdproc import ImageFileCollection
 
-from acsql.utils.utils import SETTINGS
+def get_alter_statements(table_name, keywords, dialect):
+    """Return the ``ALTER TABLE`` statements that add the columns of
+    the given ``keywords`` to the given header table.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the header table (e.g. ``wfc_raw_0``).
+    keywords : list
+        A list of ``(keyword, keyword_type)`` tuples.
+    dialect : obj
+        The ``sqlalchemy`` dialect of the database.
+
+    Returns
+    -------
+    statements : list
+        The ``ALTER TABLE`` statements; a single statement unless the
+        database is ``SQLite``.
+    """
+
+    clauses = ['ADD COLUMN {} {}'.format(keyword.lower(),
+               define_column(keyword, keyword_type).type.compile(
+                   dialect=dialect))
+               for keyword, keyword_type in keywords]
+
+    if dialect.name == 'sqlite':
+        statements = ['ALTER TABLE {} {};'.format(table_name, clause)
+                      for clause in clauses]
+    else:
+        statements = ['ALTER TABLE {} {};'.format(table_name,
+                                                  ', '.join(clauses))]
+
+    return statements
+
+
+def invalidate_table_schema(table_name, keywords):
+    """Update the table definitions and the ORM of the given header
+    table in the running process, so that the given new ``keywords``
+    are ingested without restarting.
+
+    Parameters
+    ----------
+    table_name : str
+        The name of the header table (e.g. ``wfc_raw_0``).
+    keywords : list
+        A list of ``(keyword, keyword_type)`` tuples.
+    """
+
+    # Update the table definitions in place, as they are imported by name
+    table_defs = get_table_defs()
+    TABLE_DEFS.clear()
+    TABLE_DEFS.update(table_defs)
+
+    detector, name = table_name.split('_', 1)
+    orm = getattr(database_interface, '{}_{}'.format(detector.upper(), name),
+                  None)
+    if orm is None:
+        return
+
+    for keyword, keyword_type in keywords:
+        if keyword.lower() not in orm.__table__.columns:
+            setattr(orm, keyword.lower(), define_column(keyword, keyword_type))
 
 
 def parse_args():
@@ -68,112 +152,148 @@ def parse_args():
     """
 
     # Create help strings
-    logfile_help = 'The path to the logfile to use to determine new header '
-    logfile_help += 'keywords.'
+    table_help = 'Only add the keywords of the given header table (e.g. '
+    table_help += 'wfc_raw_0).  By default, the keywords of every table are '
+    table_help += 'added.'
+    minimum_count_help = 'Only add the keywords that have been found at '
+    minimum_count_help += 'least this many times.  The default is 1.'
+    dry_run_help = 'Only print the ALTER TABLE statements, without applying '
+    dry_run_help += 'them.'
 
     # Add arguments
     parser = argparse.ArgumentParser()
-    parser.add_argument('logfile',
+    parser.add_argument('-t --table',
+                        dest='table',
                         action='store',
-                        help=logfile_help)
+                        type=str,
+                        required=False,
+                        default=None,
+                        help=table_help)
+    parser.add_argument('-m --minimum_count',
+                        dest='minimum_count',
+                        action='store',
+                        type=int,
+                        required=False,
+                        default=1,
+                        help=minimum_count_help)
+    parser.add_argument('-d --dry_run',
+                        dest='dry_run',
+                        action='store_true',
+                        required=False,
+                        help=dry_run_help)
 
     # Parse args
     args = parser.parse_args()
 
-    # Ensure that the logfile exists
-    assert os.path.exists(args.logfile), '{} does not exist.'\
-        .format(args.logfile)
-
     return args
 
 
-def update_tabledefs(logfile):
+def update_tabledefs(table=None, minimum_count=1, dry_run=False):
     """The main function of the ``update_tabledefs`` module.  See
     module documentation for further details.
 
     Parameters
     ----------
-    logfile : str
-        The path to an ``acsql.ingest.ingest.py`` log to be used to
-        determine new header keywords.
+    table : str, optional
+        Only add the keywords of the given header table (e.g.
+        ``wfc_raw_0``).  By default, the keywords of every table are
+        added.
+    minimum_count : int, optional
+        Only add the keywords that have been found at least this many
+        times.
+    dry_run : bool, optional
+        If ``True``, only print the ``ALTER TABLE`` statements.
+
+    Returns
+    -------
+    timings : OrderedDict
+        The number of seconds that the migration of each header table
+        took (empty in dry-run mode).
     """
 
-    # Read in the logfile
-    with open(logfile) as f:
-        data = f.readlines()
-
-    # Grab out the appropriate WARNING lines
-    warnings = [item.strip() for item in data if 'not in' in item]
-    warnings = [item.split(':') for item in warnings]
-
-    # Determine metadata for each warning
-    rootnames = [item[-2].strip() for item in warnings]
-    keywords = [item[-1].strip().split(' not in')[0] for item in warnings]
-    tables = [item[-1].strip().split('not in ')[-1] for item in warnings]
-    filetypes = [item.split('_')[1] for item in tables]
-    paths = [os.path.join(SETTINGS['filesystem'], rootname[0:4], rootname,
-             '{}_{}.fits'.format(rootname, filetype)) for rootname, filetype
-             in zip(rootnames, filetypes)]
-
-    # Take a set of the warnings to avoid duplications
-    files_to_test = ['{},{},{}'.format(path, keyword, table) for path,
-                     keyword, table in zip(paths, keywords, tables)]
-    keywords_to_add = set([(keyword, table) for keyword, table in zip(keywords,
-                                                                      tables)])
-
-    # For each keyword to add, use test file to determine data type
-    command_list = []
-    for keyword, table in keywords_to_add:
-        test_file = [f for f in files_to_test if '{},{}'
-                     .format(keyword, table) in f][0]
-        test_file = test_file.split(',')[0]
-
-        # Use hselect to determine data type
-        try:
-            hsel = ImageFileCollection(filenames=test_file, keywords=keyword, ext=int(table[-1]))
-            hsel = Hselect(test_file, keyword, extension=(int(table[-1]),))
-            dtype = hsel.summary[keyword].dtype
-        except:
-            print('Cannot determine datatype for {}. Defaulting to String'
-                  .format(keyword))
-            dtype = np.dtype('S80')
-
-        if dtype in [np.dtype('S68'), np.dtype('S80')]:
-            col_type = 'String'
-            db_type = 'VARCHAR(50)'
-        elif dtype in [np.int64]:
-            col_type = 'Integer'
-            db_type = 'INTEGER'
-        elif dtype in [bool]:
-            col_type = 'Bool'
-            db_type = 'BOOLEAN'
-        elif dtype in [np.float64]:
-            col_type = 'Float'
-            db_type = 'FLOAT'
-        else:
-            print('Could not find type match: {}:{}'.format(keyword, dtype))
+    # Make sure any missing keywords of this process are in the registry
+    flush_missing_keywords()
+
+    table_def_dir = os.path.join(os.path.realpath(os.path.dirname(__file__)),
+                                 'table_definitions')
+
+    # Group the missing keywords by table
+    tables = OrderedDict()
+    for entry in get_missing_keywords(table, minimum_count):
+        keyword = entry['keyword'].replace('-', '_')
+        if keyword in utils.EXCLUDED_HEADER_KEYWORDS:
+            continue
+        tables.setdefault(entry['table_name'], []).append(
+            (keyword, entry['keyword_type']))
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    inspector = inspect(engine)
+    missing_keywords_table = MissingKeywords.__table__
+
+    timings = OrderedDict()
+    for table_name, keywords in tables.items():
+
+        # Only header tables have a table definitions file
+        tabledefs_file = os.path.join(table_def_dir,
+                                      '{}.txt'.format(table_name))
+        if not os.path.exists(tabledefs_file):
+            logging.warning('Skipping {}: no table definitions file'
+                            .format(table_name))
+            continue
+
+        # Keywords whose columns already exist only need their files updated
+        existing_columns = [column['name'] for column in
+                            inspector.get_columns(table_name)]
+        new_keywords = [(keyword, keyword_type) for keyword, keyword_type
+                        in keywords if keyword.lower() not in existing_columns]
+
+        statements = []
+        if new_keywords:
+            statements = get_alter_statements(table_name, new_keywords,
+                                              engine.dialect)
+        for statement in statements:
+            print(statement)
+        if dry_run:
+            continue
+
+        start = time.time()
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(statement)
+        timings[table_name] = time.time() - start
 
         # Update the appropriate table definitions file
-        tabledefs_file = 'table_definitions/{}.txt'.format(table.lower())
         with open(tabledefs_file, 'r') as f:
             data = f.readlines()
         existing_keywords = [item.strip().split(',')[0] for item in data]
         with open(tabledefs_file, 'a') as f:
-            if keyword not in existing_keywords:
-                f.write('{}, {}\n'.format(keyword, col_type))
-        print('Updated {} with {}'.format(tabledefs_file, keyword))
+            for keyword, keyword_type in keywords:
+                if keyword not in existing_keywords:
+                    f.write('{}, {}\n'.format(keyword, keyword_type))
+
+        # The keywords are no longer missing
+        engine.execute(missing_keywords_table.delete()
+            .where(missing_keywords_table.c.table_name == table_name)
+            .where(missing_keywords_table.c.keyword.in_(
+                [keyword for keyword, keyword_type in keywords])))
 
-        # Add ALTER TABLE command to list of commands
-        command = 'ALTER TABLE {} ADD {} {};'.format(table.lower(),
-                                                    keyword.lower(), db_type)
-        command_list.append(command)
+        invalidate_table_schema(table_name, keywords)
+
+        message = 'Migrated {}: added {} columns in {:.2f} s'.format(
+            table_name, len(new_keywords), timings[table_name])
+        print(message)
+        logging.info(message)
+
+    session.close()
+    engine.dispose()
+
+    return timings
 
-    # Print out the ALTER TABLE commands
-    print('\n\nALTER TABLE commands to execute for database:\n')
-    for command in command_list:
-        print(command)
 
 if __name__ == '__main__':
 
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
     args = parse_args()
-    update_tabledefs(args.logfile)
+    update_tabledefs(args.table, args.minimum_count, args.dry_run)
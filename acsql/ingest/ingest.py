@@ -1,8 +1,10 @@
 """Ingests a given rootname (and its associated files) into the
 ``ascql`` database.  The tables that are updated are the ``master``
-table, the ``datasets`` table, and any appropriate header tables
-(e.g. ``wfc_raw_0``) based on the available filetypes and header
-extensions.
+table, the ``proposals`` table, the ``observations`` table, the
+``reference_files`` table, the ``headers`` table, the ``datasets``
+table, the ``file_fingerprints`` table, and any appropriate header
+tables (e.g. ``wfc_raw_0``) based on the available filetypes and
+header extensions.
 
 Authors
 -------
@@ -18,6 +20,12 @@ Use
         from acsql.ingest.ingest import ingest
         ingest(rootname)
 
+    or, to ingest a group of rootnames in a single transaction:
+    ::
+
+        from acsql.ingest.ingest import ingest_group
+        ingest_group(rootnames)
+
 Dependencies
 ------------
     External library dependencies include:
@@ -30,36 +38,185 @@ Dependencies
 from datetime import date
 from copy import deepcopy
 import glob
+import hashlib
 import logging
 import os
-import urllib.request
+import zlib
 
 from astropy.io import fits
 from astropy.io.fits.verify import VerifyError
-from sqlalchemy import Table
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import bindparam
+from sqlalchemy import func
 
-from acsql.database.database_interface import Datasets
+from acsql.database import database_interface
+from acsql.database.aggregates import apply_deferred_counts
+from acsql.database.aggregates import defer_counts
+from acsql.database.aggregates import discard_deferred_counts
+from acsql.database.aggregates import get_observation_count_names
+from acsql.database.aggregates import increment_table_count
+from acsql.database.aggregates import update_observation_counts
+from acsql.database.database_interface import FileFingerprints
 from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import Master
+from acsql.database.database_interface import Observations
+from acsql.database.missing_keywords import flush_missing_keywords
+from acsql.database.missing_keywords import record_missing_keyword
+from acsql.database.name_index import update_name_index
+from acsql.database.parquet_mirror import update_parquet_mirror
+from acsql.database.sky_index import get_sky_pixel
 from acsql.ingest.make_file_dict import get_metadata_from_test_files
 from acsql.ingest.make_file_dict import make_file_dict
 from acsql.ingest.make_jpeg import make_jpeg
 from acsql.ingest.make_thumbnail import make_thumbnail
+from acsql.ingest.proposal_status import get_proposal_status
+from acsql.ingest.proposal_status import update_proposals_table
 from acsql.utils import utils
 from acsql.utils.utils import insert_or_update
+from acsql.utils.utils import replace_rows
 from acsql.utils.utils import SETTINGS
 from acsql.utils.utils import TABLE_DEFS
 from acsql.utils.utils import VALID_FILETYPES
 from acsql.utils.utils import VALID_PROPOSAL_TYPES
 
 
+def backfill_header_columns(table, columns, files):
+    """Fill the given ``columns`` of the given header ``table`` for the
+    given files, using only the relevant extension header of each
+    file.
+
+    The columns of all of the files are updated with a single batched
+    ``UPDATE`` statement, which only fills the columns that are
+    ``NULL``, so that existing values are never overwritten.  Unlike
+    ``ingest``, no other tables are updated (so the ``observations``
+    and ``reference_files`` tables and the Parquet mirror are left
+    stale), and no JPEGs or thumbnails are made.
+
+    Parameters
+    ----------
+    table : str
+        The name of the header table (e.g. ``wfc_raw_0``).
+    columns : list
+        The (lowercase) names of the columns to fill.
+    files : list
+        A list of ``(rootname, path)`` tuples, where ``path`` is the
+        path to the file whose header is used to fill the columns.
+
+    Returns
+    -------
+    num_updated : int
+        The number of rows that were updated.
+    """
+
+    ext = int(table.split('_')[-1])
+    rows = []
+    for rootname, path in files:
+        try:
+            header = fits.getheader(path, ext)
+        except (IndexError, OSError) as e:
+            logging.warning('{}: Unable to backfill {}: {}'.format(rootname,
+                                                                  table, e))
+            continue
+
+        # Header keywords with hyphens are stored with underscores
+        values = {key.strip().replace('-', '_').lower(): value
+                  for key, value in header.items()}
+        row = {'b_rootname': rootname}
+        for column in columns:
+            value = values.get(column)
+            row[column] = value if isinstance(value, (str, int, float)) \
+                and value != '' else None
+        rows.append(row)
+
+    if not rows:
+        return 0
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    table_obj = database_interface.base.metadata.tables[table.lower()]
+    update = table_obj.update()\
+        .where(table_obj.c.rootname == bindparam('b_rootname'))\
+        .values({column: func.coalesce(table_obj.c[column],
+                                       bindparam(column))
+                 for column in columns})
+
+    with engine.begin() as connection:
+        connection.execute(update, rows)
+
+    session.close()
+    engine.dispose()
+
+    logging.info('Backfilled {} {} rows'.format(len(rows), table))
+
+    return len(rows)
+
+
+def check_file_fingerprint(filename):
+    """Compare the given file against its entry in the
+    ``file_fingerprints`` table to determine whether it has changed
+    since it was last ingested.
+
+    A file is unchanged if its size and modification time are the same.
+    Otherwise, if the ``fingerprint_headers`` setting is enabled, a hash
+    of its headers is compared, so that files whose data changed but
+    whose headers did not only have their images remade.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the file.
+
+    Returns
+    -------
+    status : str
+        ``unchanged`` if the file has not changed, ``headers_unchanged``
+        if only its data may have changed, or ``changed``.
+    fingerprint : dict
+        The ``file_fingerprints`` table entry of the file as it is now.
+    """
+
+    basename = os.path.basename(filename)
+    stat = os.stat(filename)
+    fingerprint = {'filename': basename,
+                   'rootname': basename.split('_')[0][:-1],
+                   'size': stat.st_size,
+                   'mtime': stat.st_mtime,
+                   'header_hash': None,
+                   'last_ingest_date': date.today()}
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    stored = session.query(FileFingerprints)\
+        .filter(FileFingerprints.filename == basename).first()
+    session.close()
+    engine.dispose()
+
+    if stored is not None and stored.size == fingerprint['size'] \
+            and stored.mtime == fingerprint['mtime']:
+        fingerprint['header_hash'] = stored.header_hash
+        return 'unchanged', fingerprint
+
+    if SETTINGS.get('fingerprint_headers', False):
+        md5 = hashlib.md5()
+        with fits.open(filename) as hdulist:
+            for hdu in hdulist:
+                md5.update(hdu.header.tostring().encode('ascii', 'replace'))
+        fingerprint['header_hash'] = md5.hexdigest()
+
+        if stored is not None \
+                and stored.header_hash == fingerprint['header_hash']:
+            return 'headers_unchanged', fingerprint
+
+    return 'changed', fingerprint
+
+
 def get_proposal_type(proposid):
     """Return the ``proposal_type`` for the given ``proposid``.
 
     The ``proposal_type`` is the type of proposal (e.g. ``CAL``,
-    ``GO``, etc.).  The ``proposal_type`` is scraped from the MAST
-    proposal status webpage for the given ``proposid``.  If the
-    ``proposal_type`` cannot be determined, a ``None`` value is returned.
+    ``GO``, etc.).  It is taken from an existing ``master`` table entry
+    of the same proposal if there is one, and is otherwise parsed from
+    the proposal status webpage, which is scraped at most once per
+    proposal and is reused by ``update_proposals_table`` (see
+    ``get_proposal_status``).  If the ``proposal_type`` cannot be
+    determined, a ``None`` value is returned.
 
     Parameters
     ----------
@@ -68,23 +225,27 @@ def get_proposal_type(proposid):
 
     Returns
     -------
-    proposal_type : int or None
+    proposal_type : str or None
         The proposal type (e.g. ``CAL``).
     """
 
     if not proposid:
-        proposal_type = None
-    else:
-        try:
-            url = 'http://www.stsci.edu/cgi-bin/get-proposal-info?id='
-            url += '{}&submit=Go&observatory=HST'.format(proposid)
-            webpage = urllib.request.urlopen(url)
-            proposal_type = webpage.readlines()[11].split(b'prop_type">')[-1]
-            proposal_type = proposal_type.split(b'</a>')[0].decode()
-        except:
-            logging.warning('Cannot determine proposal type for {}'\
-                .format(proposid))
-            proposal_type = None
+        return None
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    try:
+        proposal_type = session.query(Master.proposal_type)\
+            .filter(Master.proposid == int(proposid))\
+            .filter(Master.proposal_type.isnot(None))\
+            .limit(1).scalar()
+    finally:
+        session.close()
+        engine.dispose()
+
+    if proposal_type is None:
+        status_dict = get_proposal_status(proposid)
+        if status_dict is not None:
+            proposal_type = status_dict['proposal_type']
 
     # Check for bad proposal types
     if proposal_type not in VALID_PROPOSAL_TYPES:
@@ -95,58 +256,100 @@ def get_proposal_type(proposid):
     return proposal_type
 
 
-def update_datasets_table(file_dict):
-    """Insert/update an entry for the file in the ``datasets`` table.
+def get_reference_files(header_dict):
+    """Return the calibration reference files recorded in the given
+    header.
+
+    Reference file keywords are those ending in ``FILE`` or ``TAB``
+    whose values are reference file paths (e.g.
+    ``jref$06u15056j_bia.fits``).  The path prefix (e.g. ``jref$``) is
+    removed from the returned reference files.
 
     Parameters
     ----------
-    file_dict : dict
-        A dictionary containing various data useful for the ingestion
-        process.
+    header_dict : dict
+        The (lowercase) keyword/value pairs of the header.
+
+    Returns
+    -------
+    reference_files : list
+        A list of ``(keyword, reference_file)`` tuples.
     """
 
-    session, base, engine = load_connection(SETTINGS['connection_string'])
+    reference_files = []
+    for key, value in header_dict.items():
+        if not (key.endswith('file') or key.endswith('tab')):
+            continue
+        if isinstance(value, str) and '$' in value:
+            reference_files.append((key, value.split('$')[-1].strip()))
 
-    # Check to see if a record exists for the rootname
-    query = session.query(Datasets)\
-        .filter(Datasets.rootname == file_dict['rootname'])
-    query_count = query.count()
+    return reference_files
 
-    # If there are no results, then perform an insert
-    if not query_count:
 
-        data_dict = {}
-        data_dict['rootname'] = file_dict['rootname']
-        data_dict[file_dict['filetype']] = file_dict['basename']
+def write_rows(function, args, connection=None):
+    """Write rows to the database by calling the given ``function``
+    with the given ``args`` and ``connection``.
 
-        tab = Table('datasets', base.metadata, autoload=True)
-        insert_obj = tab.insert()
-        try:
-            insert_obj.execute(data_dict)
-        except IntegrityError as e:
-            logging.warning('{}: Unable to insert {} into datasets table: {}'\
-                .format(file_dict['full_rootname'], file_dict['basename'], e))
+    If ``connection`` is a list, the write is instead appended to it
+    as a ``(function, args)`` tuple, so that the rows of a rootname can
+    be produced by one process and written by another (see
+    ``acsql.ingest.writer``).
 
-    # If there are results, add the filename to the existing entry
-    else:
-        data_dict = query.one().__dict__
-        del data_dict['_sa_instance_state']
-        data_dict[file_dict['filetype']] = file_dict['basename']
-        try:
-            query.update(data_dict)
-        except IntegrityError as e:
-            logging.warning('{}: Unable to update {} in datasets table: {}'\
-                .format(file_dict['full_rootname'], file_dict['basename'], e))
+    Parameters
+    ----------
+    function : function
+        The function that writes the rows (e.g. ``upsert_row``), which
+        must accept a ``connection`` keyword argument.
+    args : tuple
+        The positional arguments of the ``function``.
+    connection : obj or list, optional
+        The ``sqlalchemy`` connection with which to write the rows, or
+        a list to which to append the write.
 
-    session.commit()
-    session.close()
-    engine.dispose()
+    Returns
+    -------
+    result : obj
+        The value returned by the ``function``, or ``None`` if the
+        write was appended to the list.
+    """
 
-    logging.info('{}: Updated datasets table for {}.'\
-        .format(file_dict['rootname'], file_dict['filetype']))
+    if isinstance(connection, list):
+        connection.append((function, args))
+        return None
 
+    return function(*args, connection=connection)
 
-def update_drizzle_table(root, drizzles):
+
+def upsert_row(table, data_dict, connection=None):
+    """Insert or update a record in the given ``table`` (see
+    ``insert_or_update``), and increment the record count of the table
+    if it was inserted.
+
+    Parameters
+    ----------
+    table : str
+        The name of the table (i.e. its ORM, e.g. ``Master``).
+    data_dict : dict
+        A dictionary containing the data to insert/update.
+    connection : obj, optional
+        If supplied, the record is written with the given
+        ``sqlalchemy`` connection, as part of its current transaction.
+
+    Returns
+    -------
+    written : bool
+        ``False`` if the record could not be inserted, otherwise
+        ``True``.
+    """
+
+    inserted = insert_or_update(table, data_dict, connection)
+    if inserted:
+        increment_table_count(table, connection)
+
+    return inserted is not None
+
+
+def update_drizzle_table(root, drizzles, connection=None):
     """
     Insert/update an entry for a particular file and its drizzle iteration
     keywords. The drizzles are built up during update_header_table.
@@ -158,22 +361,30 @@ def update_drizzle_table(root, drizzles):
     drizzles : list
         List of dictionaries, each containing values for the 17 drizzle info
         keywords in a single drizzle iteration (if present).
+    connection : obj or list, optional
+        If supplied, the entries are written with the given sqlalchemy
+        connection, as part of its current transaction (see
+        ``write_rows``).
     """
     for drizzle_dict in drizzles:
         drizzle_dict['rootname'] = root
         try:
-            insert_or_update('drizzle_data', drizzle_dict)
+            write_rows(insert_or_update, ('drizzle_data', drizzle_dict),
+                       connection)
         except VerifyError as e:
             logging.warning('\tUnable to insert {} into drizzle_data: {}'.format(
                 root, table, e))
 
 
-def update_header_table(file_dict, ext):
-    """Insert/update an entry for the file in the appropriate header
-    table (e.g. ``wfc_raw_0``).
+def update_header_table(file_dict, ext, connection=None):
+    """Read the given extension header of the file and update the
+    tables that depend on it, returning the row of the appropriate
+    header table (e.g. ``wfc_raw_0``).
 
     The header table that get updated depend on the detector, filetype,
-    and extension.
+    and extension.  The row itself is written by
+    ``update_rootname_tables``, together with the other rows of the
+    rootname.
 
     Parameters
     ----------
@@ -182,6 +393,19 @@ def update_header_table(file_dict, ext):
         process.
     ext : int
         The header extension.
+    connection : obj or list, optional
+        If supplied, the dependent rows are written with the given
+        ``sqlalchemy`` connection, as part of its current transaction
+        (see ``write_rows``).
+
+    Returns
+    -------
+    header_row : tuple, None, or bool
+        The ``(table, input_dict)`` row of the header table, ``None``
+        if the header is not ingestable, or ``False`` if it is
+        ingestable but could not be read (e.g. a ``VerifyError``).  If
+        a dependent row cannot be written, the ``rows_written`` key of
+        the ``file_dict`` is set to ``False``.
     """
 
     # Check if header is an ingestable header before proceeding
@@ -206,6 +430,9 @@ def update_header_table(file_dict, ext):
                                   file_dict['filetype'].lower(),
                                   str(ext))
 
+        # Store the complete header for display in the web application
+        update_headers_table(file_dict, ext, header, connection)
+
         exclude_list = ['HISTORY', 'COMMENT', 'ROOTNAME', 'FILENAME', '']
         input_dict = {'rootname': file_dict['rootname'],
                       'filename': file_dict['basename']}
@@ -242,25 +469,252 @@ def update_header_table(file_dict, ext):
                     drizzle_key = key[4:].lower()
                     drizzle_element[key] = value
                 elif key not in TABLE_DEFS[table.lower()]:
-                    logging.warning('{}: {} not in {}'\
-                        .format(file_dict['full_rootname'], key, table))
+                    # Keywords that are never surveyed for the table
+                    # definitions (see make_tabledefs) are not missing
+                    if key not in utils.EXCLUDED_HEADER_KEYWORDS:
+                        logging.warning('{}: {} not in {}'\
+                            .format(file_dict['full_rootname'], key, table))
+                        record_missing_keyword(table, key, value,
+                                               file_dict['basename'])
                     continue
 
                 input_dict[key.lower()] = value
             
             if len(drizzle_dict) > 0:
-                update_drizzle_table(input_dict['rootname'], drizzle_dict)
+                update_drizzle_table(input_dict['rootname'], drizzle_dict,
+                                     connection)
+
+            update_reference_files_table(file_dict, table, input_dict,
+                                         connection)
+
+            try:
+                update_parquet_mirror(file_dict, table, input_dict)
+            except (ImportError, OSError) as e:
+                logging.warning('{}: Unable to update Parquet mirror of {}: {}'
+                                .format(file_dict['rootname'], table, e))
 
-            insert_or_update(table, input_dict)
-            logging.info('{}: Updated {} table.'.format(file_dict['rootname'],
-                                                      table))
+            # The file is not fingerprinted if its entry is not written
+            if file_dict['filetype'] == 'raw' and ext == 0:
+                if update_observations_table(file_dict, input_dict,
+                                             connection) is False:
+                    file_dict['rows_written'] = False
+
+            return table, input_dict
 
         except VerifyError as e:
             logging.warning('\tUnable to insert {} into {}: {}'.format(
                 file_dict['rootname'], table, e))
+            return False
+
+    return None
+
 
+def update_observations_table(file_dict, header_dict, connection=None):
+    """Insert/update an entry for the rootname in the ``observations``
+    table.
+
+    The ``observations`` table is a denormalized summary of the
+    ``master`` and ``<detector>_raw_0`` tables, and is updated
+    whenever the primary header of a ``raw`` file is ingested.
+
+    Parameters
+    ----------
+    file_dict : dict
+        A dictionary containing various data useful for the ingestion
+        process.
+    header_dict : dict
+        The (lowercase) column/value pairs of the primary header, as
+        inserted into the ``<detector>_raw_0`` table.
+    connection : obj or list, optional
+        If supplied, the entry and its counts are written with the
+        given ``sqlalchemy`` connection, as part of its current
+        transaction (see ``write_rows``).
 
-def update_master_table(rootname_path):
+    Returns
+    -------
+    written : bool or None
+        ``False`` if the entry could not be inserted, in which case its
+        counts are not updated, or ``None`` if it was appended to the
+        list of writes.
+    """
+
+    non_header_columns = ['rootname', 'filename', 'detector', 'proposal_type',
+                          'sky_pixel']
+    header_columns = [column.name for column in Observations.__table__.columns
+                      if column.name not in non_header_columns]
+
+    data_dict = {'rootname': file_dict['rootname'],
+                 'filename': file_dict['basename'],
+                 'detector': file_dict['detector'].upper(),
+                 'proposal_type': file_dict.get('proposal_type')}
+    for column in header_columns:
+        data_dict[column] = header_dict.get(column)
+    data_dict['sky_pixel'] = get_sky_pixel(data_dict['ra_targ'],
+                                           data_dict['dec_targ'])
+
+    previous_count_names = get_observation_count_names(file_dict['rootname'])
+    written = write_rows(upsert_row, ('Observations', data_dict), connection)
+    if written is False:
+        return written
+    write_rows(update_observation_counts, (previous_count_names, data_dict),
+               connection)
+    write_rows(update_name_index, (data_dict,), connection)
+    logging.info('{}: Updated observations table.'.format(file_dict['rootname']))
+
+    return written
+
+
+def update_reference_files_table(file_dict, table, header_dict,
+                                 connection=None):
+    """Replace the entries in the ``reference_files`` table for the
+    given header with the reference files that it records.
+
+    Parameters
+    ----------
+    file_dict : dict
+        A dictionary containing various data useful for the ingestion
+        process.
+    table : str
+        The header table that the header was ingested into (e.g.
+        ``WFC_raw_0``).
+    header_dict : dict
+        The (lowercase) keyword/value pairs of the header.
+    connection : obj or list, optional
+        If supplied, the entries are written with the given
+        ``sqlalchemy`` connection, as part of its current transaction
+        (see ``write_rows``).
+    """
+
+    reference_files = get_reference_files(header_dict)
+
+    # The entries of the header are always deleted, so that reference
+    # files that the header no longer records are removed
+    table_name = table.lower()
+    rows = [{'reference_file': reference_file, 'keyword': keyword,
+             'table_name': table_name, 'filename': file_dict['basename'],
+             'rootname': file_dict['rootname']}
+            for keyword, reference_file in reference_files]
+
+    write_rows(replace_rows,
+               ('ReferenceFiles', ['filename', 'table_name'], rows,
+                [(file_dict['basename'], table_name)]),
+               connection)
+
+    logging.info('{}: Updated reference_files table.'.format(
+        file_dict['rootname']))
+
+
+def update_file_fingerprints_table(fingerprint, connection=None):
+    """Insert/update the entry of a file in the ``file_fingerprints``
+    table.
+
+    Parameters
+    ----------
+    fingerprint : dict
+        The ``file_fingerprints`` table entry of the file (see
+        ``check_file_fingerprint``).
+    connection : obj or list, optional
+        If supplied, the entry is written with the given ``sqlalchemy``
+        connection, as part of its current transaction (see
+        ``write_rows``).
+    """
+
+    write_rows(replace_rows, ('FileFingerprints', ['filename'], [fingerprint]),
+               connection)
+
+
+def update_rootname_tables(header_rows, datasets_dict=None, connection=None):
+    """Insert/update the header table rows and the ``datasets`` table
+    entry of a rootname in a single transaction.
+
+    Parameters
+    ----------
+    header_rows : list
+        A list of ``(table, input_dict)`` tuples of the header table
+        rows of the rootname (see ``update_header_table``).
+    datasets_dict : dict, optional
+        The ``datasets`` table entry of the rootname, i.e. its
+        ``rootname`` and the filename of each of its filetypes.  If not
+        supplied, the ``datasets`` table is not updated.
+    connection : obj or list, optional
+        If supplied, the rows are written with the given ``sqlalchemy``
+        connection, as part of its current transaction (see
+        ``write_rows``).  By default, they are written in a transaction
+        of their own.
+
+    Returns
+    -------
+    failed_rows : list
+        The ``(table, input_dict)`` rows that could not be inserted
+        (always empty if the rows are appended to a list of writes).
+    """
+
+    rows = list(header_rows)
+    if datasets_dict is not None:
+        rows.append(('Datasets', datasets_dict))
+    if not rows:
+        return []
+
+    if connection is None:
+        session, base, engine = load_connection(SETTINGS['connection_string'])
+        with engine.begin() as connection:
+            failed_rows = update_rootname_tables(header_rows, datasets_dict,
+                                                 connection)
+        session.close()
+        engine.dispose()
+        return failed_rows
+
+    failed_rows = []
+    for table, input_dict in rows:
+        if write_rows(upsert_row, (table, input_dict), connection) is False:
+            failed_rows.append((table, input_dict))
+
+    rootname = rows[0][1]['rootname']
+    for table, input_dict in rows:
+        if (table, input_dict) not in failed_rows:
+            logging.info('{}: Updated {} table.'.format(rootname, table))
+
+    return failed_rows
+
+
+def update_headers_table(file_dict, ext, header, connection=None):
+    """Insert/update the complete header of the given extension of the
+    file in the ``headers`` table.
+
+    Unlike the header tables (e.g. ``wfc_raw_0``), the ``headers``
+    table keeps every card of the header (including ``HISTORY`` and
+    ``COMMENT`` cards), stored as ``zlib``-compressed text with one
+    card per line.
+
+    Parameters
+    ----------
+    file_dict : dict
+        A dictionary containing various data useful for the ingestion
+        process.
+    ext : int
+        The header extension.
+    header : obj
+        The ``astropy.io.fits.Header`` of the extension.
+    connection : obj or list, optional
+        If supplied, the entry is written with the given ``sqlalchemy``
+        connection, as part of its current transaction (see
+        ``write_rows``).
+    """
+
+    header_string = header.tostring(sep='\n', endcard=False, padding=False)
+    header_bytes = header_string.encode('ascii', 'replace')
+
+    data_dict = {'filename': file_dict['basename'],
+                 'ext': ext,
+                 'rootname': file_dict['rootname'],
+                 'header': zlib.compress(header_bytes),
+                 'checksum': hashlib.md5(header_bytes).hexdigest()}
+
+    write_rows(replace_rows, ('Headers', ['filename', 'ext'], [data_dict]),
+               connection)
+
+
+def update_master_table(rootname_path, connection=None):
     """Insert/update an entry in the ``master`` table for the given
     file.
 
@@ -268,6 +722,18 @@ def update_master_table(rootname_path):
     ----------
     rootname_path
         The path to the rootname directory in the MAST cache.
+    connection : obj or list, optional
+        If supplied, the entry is written with the given ``sqlalchemy``
+        connection, as part of its current transaction (see
+        ``write_rows``).  The ``proposals`` table is then left for
+        the caller to update once the transaction is committed (see
+        ``ingest_group``).
+
+    Returns
+    -------
+    data_dict : dict or None
+        The column/value pairs inserted into the ``master`` table, or
+        ``None`` if they could not be inserted.
     """
 
     rootname = os.path.basename(rootname_path)[:-1]
@@ -275,37 +741,149 @@ def update_master_table(rootname_path):
     proposid = get_metadata_from_test_files(rootname_path, 'proposid')
     proposal_type = get_proposal_type(proposid)
 
+    # The detector is stored in uppercase, as required by the column's
+    # Enum (which SQLite enforces with a CHECK constraint)
+    detector = get_metadata_from_test_files(rootname_path, 'detector')
+    if detector:
+        detector = detector.upper()
+
     # Insert a record in the master table
     data_dict = {'rootname': rootname,
                   'path': path,
-                  'first_ingest_date': date.today().isoformat(),
-                  'last_ingest_date': date.today().isoformat(),
-                  'detector': get_metadata_from_test_files(rootname_path,
-                                                           'detector'),
+                  'first_ingest_date': date.today(),
+                  'last_ingest_date': date.today(),
+                  'detector': detector,
+                  'proposid': int(proposid) if proposid else None,
                   'proposal_type': proposal_type}
-    insert_or_update('Master', data_dict)
+    if write_rows(upsert_row, ('Master', data_dict), connection) is False:
+        return None
     logging.info('{}: Updated master table.'.format(rootname))
 
+    # Add the proposal to the proposals table if it is not yet there
+    if connection is None:
+        update_proposals_table(proposid)
+
+    return data_dict
+
+
+def make_images(file_dict):
+    """Make the JPEG and thumbnail of the given file, as appropriate
+    for its filetype.
+
+    Parameters
+    ----------
+    file_dict : dict
+        A dictionary containing various data useful for the ingestion
+        process.
+    """
+
+    if file_dict['filetype'] in ['raw', 'flt', 'flc']:
+        make_jpeg(file_dict)
+    if file_dict['filetype'] == 'flt':
+        make_thumbnail(file_dict)
+
 
-def ingest(rootname_path, filetype='all'):
+def ingest(rootname_path, filetype='all', tables=None, exts=None,
+           skip_master=False, skip_datasets=False, skip_images=False,
+           force=False, connection=None, deferred_images=None):
     """The main function of the ingest module.  Ingest a given rootname
     (and its associated files) into the various tables of the ``acsql``
     database.
 
+    The work may be limited to specific header tables or extensions,
+    and the ``master`` table, ``datasets`` table, and JPEG/thumbnail
+    stages may be skipped, so that a rootname can be re-ingested into
+    a single header table (e.g. after fixing a bug) without any
+    unnecessary I/O or database writes.
+
+    Files that have not changed since they were last ingested (see
+    ``check_file_fingerprint``) are skipped, unless ``force`` is
+    ``True`` or the work is limited to specific tables or extensions.
+
     If for some reason the file is unable to be ingested, a warning is
     logged.
 
+    By default, the rows of the rootname are committed as they are
+    written.  If a ``connection`` is supplied, they are instead all
+    written as part of its current transaction (see ``ingest_group``).
+
     Parameters
     ----------
     rootname_path : str
         The path to the rootname directory in the MAST cache.
+    filetype : str, optional
+        The filetype to ingest (e.g. ``flt``), or ``all``.
+    tables : list, optional
+        If supplied, only the given header tables (e.g.
+        ``['wfc_spt_1']``) are updated, and only the files of their
+        filetypes are read.
+    exts : list, optional
+        If supplied, only the given header extensions (e.g. ``[0]``)
+        are ingested.
+    skip_master : bool, optional
+        If ``True``, the ``master`` table is not updated.  The rootname
+        must then already exist in the ``master`` table.
+    skip_datasets : bool, optional
+        If ``True``, the ``datasets`` table is not updated.
+    skip_images : bool, optional
+        If ``True``, JPEGs and thumbnails are not made.
+    force : bool, optional
+        If ``True``, files are ingested even if they have not changed.
+    connection : obj or list, optional
+        If supplied, every row of the rootname is written with the
+        given ``sqlalchemy`` connection, as part of its current
+        transaction, which the caller commits or rolls back.  If a
+        list, the writes are instead appended to it, to be applied by
+        a writer process (see ``write_rows``).
+    deferred_images : list, optional
+        If supplied, the ``file_dict`` of each file whose JPEG and
+        thumbnail are to be made is appended to it instead, so that
+        the caller can make them once the rows are committed (see
+        ``make_images``).
+
+    Returns
+    -------
+    stats : dict
+        The number of ``files`` considered, the number of unchanged
+        files that were skipped (``skipped_files``), the number of
+        files whose headers were unchanged (``skipped_headers``), and
+        the total size of the skipped files (``skipped_bytes``).
     """
 
     rootname = os.path.basename(rootname_path)[:-1]
     logging.info('{}: Begin ingestion'.format(rootname))
 
+    stats = {'files': 0, 'skipped_files': 0, 'skipped_headers': 0,
+             'skipped_bytes': 0}
+
+    # Fingerprints only describe files that were fully ingested
+    use_fingerprints = not tables and exts is None
+    store_fingerprints = use_fingerprints and not (skip_master or
+                                                   skip_datasets or skip_images)
+
     # Update the master table for the rootname
-    update_master_table(rootname_path)
+    if skip_master:
+        session, base, engine = load_connection(SETTINGS['connection_string'])
+        result = session.query(Master.proposal_type)\
+            .filter(Master.rootname == rootname).first()
+        session.close()
+        engine.dispose()
+        if result is None:
+            logging.warning('{}: Not in master table; skipping'.format(rootname))
+            return stats
+        master_dict = {'proposal_type': result[0]}
+    else:
+        master_dict = update_master_table(rootname_path, connection)
+        if master_dict is None:
+            logging.warning('{}: Not written to master table; skipping'
+                            .format(rootname))
+            return stats
+
+    if tables:
+        tables = [table.lower() for table in tables]
+        filetypes = set([table.split('_')[1] for table in tables])
+    else:
+        filetypes = set(VALID_FILETYPES)
 
     if filetype == 'all':
         search = '*.fits'
@@ -313,26 +891,205 @@ def ingest(rootname_path, filetype='all'):
         search = '*{}.fits'.format(filetype)
     file_paths = glob.glob(os.path.join(rootname_path, search))
 
+    # The rows of the rootname, written together once all files are read
+    header_rows = []
+    datasets_dict = {}
+    fingerprints = []
+
     for filename in file_paths:
         filetype = os.path.basename(filename).split('.')[0][10:]
-        if filetype in VALID_FILETYPES:
+        if filetype in VALID_FILETYPES and filetype in filetypes:
+            stats['files'] += 1
+
+            # Skip the file if it has not changed since it was ingested
+            status = 'changed'
+            if use_fingerprints:
+                status, fingerprint = check_file_fingerprint(filename)
+                if force:
+                    status = 'changed'
+                elif status == 'unchanged':
+                    stats['skipped_files'] += 1
+                    stats['skipped_bytes'] += fingerprint['size']
+                    continue
 
             # Make dictionary that holds all the information you would ever
             # want about the file
             file_dict = make_file_dict(filename)
+            file_dict['proposal_type'] = master_dict['proposal_type']
+            file_dict['rows_written'] = True
 
-            # Update header tables
-            if 'file_exts' in file_dict:
+            # Update header tables, unless only the data has changed.  The
+            # file is only fingerprinted if all of its headers are ingested
+            ingested = 'file_exts' in file_dict
+            if status == 'headers_unchanged':
+                stats['skipped_headers'] += 1
+            elif 'file_exts' in file_dict:
                 for ext in file_dict['file_exts']:
-                    update_header_table(file_dict, ext)
+                    table = '{}_{}_{}'.format(file_dict['detector'].lower(),
+                                              file_dict['filetype'], ext)
+                    if tables and table not in tables:
+                        continue
+                    if exts is not None and ext not in exts:
+                        continue
+                    header_row = update_header_table(file_dict, ext,
+                                                     connection)
+                    if header_row is False:
+                        ingested = False
+                    elif header_row is not None:
+                        header_rows.append(header_row)
 
-                # Update datasets table
-                update_datasets_table(file_dict)
+            if 'file_exts' in file_dict:
+
+                # Add the file to the datasets table entry
+                if not skip_datasets:
+                    datasets_dict['rootname'] = file_dict['rootname']
+                    datasets_dict[file_dict['filetype']] = \
+                        file_dict['basename']
 
                 # Make JPEGs and Thumbnails
-                if file_dict['filetype'] in ['raw', 'flt', 'flc']:
-                    make_jpeg(file_dict)
-                if file_dict['filetype'] == 'flt':
-                    make_thumbnail(file_dict)
+                if not skip_images:
+                    if deferred_images is None:
+                        make_images(file_dict)
+                    else:
+                        deferred_images.append(file_dict)
+
+            if store_fingerprints and ingested and file_dict['rows_written']:
+                fingerprints.append(fingerprint)
+
+    # Update the header tables and the datasets table for the rootname
+    failed_rows = update_rootname_tables(header_rows, datasets_dict or None,
+                                         connection)
+
+    # The files are only fingerprinted once all of their rows are written
+    # (the datasets table entry belongs to every file of the rootname)
+    failed_filenames = [input_dict.get('filename')
+                        for table, input_dict in failed_rows]
+    for fingerprint in fingerprints:
+        if None in failed_filenames \
+                or fingerprint['filename'] in failed_filenames:
+            continue
+        update_file_fingerprints_table(fingerprint, connection)
+
+    # Write the missing keywords found so far, if enough have accumulated
+    # (outside of the caller's transaction, once it is committed)
+    if connection is None:
+        flush_missing_keywords(force=False)
 
+    if stats['skipped_files'] or stats['skipped_headers']:
+        logging.info('{}: Skipped {} unchanged files and the headers of {} '
+                     'files'.format(rootname, stats['skipped_files'],
+                                    stats['skipped_headers']))
     logging.info('{}: End ingestion'.format(rootname))
+
+    return stats
+
+
+def ingest_group(rootname_paths, filetype='all', tables=None, exts=None,
+                 skip_master=False, skip_datasets=False, skip_images=False,
+                 force=False):
+    """Ingest the given rootnames with a single database transaction,
+    so that all of their rows become visible at once and are committed
+    together.
+
+    If any rootname fails to be ingested, the whole transaction is
+    rolled back.  The rootnames of a failed group are then ingested
+    again one transaction at a time, so that only the rootnames that
+    fail are left out of the database.  The Parquet mirror is not
+    rolled back.
+
+    To keep the transaction short, the increments of the
+    ``aggregate_counts`` table are applied just before it is committed
+    (see ``acsql.database.aggregates.defer_counts``), so that its rows
+    are not locked while the files are read, and JPEGs and thumbnails
+    are only made once it is committed.
+
+    Parameters
+    ----------
+    rootname_paths : list
+        The paths to the rootname directories in the MAST cache.
+    filetype : str, optional
+        The filetype to ingest (e.g. ``flt``), or ``all``.
+    tables : list, optional
+        If supplied, only the given header tables are updated.
+    exts : list, optional
+        If supplied, only the given header extensions are ingested.
+    skip_master : bool, optional
+        If ``True``, the ``master`` table is not updated.
+    skip_datasets : bool, optional
+        If ``True``, the ``datasets`` table is not updated.
+    skip_images : bool, optional
+        If ``True``, JPEGs and thumbnails are not made.
+    force : bool, optional
+        If ``True``, files are ingested even if they have not changed.
+
+    Returns
+    -------
+    stats : dict
+        The sum of the statistics returned by ``ingest`` for each
+        rootname that was ingested.
+    """
+
+    stats = {'files': 0, 'skipped_files': 0, 'skipped_headers': 0,
+             'skipped_bytes': 0}
+    args = (filetype, tables, exts, skip_master, skip_datasets, skip_images,
+            force)
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    deferred_images = []
+    try:
+        with engine.begin() as connection:
+            defer_counts()
+            results = [ingest(rootname_path, *args, connection=connection,
+                              deferred_images=deferred_images)
+                       for rootname_path in rootname_paths]
+            apply_deferred_counts(connection)
+    except Exception as e:
+        discard_deferred_counts()
+        session.close()
+        engine.dispose()
+
+        if len(rootname_paths) == 1:
+            logging.warning('{}: Unable to ingest, rolled back: {}'.format(
+                os.path.basename(rootname_paths[0])[:-1], e))
+            return stats
+
+        logging.warning('Unable to ingest group of {} rootnames, rolled back; '
+                        'retrying individually: {}'.format(
+                            len(rootname_paths), e))
+        results = [ingest_group([rootname_path], *args)
+                   for rootname_path in rootname_paths]
+        for key in stats:
+            stats[key] = sum(result[key] for result in results)
+        return stats
+
+    # Add the proposals of the rootnames, now that they are committed.
+    # From here on, a failure is only logged, as the rows of the group
+    # can no longer be rolled back
+    if not skip_master:
+        rootnames = [os.path.basename(rootname_path)[:-1]
+                     for rootname_path in rootname_paths]
+        proposids = session.query(Master.proposid)\
+            .filter(Master.rootname.in_(rootnames)).distinct().all()
+        for proposid, in proposids:
+            try:
+                update_proposals_table(proposid)
+            except Exception as e:
+                logging.warning('{}: Unable to update proposals table: {}'
+                                .format(proposid, e))
+
+    session.close()
+    engine.dispose()
+
+    for file_dict in deferred_images:
+        try:
+            make_images(file_dict)
+        except Exception as e:
+            logging.warning('{}: Unable to make images of {}: {}'.format(
+                file_dict['rootname'], file_dict['basename'], e))
+
+    flush_missing_keywords(force=False)
+
+    for key in stats:
+        stats[key] = sum(result[key] for result in results)
+
+    return stats
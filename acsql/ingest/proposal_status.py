@@ -0,0 +1,314 @@
+"""Populates the ``proposals`` table of the ``acsql`` database with
+proposal status information (e.g. proposal title, cycle, and
+schedule).
+
+The proposal status information is scraped from the STScI proposal
+status webpage for a given proposal.  This is done during ingestion
+(for proposals that do not yet exist in the ``proposals`` table) and
+periodically by the ``update_proposals`` script, so that the web
+application only ever needs to read from the ``proposals`` table.
+
+The status webpage of each proposal is scraped at most once by each
+process (see ``get_proposal_status``), and also provides the proposal
+type of the ``master`` table entries of the proposal (see
+``acsql.ingest.ingest.get_proposal_type``).  Failures to scrape or
+record a proposal are logged rather than raised, so that they never
+fail an ingestion.
+
+The scraper used to retrieve the status webpage is pluggable.  By
+default, the webpage is requested over HTTP.  If the ``proposal_dir``
+setting is set in the ``config.yaml`` file, the status webpages are
+instead read from ``<proposal_dir>/<proposid>.html``, which allows for
+a local fixture to stand in for the STScI webpage.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported and used by
+    ``acsql.ingest.ingest.py`` and ``acsql.scripts.update_proposals``
+    as such:
+    ::
+
+        from acsql.ingest.proposal_status import update_proposals_table
+        update_proposals_table(proposid)
+
+    A specific scraper can also be supplied:
+    ::
+
+        from acsql.ingest.proposal_status import make_file_scraper
+        scraper = make_file_scraper('/path/to/fixtures/')
+        update_proposals_table(proposid, scraper=scraper, refresh=True)
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``requests``
+"""
+
+import datetime
+import html
+import logging
+import os
+
+import requests
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import SQLAlchemyError
+
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import Proposals
+from acsql.utils.utils import SETTINGS
+
+# The parsed status webpages scraped by this process, keyed by proposid
+STATUS_CACHE = {}
+
+
+def get_status_page_url(proposid):
+    """Return the URL of the STScI proposal status webpage for the
+    given ``proposid``.
+
+    Parameters
+    ----------
+    proposid : int or str
+        The proposal ID (e.g. ``12345``).
+
+    Returns
+    -------
+    url : str
+        The URL of the proposal status webpage.
+    """
+
+    url = ('http://www.stsci.edu/cgi-bin/get-proposal-info?id={}'
+           '&submit=Go&observatory=HST').format(proposid)
+
+    return url
+
+
+def scrape_status_page(proposid):
+    """Return the contents of the STScI proposal status webpage for
+    the given ``proposid``, or ``None`` if the request fails.
+
+    Parameters
+    ----------
+    proposid : int or str
+        The proposal ID (e.g. ``12345``).
+
+    Returns
+    -------
+    status_string : str or None
+        The HTML contents of the proposal status webpage.
+    """
+
+    url = get_status_page_url(proposid)
+
+    try:
+        req = requests.get(url, timeout=10)
+    except requests.exceptions.RequestException as e:
+        logging.warning('Request failed: {}: {}'.format(url, e))
+        return None
+
+    if not req.ok:
+        logging.warning('Request failed: {}'.format(url))
+        return None
+
+    return req.content.decode()
+
+
+def make_file_scraper(proposal_dir):
+    """Return a scraper that reads proposal status webpages from
+    ``<proposal_dir>/<proposid>.html`` rather than requesting them
+    over HTTP.
+
+    Parameters
+    ----------
+    proposal_dir : str
+        The directory containing the saved proposal status webpages.
+
+    Returns
+    -------
+    scraper : function
+        A function that takes a ``proposid`` and returns the contents
+        of the corresponding file, or ``None`` if it does not exist.
+    """
+
+    def scraper(proposid):
+        filename = os.path.join(proposal_dir, '{}.html'.format(proposid))
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'r') as f:
+            status_string = f.read()
+        return status_string
+
+    return scraper
+
+
+def get_scraper():
+    """Return the scraper configured by the ``config.yaml`` file.
+
+    Returns
+    -------
+    scraper : function
+        A function that takes a ``proposid`` and returns the contents
+        of its proposal status webpage (or ``None``).
+    """
+
+    proposal_dir = SETTINGS.get('proposal_dir')
+    if proposal_dir:
+        return make_file_scraper(proposal_dir)
+    else:
+        return scrape_status_page
+
+
+def get_proposal_status(proposid, scraper=None, refresh=False):
+    """Return the parsed proposal status webpage of the given
+    ``proposid``, scraping it only if this process has not already
+    done so.
+
+    Parameters
+    ----------
+    proposid : int or str
+        The proposal ID (e.g. ``12345``).
+    scraper : function, optional
+        A function that takes a ``proposid`` and returns the contents
+        of its proposal status webpage.  If not supplied, the scraper
+        from ``get_scraper()`` is used.
+    refresh : bool, optional
+        If ``True``, the webpage is scraped even if it already was.
+
+    Returns
+    -------
+    status_dict : dict or None
+        The dictionary returned by ``parse_status_page``, or ``None``
+        if the webpage cannot be scraped.
+    """
+
+    proposid = int(proposid)
+    if proposid in STATUS_CACHE and not refresh:
+        return STATUS_CACHE[proposid]
+
+    if scraper is None:
+        scraper = get_scraper()
+
+    try:
+        status_string = scraper(proposid)
+        status_dict = None
+        if status_string is not None:
+            status_dict = parse_status_page(status_string)
+    except Exception as e:
+        logging.warning('Unable to scrape proposal status for {}: {}'
+                        .format(proposid, e))
+        return None
+
+    STATUS_CACHE[proposid] = status_dict
+
+    return status_dict
+
+
+def parse_status_page(status_string):
+    """Parse the ``title``, ``cycle``, ``schedule``, and
+    ``proposal_type`` out of the contents of a proposal status webpage.
+
+    Parameters
+    ----------
+    status_string : str
+        The HTML contents of the proposal status webpage.
+
+    Returns
+    -------
+    status_dict : dict
+        A dictionary with ``title``, ``cycle``, ``schedule``, and
+        ``proposal_type`` keys.  Any values that cannot be determined
+        are ``None``.
+    """
+
+    status_dict = {'title': None, 'cycle': None, 'schedule': None,
+                   'proposal_type': None}
+
+    try:
+        status_dict['title'] = html.unescape(status_string.
+            split('<b>Title:</b> ')[1].
+            split('<br>')[0])
+    except IndexError:
+        pass
+
+    try:
+        status_dict['cycle'] = html.unescape(status_string.
+            split('<b>Cycle:</b> ')[1].
+            split('<br>')[0])
+    except IndexError:
+        pass
+
+    try:
+        status_dict['schedule'] = html.unescape(status_string.
+            split('/proposal-help-HST.html#')[2].
+            split('">')[0])
+    except IndexError:
+        pass
+
+    try:
+        status_dict['proposal_type'] = status_string.\
+            split('prop_type">')[1].\
+            split('</a>')[0].strip()
+    except IndexError:
+        pass
+
+    return status_dict
+
+
+def update_proposals_table(proposid, scraper=None, refresh=False):
+    """Insert/update an entry in the ``proposals`` table for the given
+    ``proposid``.
+
+    Parameters
+    ----------
+    proposid : int or str
+        The proposal ID (e.g. ``12345``).
+    scraper : function, optional
+        A function that takes a ``proposid`` and returns the contents
+        of its proposal status webpage.  If not supplied, the scraper
+        from ``get_scraper()`` is used.
+    refresh : bool, optional
+        If ``False`` (the default), the proposal is only scraped if it
+        does not yet exist in the ``proposals`` table.
+    """
+
+    if not proposid:
+        return
+
+    proposid = int(proposid)
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+
+    try:
+        exists = session.query(Proposals.proposid)\
+            .filter(Proposals.proposid == proposid).count()
+
+        if not exists or refresh:
+            status_dict = get_proposal_status(proposid, scraper, refresh)
+
+            if status_dict is None:
+                logging.warning('Cannot determine proposal status for {}'
+                                .format(proposid))
+            else:
+                data_dict = {key: status_dict[key]
+                             for key in ['title', 'cycle', 'schedule']}
+                data_dict['proposid'] = proposid
+                data_dict['last_updated'] = datetime.datetime.now()
+                session.merge(Proposals(data_dict))
+                session.commit()
+                logging.info('{}: Updated proposals table.'.format(proposid))
+
+    # Another process inserted the proposal first
+    except IntegrityError:
+        session.rollback()
+
+    except SQLAlchemyError as e:
+        session.rollback()
+        logging.warning('{}: Unable to update proposals table: {}'.format(
+            proposid, e))
+
+    session.close()
+    engine.dispose()
@@ -0,0 +1,485 @@
+"""Ingests rootnames into the ``acsql`` database with one or a few
+dedicated writer processes.
+
+In this mode, the ingestion workers only read the files and produce
+the rows of each rootname (see ``acsql.ingest.ingest.write_rows``),
+which they send over a queue to the writer processes.  Each writer
+gathers the rows of up to ``WRITER_BATCH_SIZE`` rootnames from the
+queue, merges them per table, and applies them in a single transaction
+with batched statements, so that the workers neither wait on database
+locks nor open connections of their own for every write.
+
+If a batch fails because of a deadlock or lock wait timeout, it is
+retried with exponential backoff.  If it still fails (or fails for
+another reason), the rootnames of the batch are written one at a time,
+so that only the rootnames that fail are left out of the database.
+When a single rootname is written, any of its rows that cannot be
+inserted are logged and skipped, as in the other ingestion modes, and
+its files are then not fingerprinted, so that they are ingested again.
+
+Each writer periodically logs the depth of the queue and the number of
+rows that it writes per second, which can be used to size the pool of
+ingestion workers.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This module is intended to be imported from and used by the
+    ``ingest_production`` script as such:
+    ::
+
+        from acsql.ingest.writer import ingest_with_writers
+        ingest_with_writers(rootnames, args, writers=1)
+
+Dependencies
+------------
+    External library dependencies include:
+
+    - ``acsql``
+    - ``sqlalchemy``
+"""
+
+from collections import OrderedDict
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import time
+
+from sqlalchemy import bindparam
+from sqlalchemy import select
+from sqlalchemy.exc import DataError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import InternalError
+from sqlalchemy.exc import OperationalError
+
+from acsql.database import database_interface
+from acsql.database.aggregates import increment_counts
+from acsql.database.database_interface import load_connection
+from acsql.database.missing_keywords import flush_missing_keywords
+from acsql.ingest.ingest import ingest
+from acsql.ingest.ingest import upsert_row
+from acsql.ingest.proposal_status import update_proposals_table
+from acsql.utils.utils import replace_rows
+from acsql.utils.utils import SETTINGS
+
+# The maximum number of rootnames whose rows are written per transaction
+WRITER_BATCH_SIZE = 50
+
+# The maximum number of rootnames waiting in the queue, after which the
+# ingestion workers wait for the writers
+WRITER_QUEUE_SIZE = 500
+
+# The number of times a batch is retried after a deadlock, and the
+# number of seconds waited before the first retry (which doubles with
+# each retry)
+WRITER_MAX_RETRIES = 5
+WRITER_RETRY_DELAY = 0.5
+
+# The number of seconds between reports of the queue depth and rate
+WRITER_REPORT_INTERVAL = 30
+
+# The queue of the ingestion workers of this process (see
+# ``set_write_queue``)
+WRITE_QUEUE = [None]
+
+
+def _get_queue_depth(write_queue):
+    """Return the approximate number of rootnames in the given queue,
+    or ``None`` if it cannot be determined on this platform.
+
+    Parameters
+    ----------
+    write_queue : obj
+        The ``multiprocessing.Queue`` of the writers.
+
+    Returns
+    -------
+    depth : int or None
+        The approximate number of rootnames in the queue.
+    """
+
+    try:
+        return write_queue.qsize()
+    except NotImplementedError:
+        return None
+
+
+def _group_by_columns(rows):
+    """Group the given rows by their set of columns, so that each group
+    can be written with a single batched statement.
+
+    Parameters
+    ----------
+    rows : list
+        A list of dictionaries of column/value pairs.
+
+    Returns
+    -------
+    groups : OrderedDict
+        A dictionary whose keys are tuples of (sorted) column names and
+        whose values are the lists of rows with those columns.
+    """
+
+    groups = OrderedDict()
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    return groups
+
+
+def upsert_rows(table, rows, connection, skip_failed_rows=False):
+    """Insert or update the given rows of the given ``table`` with
+    batched statements, and increment the record count of the table by
+    the number of rows inserted.
+
+    This is the batched equivalent of ``upsert_row``.  Rows of the same
+    rootname are merged, with later values taking precedence.
+
+    Parameters
+    ----------
+    table : str
+        The name of the table (i.e. its ORM, e.g. ``Master``).
+    rows : list
+        A list of dictionaries containing the data to insert/update.
+    connection : obj
+        The ``sqlalchemy`` connection with which to write the rows.
+    skip_failed_rows : bool, optional
+        If ``True``, new rows are inserted one at a time, and rows that
+        cannot be inserted are logged and skipped (as by
+        ``acsql.utils.utils.insert_or_update``) rather than failing the
+        whole transaction.
+
+    Returns
+    -------
+    num_rows : int
+        The number of rows that were written, excluding any that were
+        skipped.
+    """
+
+    table_obj = getattr(database_interface, table).__table__
+
+    merged_rows = OrderedDict()
+    for row in rows:
+        merged_rows.setdefault(row['rootname'], {}).update(row)
+
+    results = connection.execute(select([table_obj.c.rootname])
+        .where(table_obj.c.rootname.in_(list(merged_rows))))
+    existing_rootnames = set(result[0] for result in results)
+
+    new_rows = [row for rootname, row in merged_rows.items()
+                if rootname not in existing_rootnames]
+    if skip_failed_rows:
+        inserted_rows = []
+        for row in new_rows:
+            try:
+                connection.execute(table_obj.insert(), row)
+                inserted_rows.append(row)
+            except (DataError, IntegrityError, InternalError) as e:
+                logging.warning('\tUnable to insert {} into {}: {}'.format(
+                                row['rootname'], table, e))
+        new_rows = inserted_rows
+    else:
+        for columns, group in _group_by_columns(new_rows).items():
+            connection.execute(table_obj.insert(), group)
+
+    existing_rows = [row for rootname, row in merged_rows.items()
+                     if rootname in existing_rootnames]
+    for columns, group in _group_by_columns(existing_rows).items():
+        columns = [column for column in columns if column != 'rootname']
+        if not columns:
+            continue
+        update = table_obj.update()\
+            .where(table_obj.c.rootname == bindparam('b_rootname'))\
+            .values({column: bindparam(column) for column in columns})
+        connection.execute(update, [dict(row, b_rootname=row['rootname'])
+                                    for row in group])
+
+    increment_counts({('table', table.lower()): len(new_rows)}, connection)
+
+    return len(new_rows) + len(existing_rows)
+
+
+def apply_writes(writes, connection, skip_failed_rows=False):
+    """Apply the given writes of one or more rootnames.
+
+    The ``upsert_row`` and ``replace_rows`` writes of each table are
+    merged and applied with batched statements, in the order in which
+    the tables were first written to (so that, e.g., the ``master``
+    table is written before the tables that refer to it).  Any other
+    writes are applied one at a time.
+
+    If any rows are skipped, the ``file_fingerprints`` table is not
+    written, so that the files are ingested again (its rows are the
+    last to be written for each rootname, see
+    ``acsql.ingest.ingest.ingest``).
+
+    Parameters
+    ----------
+    writes : list
+        A list of ``(function, args)`` tuples (see
+        ``acsql.ingest.ingest.write_rows``).
+    connection : obj
+        The ``sqlalchemy`` connection with which to write the rows.
+    skip_failed_rows : bool, optional
+        If ``True``, rows that cannot be inserted are skipped (see
+        ``upsert_rows``).
+
+    Returns
+    -------
+    num_rows : int
+        The number of rows that were written.
+    """
+
+    groups = OrderedDict()
+    for function, args in writes:
+        if function is upsert_row:
+            key = (function, args[0])
+            groups.setdefault(key, []).append(args[1])
+        elif function is replace_rows:
+            key = (function, args[0], tuple(args[1]))
+            groups.setdefault(key, []).append(args)
+        else:
+            groups.setdefault((function,), []).append(args)
+
+    num_rows = 0
+    rows_skipped = False
+    for key, items in groups.items():
+        function = key[0]
+        if function is upsert_row:
+            num_written = upsert_rows(key[1], items, connection,
+                                      skip_failed_rows)
+            num_rows += num_written
+            if num_written < len(set(row['rootname'] for row in items)):
+                rows_skipped = True
+        elif function is replace_rows and key[1] == 'FileFingerprints' \
+                and rows_skipped:
+            logging.warning('\tNot fingerprinting {} files, as some of their '
+                            'rows were skipped'.format(
+                                sum(len(args[2]) for args in items)))
+        elif function is replace_rows:
+            rows, matches = [], []
+            for args in items:
+                rows.extend(args[2])
+                if len(args) > 3 and args[3]:
+                    matches.extend(args[3])
+            replace_rows(key[1], list(key[2]), rows, matches,
+                         connection=connection)
+            num_rows += len(rows)
+        else:
+            for args in items:
+                function(*args, connection=connection)
+
+    return num_rows
+
+
+def write_payloads(payloads, engine):
+    """Write the rows of the given rootnames in a single transaction.
+
+    The transaction is retried with exponential backoff if it fails
+    because of a deadlock or lock wait timeout.  If it cannot be
+    written, the rootnames are written one transaction at a time, in
+    which case the rows of a rootname that cannot be inserted are
+    skipped (see ``upsert_rows``).
+
+    Parameters
+    ----------
+    payloads : list
+        A list of ``(rootname, writes)`` tuples, as sent by the
+        ingestion workers.
+    engine : obj
+        The ``sqlalchemy`` engine of the writer.
+
+    Returns
+    -------
+    num_rows : int
+        The number of rows that were written.
+    """
+
+    writes = [write for rootname, rootname_writes in payloads
+              for write in rootname_writes]
+
+    for attempt in range(WRITER_MAX_RETRIES + 1):
+        try:
+            with engine.begin() as connection:
+                return apply_writes(writes, connection,
+                                    skip_failed_rows=len(payloads) == 1)
+        except OperationalError as e:
+            error = e
+            if attempt == WRITER_MAX_RETRIES:
+                break
+            delay = WRITER_RETRY_DELAY * 2**attempt * random.uniform(1, 1.5)
+            logging.warning('Unable to write {} rootnames ({}); retrying in '
+                            '{:.1f} s'.format(len(payloads), e.orig, delay))
+            time.sleep(delay)
+        except Exception as e:
+            error = e
+            break
+
+    if len(payloads) > 1:
+        logging.warning('Unable to write {} rootnames, rolled back; writing '
+                        'individually: {}'.format(len(payloads), error))
+        return sum(write_payloads([payload], engine) for payload in payloads)
+
+    logging.warning('{}: Unable to write, rolled back: {}'.format(
+        payloads[0][0], error))
+
+    return 0
+
+
+def run_writer(write_queue, index=0):
+    """Write the rows that the ingestion workers send over the given
+    queue, until a ``None`` sentinel is received.
+
+    Parameters
+    ----------
+    write_queue : obj
+        The ``multiprocessing.Queue`` of ``(rootname, writes)`` tuples.
+    index : int, optional
+        The number of the writer, used in its log messages.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+
+    start = last_report = time.time()
+    num_rootnames = num_rows = 0
+    done = False
+
+    while not done:
+
+        # Gather up to a batch of rootnames, waiting only for the first
+        payloads = [write_queue.get()]
+        while len(payloads) < WRITER_BATCH_SIZE:
+            try:
+                payloads.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # Leave the sentinels of the other writers in the queue
+        num_sentinels = payloads.count(None)
+        if num_sentinels:
+            done = True
+            payloads = [payload for payload in payloads if payload is not None]
+            for i in range(num_sentinels - 1):
+                write_queue.put(None)
+
+        if payloads:
+            num_rows += write_payloads(payloads, engine)
+            num_rootnames += len(payloads)
+
+        now = time.time()
+        if now - last_report >= WRITER_REPORT_INTERVAL or done:
+            logging.info('Writer {}: queue depth {}, wrote {} rows of {} '
+                         'rootnames ({:.1f} rows/s)'.format(
+                             index, _get_queue_depth(write_queue), num_rows,
+                             num_rootnames, num_rows / max(now - start, 1e-6)))
+            last_report = now
+
+    session.close()
+    engine.dispose()
+
+
+def set_write_queue(write_queue):
+    """Set the queue to which the ingestion workers of this process
+    send the rows of each rootname (used as the initializer of the
+    process pool).
+
+    Parameters
+    ----------
+    write_queue : obj
+        The ``multiprocessing.Queue`` of the writers.
+    """
+
+    WRITE_QUEUE[0] = write_queue
+
+
+def queue_rootname(rootname_path, *args):
+    """Read the files of the given rootname and send its rows to the
+    writers, instead of writing them to the database.
+
+    Parameters
+    ----------
+    rootname_path : str
+        The path to the rootname directory in the MAST cache.
+    *args
+        The remaining positional arguments of
+        ``acsql.ingest.ingest.ingest`` (i.e. ``filetype``, ``tables``,
+        ``exts``, ``skip_master``, ``skip_datasets``, ``skip_images``,
+        and ``force``).
+
+    Returns
+    -------
+    stats : dict
+        The statistics returned by ``acsql.ingest.ingest.ingest``.
+    """
+
+    writes = []
+    stats = ingest(rootname_path, *args, connection=writes)
+    if writes:
+        WRITE_QUEUE[0].put((os.path.basename(rootname_path)[:-1], writes))
+
+    # The proposals table does not depend on the rows of the rootname, so
+    # it is updated here rather than by the writers
+    for function, function_args in writes:
+        if function is upsert_row and function_args[0] == 'Master':
+            update_proposals_table(function_args[1]['proposid'])
+
+    flush_missing_keywords(force=False)
+
+    return stats
+
+
+def ingest_with_writers(rootname_paths, args=(), writers=1):
+    """Ingest the given rootnames with a pool of ``ncores`` ingestion
+    workers, which send the rows of each rootname to the given number
+    of writer processes.
+
+    Parameters
+    ----------
+    rootname_paths : list
+        The paths to the rootname directories in the MAST cache.
+    args : tuple, optional
+        The remaining positional arguments of
+        ``acsql.ingest.ingest.ingest`` (see ``queue_rootname``).
+    writers : int, optional
+        The number of writer processes.
+
+    Returns
+    -------
+    results : list
+        The statistics returned by ``acsql.ingest.ingest.ingest`` for
+        each rootname.
+    """
+
+    write_queue = multiprocessing.Queue(maxsize=WRITER_QUEUE_SIZE)
+    processes = [multiprocessing.Process(target=run_writer,
+                                         args=(write_queue, index))
+                 for index in range(writers)]
+    for process in processes:
+        process.start()
+
+    # Always stop the writers, even if the ingestion workers fail, so
+    # that the rows queued so far are written and no process is left
+    # waiting on the queue
+    try:
+        pool = multiprocessing.Pool(processes=SETTINGS['ncores'],
+                                    initializer=set_write_queue,
+                                    initargs=(write_queue,))
+        try:
+            mp_args = [(rootname_path,) + tuple(args)
+                       for rootname_path in rootname_paths]
+            results = pool.starmap(queue_rootname, mp_args)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for process in processes:
+            write_queue.put(None)
+        for process in processes:
+            process.join()
+
+    return results
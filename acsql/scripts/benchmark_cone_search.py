@@ -0,0 +1,186 @@
+#! /usr/bin/env python
+
+"""Benchmarks cone searches against the ``observations`` table of the
+``acsql`` database.
+
+For a number of randomly chosen search centers, the time to perform an
+indexed cone search (i.e. using the ``sky_pixel`` column, see
+``acsql.database.sky_index``) is compared to the time to perform the
+same search by scanning the ``ra_targ`` and ``dec_targ`` columns of
+every row.  The two methods are also checked to return the same
+rootnames.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This script is inteneded to be executed from the command line as
+    such:
+    ::
+
+        python benchmark_cone_search.py [-n|--num_searches] [-r|--radius]
+
+    Parameters:
+    (Optional) [-n|--num_searches] - The number of cone searches to
+        perform.  The default is 100.
+    (Optional) [-r|--radius] - The radius of each cone search, in
+        arcminutes.  The default is 5.
+"""
+
+import argparse
+import random
+import time
+
+from acsql.database.database_interface import Observations
+from acsql.database.database_interface import session
+from acsql.database.queries import rootnames_in_cone
+from acsql.database.sky_index import angular_separation
+
+
+def full_scan_cone_search(ra, dec, radius):
+    """Return the rootnames of observations within ``radius`` degrees
+    of the given position by checking the coordinates of every row.
+
+    Parameters
+    ----------
+    ra : float
+        The right ascension (in degrees) of the center of the cone.
+    dec : float
+        The declination (in degrees) of the center of the cone.
+    radius : float
+        The radius (in degrees) of the cone.
+
+    Returns
+    -------
+    rootnames : list
+        The rootnames within the cone.
+    """
+
+    results = session.query(Observations.rootname, Observations.ra_targ,
+                            Observations.dec_targ).all()
+
+    rootnames = [rootname for rootname, ra_targ, dec_targ in results
+                 if ra_targ is not None and dec_targ is not None
+                 and angular_separation(ra, dec, ra_targ, dec_targ) <= radius]
+
+    return rootnames
+
+
+def get_search_centers(num_searches):
+    """Return the centers of the cone searches to perform.
+
+    Half of the centers are the positions of existing observations (so
+    that the searches return results), and the rest are uniformly
+    distributed over the sky.
+
+    Parameters
+    ----------
+    num_searches : int
+        The number of search centers to return.
+
+    Returns
+    -------
+    centers : list
+        A list of ``(ra, dec)`` tuples.
+    """
+
+    results = session.query(Observations.ra_targ, Observations.dec_targ)\
+        .filter(Observations.ra_targ.isnot(None))\
+        .filter(Observations.dec_targ.isnot(None)).all()
+
+    centers = []
+    for i in range(num_searches):
+        if results and i % 2 == 0:
+            centers.append(random.choice(results))
+        else:
+            ra = random.uniform(0., 360.)
+            dec = random.uniform(-90., 90.)
+            centers.append((ra, dec))
+
+    return centers
+
+
+def benchmark_cone_search(num_searches, radius):
+    """Time the indexed and full scan cone searches and print a
+    summary.
+
+    Parameters
+    ----------
+    num_searches : int
+        The number of cone searches to perform.
+    radius : float
+        The radius of each cone search, in arcminutes.
+    """
+
+    radius = radius / 60.
+    centers = get_search_centers(num_searches)
+
+    indexed_time, full_scan_time, num_results, mismatches = 0., 0., 0, 0
+    for ra, dec in centers:
+
+        start = time.time()
+        indexed_rootnames = rootnames_in_cone(ra, dec, radius)
+        indexed_time += time.time() - start
+
+        start = time.time()
+        full_scan_rootnames = full_scan_cone_search(ra, dec, radius)
+        full_scan_time += time.time() - start
+
+        num_results += len(indexed_rootnames)
+        if set(indexed_rootnames) != set(full_scan_rootnames):
+            mismatches += 1
+
+    session.close()
+
+    print('{} cone searches of radius {} arcmin'.format(num_searches,
+                                                          radius * 60.))
+    print('Total results: {}'.format(num_results))
+    print('Indexed:   {:.4f} s per search'.format(indexed_time / num_searches))
+    print('Full scan: {:.4f} s per search'.format(full_scan_time / num_searches))
+    print('Mismatched searches: {}'.format(mismatches))
+
+
+def parse_args():
+    """Parse command line arguments. Returns ``args`` object
+
+    Returns
+    -------
+    args : obj
+        An argparse object containing all of the arguments
+    """
+
+    # Create help strings
+    num_searches_help = 'The number of cone searches to perform.  The '
+    num_searches_help += 'default is 100.'
+    radius_help = 'The radius of each cone search, in arcminutes.  The '
+    radius_help += 'default is 5.'
+
+    # Add arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n --num_searches',
+                        dest='num_searches',
+                        action='store',
+                        type=int,
+                        required=False,
+                        default=100,
+                        help=num_searches_help)
+    parser.add_argument('-r --radius',
+                        dest='radius',
+                        action='store',
+                        type=float,
+                        required=False,
+                        default=5.,
+                        help=radius_help)
+
+    # Parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    benchmark_cone_search(args.num_searches, args.radius)
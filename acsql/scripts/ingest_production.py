@@ -23,7 +23,10 @@ Use
     ::
 
         python ingest_production.py [-i|--ingest_filelist]
-            ['-f|--filetype']
+            ['-f|--filetype'] ['-t|--tables'] ['-e|--exts']
+            ['--skip_master'] ['--skip_datasets'] ['--skip_images']
+            ['--force'] ['-g|--group_size'] ['-w|--writers']
+            ['-b|--backfill_table'] ['-c|--backfill_columns']
 
     Parameters:
     (Optional) [-i|--ingest_filelist] - A text file containing
@@ -34,6 +37,48 @@ Use
     (Optional) [-f|--filetype] - The type of file to ingest.  May be
         an indivual filetype (e.g. ``flt``) or ``all`` to ingest all
         filetypes.  ``all`` is the default value.
+    (Optional) [-t|--tables] - A comma-separated list of the header
+        tables (e.g. ``wfc_spt_1``) to update.  Only the files of their
+        filetypes are read.  If no ingest filelist is supplied, every
+        rootname of their detectors in the ``acsql`` database is
+        re-ingested.
+    (Optional) [-e|--exts] - A comma-separated list of the header
+        extensions (e.g. ``0,1``) to ingest.
+    (Optional) [--skip_master] - Do not update the ``master`` table.
+    (Optional) [--skip_datasets] - Do not update the ``datasets``
+        table.
+    (Optional) [--skip_images] - Do not make JPEGs and thumbnails.
+    (Optional) [--force] - Ingest every file, even those that have not
+        changed since they were last ingested.  By default, unchanged
+        files are skipped (see ``acsql.ingest.ingest``), unless specific
+        tables or extensions are given.
+    (Optional) [-g|--group_size] - Ingest the rootnames in groups of
+        this many, with all of the database rows of each group written
+        in a single transaction (see ``acsql.ingest.ingest.ingest_group``).
+        A group that fails is rolled back and its rootnames are retried
+        one transaction at a time.  By default (``0``), rows are
+        committed as they are written.
+    (Optional) [-w|--writers] - Write the database rows with this many
+        dedicated writer processes (see ``acsql.ingest.writer``), to
+        which the ``ncores`` ingestion workers send the rows of each
+        rootname.  The writers batch the rows of several rootnames per
+        transaction, so ``--group_size`` is not used.  If ``0``, the
+        ingestion workers write their own rows.  By default, a single
+        writer is used for ``SQLite`` databases when ``ncores`` is
+        greater than 1 (as ``SQLite`` allows only one writer at a time),
+        and no writers are used otherwise.
+    (Optional) [-b|--backfill_table] - Instead of ingesting, fill the
+        backfill columns of the given header table (e.g. ``wfc_raw_0``)
+        in the rows in which they are ``NULL``, e.g. after new columns
+        have been added to the table.  Existing values are never
+        overwritten.  Only the relevant extension header of the
+        relevant filetype is read, and no other tables (or JPEGs) are
+        updated, so the ``observations`` and ``reference_files`` tables
+        and the Parquet mirror are left stale; re-ingest the table with
+        ``--tables`` and ``--force`` to update them as well.  If an
+        ingest filelist is supplied, only its rootnames are backfilled.
+    (Optional) [-c|--backfill_columns] - A comma-separated list of the
+        columns to backfill.  Required with ``--backfill_table``.
 """
 
 import argparse
@@ -43,10 +88,94 @@ import multiprocessing
 import os
 
 from astropy.io import fits
+from sqlalchemy import or_
+from sqlalchemy import select
 
+from acsql.database import database_interface
 from acsql.database.database_interface import Master, session
+from acsql.ingest.ingest import backfill_header_columns
 from acsql.ingest.ingest import ingest
+from acsql.ingest.ingest import ingest_group
+from acsql.ingest.writer import ingest_with_writers
+from acsql.website.data_containers import invalidate_proposal_index
 from acsql.utils.utils import SETTINGS, setup_logging, VALID_FILETYPES
+from acsql.utils.utils import TABLE_DEFS
+
+# The number of files backfilled by each task of the process pool
+BACKFILL_CHUNK_SIZE = 200
+
+
+def backfill_production(table, columns, ingest_filelist):
+    """Fill the given ``columns`` of the given header ``table`` in
+    every row in which any of them is ``NULL`` (or, if provided, in
+    the rows of the rootnames in the ``ingest_filelist``).
+
+    The rows are backfilled in chunks of ``BACKFILL_CHUNK_SIZE`` by a
+    pool of ``ncores`` processes, each chunk with a single batched
+    ``UPDATE`` statement that only fills the ``NULL`` columns (see
+    ``acsql.ingest.ingest.backfill_header_columns``).  The
+    ``observations`` and ``reference_files`` tables and the Parquet
+    mirror are not updated.
+
+    Parameters
+    ----------
+    table : str
+        The name of the header table (e.g. ``wfc_raw_0``).
+    columns : list
+        The names of the columns to backfill.
+    ingest_filelist : str or None
+        The path to a file that contains rootnames to backfill.
+
+    Raises
+    ------
+    ValueError
+        If the ``table`` is not a header table, or no ``columns`` are
+        given.
+    """
+
+    if table.lower() not in TABLE_DEFS:
+        raise ValueError('{} is not a valid header table'.format(table))
+    columns = [column.lower() for column in columns or []
+               if column.lower() not in ['rootname', 'filename']]
+    if not columns:
+        raise ValueError('No columns of {} to backfill'.format(table))
+
+    table_obj = database_interface.base.metadata.tables[table.lower()]
+
+    # Determine the files to backfill
+    query = select([table_obj.c.rootname, table_obj.c.filename, Master.path])\
+        .select_from(table_obj.join(Master.__table__,
+                                    table_obj.c.rootname == Master.rootname))
+    if ingest_filelist:
+        with open(ingest_filelist) as f:
+            rootnames = [rootname.strip().lower()[:8] for rootname in f]
+        query = query.where(table_obj.c.rootname.in_(rootnames))
+    else:
+        query = query.where(or_(*[table_obj.c[column].is_(None)
+                                  for column in columns]))
+    results = session.execute(query).fetchall()
+    session.close()
+
+    # The master table paths start with a slash (e.g. /jabc/jabc01aaq)
+    files = [(rootname, os.path.join(SETTINGS['filesystem'], path.lstrip('/'),
+                                     filename))
+             for rootname, filename, path in results]
+    logging.info('{} {} rows to backfill'.format(len(files), table))
+
+    chunks = [files[i:i + BACKFILL_CHUNK_SIZE]
+              for i in range(0, len(files), BACKFILL_CHUNK_SIZE)]
+    mp_args = [(table.lower(), columns, chunk) for chunk in chunks]
+
+    pool = multiprocessing.Pool(processes=SETTINGS['ncores'])
+    num_updated = sum(pool.starmap(backfill_header_columns, mp_args))
+    pool.close()
+    pool.join()
+
+    logging.info('Backfilled {} of {} {} rows'.format(num_updated, len(files),
+                                                     table))
+    logging.info('The observations and reference_files tables and the '
+                 'Parquet mirror were not updated')
+    logging.info('Process Complete.')
 
 
 def get_rootnames_to_ingest():
@@ -85,7 +214,44 @@ def get_rootnames_to_ingest():
     return rootnames_to_ingest
 
 
-def ingest_production(filetype, ingest_filelist):
+def get_rootnames_to_reingest(tables):
+    """Return a list of paths to the rootnames in the ``acsql``
+    database that are of the detectors of the given header ``tables``.
+
+    Parameters
+    ----------
+    tables : list
+        The header tables (e.g. ``['wfc_spt_1']``).
+
+    Returns
+    -------
+    rootnames_to_reingest : list
+        A list of full paths to rootnames in the filesystem.  Rootnames
+        whose directory does not exist are left out (with a warning).
+    """
+
+    detectors = set([table.split('_')[0].upper() for table in tables])
+    results = session.query(Master.path)\
+        .filter(Master.detector.in_(detectors)).all()
+    session.close()
+
+    # The master table paths start with a slash (e.g. /jabc/jabc01aaq)
+    rootnames_to_reingest = []
+    for item in results:
+        rootname_path = os.path.join(SETTINGS['filesystem'], item[0].lstrip('/'))
+        if os.path.isdir(rootname_path):
+            rootnames_to_reingest.append(rootname_path)
+        else:
+            logging.warning('{} does not exist; skipping'.format(rootname_path))
+    logging.info('{} rootnames to re-ingest'.format(len(rootnames_to_reingest)))
+
+    return rootnames_to_reingest
+
+
+def ingest_production(filetype, ingest_filelist, tables=None, exts=None,
+                      skip_master=False, skip_datasets=False,
+                      skip_images=False, force=False, group_size=0,
+                      writers=None):
     """Perform ingestion on the given filelist of rootnames (or if not
     provided, any new rootnames that exist in the MAST filesystem but
     not in the ``acsql`` database) for the given ``filetype`` (or all
@@ -98,7 +264,31 @@ def ingest_production(filetype, ingest_filelist):
     ingest_filelist : str or None
         The path to a file that contains rootnames to ingest.  If
         ``None``, then the acsql database and MAST filesystem are
-        used to determine new rootnames to ingest.
+        used to determine new rootnames to ingest (or, if ``tables``
+        is supplied, every rootname of the tables' detectors in the
+        ``acsql`` database is re-ingested).
+    tables : list, optional
+        If supplied, only the given header tables (e.g.
+        ``['wfc_spt_1']``) are updated.
+    exts : list, optional
+        If supplied, only the given header extensions are ingested.
+    skip_master : bool, optional
+        If ``True``, the ``master`` table is not updated.
+    skip_datasets : bool, optional
+        If ``True``, the ``datasets`` table is not updated.
+    skip_images : bool, optional
+        If ``True``, JPEGs and thumbnails are not made.
+    force : bool, optional
+        If ``True``, files are ingested even if they have not changed
+        since they were last ingested.
+    group_size : int, optional
+        If greater than ``0``, the rootnames are ingested in groups of
+        this many, each in a single database transaction.
+    writers : int, optional
+        If greater than ``0``, the database rows are written by this
+        many dedicated writer processes.  By default, a single writer
+        is used for ``SQLite`` databases when ``ncores`` is greater
+        than 1 and no ``group_size`` is given.
     """
 
     if ingest_filelist:
@@ -106,13 +296,47 @@ def ingest_production(filetype, ingest_filelist):
             rootnames = f.readlines()
         rootnames = [rootname.strip().lower() for rootname in rootnames]
         rootnames = [os.path.join(SETTINGS['filesystem'], rootname[0:4], rootname) for rootname in rootnames]
+    elif tables:
+        rootnames = get_rootnames_to_reingest(tables)
     else:
         rootnames = get_rootnames_to_ingest()
 
-    pool = multiprocessing.Pool(processes=SETTINGS['ncores'])
-    filetypes = [filetype for item in rootnames]
-    mp_args = [(rootname, filetype) for rootname, filetype in zip(rootnames, filetypes)]
-    pool.starmap(ingest, mp_args)
+    # SQLite serializes writes, so a single writer avoids lock contention
+    if writers is None:
+        sqlite = 'sqlite' in SETTINGS['connection_string']
+        writers = int(sqlite and SETTINGS['ncores'] > 1 and not group_size)
+
+    args = (filetype, tables, exts, skip_master, skip_datasets, skip_images,
+            force)
+    if writers > 0:
+        results = ingest_with_writers(rootnames, args, writers)
+    else:
+        pool = multiprocessing.Pool(processes=SETTINGS['ncores'])
+        if group_size > 0:
+            groups = [rootnames[i:i + group_size]
+                      for i in range(0, len(rootnames), group_size)]
+            results = pool.starmap(ingest_group,
+                                   [(group,) + args for group in groups])
+        else:
+            results = pool.starmap(ingest,
+                                   [(rootname,) + args for rootname in rootnames])
+
+        # Let the workers exit cleanly, so that they write any pending
+        # entries of the missing_keywords table
+        pool.close()
+        pool.join()
+
+    # Report how much work was skipped for unchanged files
+    stats = {key: sum(result[key] for result in results)
+             for key in ['files', 'skipped_files', 'skipped_headers',
+                         'skipped_bytes']}
+    logging.info('Skipped {} of {} files ({:.1f} MB) and the headers of {} '
+                 'files'.format(stats['skipped_files'], stats['files'],
+                                stats['skipped_bytes'] / 1024**2,
+                                stats['skipped_headers']))
+
+    # Make the web application list any newly ingested proposals
+    invalidate_proposal_index()
 
     logging.info('Process Complete.')
 
@@ -137,6 +361,30 @@ def parse_args():
     ingest_filelist_help = 'A file containing a list of rootnames to ingest. '
     ingest_filelist_help += 'If not provided, then the acsql database is used '
     ingest_filelist_help += 'to determine which files get ingested.'
+    tables_help = 'A comma-separated list of the header tables (e.g. '
+    tables_help += 'wfc_spt_1) to update.  If no ingest filelist is '
+    tables_help += 'provided, every rootname of their detectors in the acsql '
+    tables_help += 'database is re-ingested.'
+    exts_help = 'A comma-separated list of the header extensions (e.g. 0,1) '
+    exts_help += 'to ingest.'
+    skip_master_help = 'Do not update the master table.'
+    skip_datasets_help = 'Do not update the datasets table.'
+    skip_images_help = 'Do not make JPEGs and thumbnails.'
+    force_help = 'Ingest every file, even those that have not changed since '
+    force_help += 'they were last ingested.'
+    group_size_help = 'Ingest the rootnames in groups of this many, each in '
+    group_size_help += 'a single database transaction.  By default (0), rows '
+    group_size_help += 'are committed as they are written.'
+    writers_help = 'Write the database rows with this many dedicated writer '
+    writers_help += 'processes, to which the ingestion workers send the rows '
+    writers_help += 'of each rootname.  If 0, the ingestion workers write '
+    writers_help += 'their own rows.  By default, a single writer is used for '
+    writers_help += 'SQLite databases when ncores is greater than 1.'
+    backfill_table_help = 'Instead of ingesting, fill the columns of the '
+    backfill_table_help += 'given header table (e.g. wfc_raw_0) in the rows '
+    backfill_table_help += 'in which they are NULL.'
+    backfill_columns_help = 'A comma-separated list of the columns to '
+    backfill_columns_help += 'backfill.  Required with backfill_table.'
 
     # Add arguments
     parser = argparse.ArgumentParser()
@@ -152,6 +400,64 @@ def parse_args():
                         required=False,
                         default=None,
                         help=ingest_filelist_help)
+    parser.add_argument('-t --tables',
+                        dest='tables',
+                        action='store',
+                        required=False,
+                        default=None,
+                        help=tables_help)
+    parser.add_argument('-e --exts',
+                        dest='exts',
+                        action='store',
+                        required=False,
+                        default=None,
+                        help=exts_help)
+    parser.add_argument('--skip_master',
+                        dest='skip_master',
+                        action='store_true',
+                        required=False,
+                        help=skip_master_help)
+    parser.add_argument('--skip_datasets',
+                        dest='skip_datasets',
+                        action='store_true',
+                        required=False,
+                        help=skip_datasets_help)
+    parser.add_argument('--skip_images',
+                        dest='skip_images',
+                        action='store_true',
+                        required=False,
+                        help=skip_images_help)
+    parser.add_argument('--force',
+                        dest='force',
+                        action='store_true',
+                        required=False,
+                        help=force_help)
+    parser.add_argument('-g --group_size',
+                        dest='group_size',
+                        action='store',
+                        type=int,
+                        required=False,
+                        default=0,
+                        help=group_size_help)
+    parser.add_argument('-w --writers',
+                        dest='writers',
+                        action='store',
+                        type=int,
+                        required=False,
+                        default=None,
+                        help=writers_help)
+    parser.add_argument('-b --backfill_table',
+                        dest='backfill_table',
+                        action='store',
+                        required=False,
+                        default=None,
+                        help=backfill_table_help)
+    parser.add_argument('-c --backfill_columns',
+                        dest='backfill_columns',
+                        action='store',
+                        required=False,
+                        default=None,
+                        help=backfill_columns_help)
 
     # Parse args
     args = parser.parse_args()
@@ -186,6 +492,37 @@ def test_args(args):
         assert os.path.exists(args.ingest_filelist),\
             '{} does not exist.'.format(args.ingest_filelist)
 
+    # Ensure that the tables and extensions are valid
+    if args.tables:
+        for table in args.tables.split(','):
+            assert table.lower() in TABLE_DEFS,\
+                '{} is not a valid header table'.format(table)
+    if args.exts:
+        for ext in args.exts.split(','):
+            assert ext.isdigit(), '{} is not a valid extension'.format(ext)
+
+    # Ensure that the group size is valid
+    assert args.group_size >= 0,\
+        '{} is not a valid group size'.format(args.group_size)
+    assert args.writers is None or args.writers >= 0,\
+        '{} is not a valid number of writers'.format(args.writers)
+
+    # Ensure that the backfill table is a header table with the columns
+    if args.backfill_table:
+        assert args.backfill_table.lower() in TABLE_DEFS,\
+            '{} is not a valid header table'.format(args.backfill_table)
+        assert args.backfill_columns,\
+            'backfill_table requires backfill_columns'
+        tables = database_interface.base.metadata.tables
+        table_obj = tables[args.backfill_table.lower()]
+        for column in args.backfill_columns.split(','):
+            assert column.lower() in table_obj.columns,\
+                '{} is not a column of {}'.format(column,
+                                                  args.backfill_table)
+    else:
+        assert not args.backfill_columns,\
+            'backfill_columns requires backfill_table'
+
 
 if __name__ == '__main__':
 
@@ -193,4 +530,15 @@ if __name__ == '__main__':
     setup_logging(module)
 
     args = parse_args()
-    ingest_production(args.filetype, args.ingest_filelist)
+    if args.backfill_table:
+        backfill_production(args.backfill_table,
+                            args.backfill_columns.split(','),
+                            args.ingest_filelist)
+    else:
+        tables = args.tables.split(',') if args.tables else None
+        exts = [int(ext) for ext in args.exts.split(',')] if args.exts \
+            else None
+        ingest_production(args.filetype, args.ingest_filelist, tables, exts,
+                          args.skip_master, args.skip_datasets,
+                          args.skip_images, args.force, args.group_size,
+                          args.writers)
@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+
+"""Adds the ``proposid`` column, and its index, to the ``master`` table
+of an existing ``acsql`` database, and fills it from the
+``<detector>_raw_0`` tables.
+
+The ``proposid`` column of the ``master`` table is written during
+ingestion (see ``acsql.ingest.ingest.update_master_table``), and is
+used by the web application to list the rootnames of each proposal.
+Databases that were created before the column existed do not have it,
+so this script adds the column (if it does not exist) and the
+``ix_master_proposid_rootname`` index (if it does not exist), and then
+fills the column of every row in which it is ``NULL`` with one
+``UPDATE`` statement per detector.  The script can safely be run more
+than once.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This script is inteneded to be executed from the command line as
+    such:
+    ::
+
+        python migrate_master_proposid.py
+"""
+
+import logging
+import os
+
+from sqlalchemy import inspect
+from sqlalchemy import select
+
+from acsql.database import database_interface
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import Master
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import setup_logging
+
+
+def add_proposid_column(engine):
+    """Add the ``proposid`` column and its index to the ``master``
+    table, if they do not already exist.
+
+    Parameters
+    ----------
+    engine : obj
+        The ``engine`` used to connect to the ``acsql`` database.
+    """
+
+    master = Master.__table__
+    inspector = inspect(engine)
+
+    existing_columns = [column['name'] for column in
+                        inspector.get_columns('master')]
+    if 'proposid' not in existing_columns:
+        column_type = master.c.proposid.type.compile(dialect=engine.dialect)
+        engine.execute('ALTER TABLE master ADD COLUMN proposid {};'
+                       .format(column_type))
+        logging.info('Added proposid column to master table')
+
+    existing_indexes = [index['name'] for index in
+                        inspector.get_indexes('master')]
+    for index in master.indexes:
+        if 'proposid' in index.columns and index.name not in existing_indexes:
+            index.create(bind=engine)
+            logging.info('Created {} index'.format(index.name))
+
+
+def fill_proposids(engine):
+    """Fill the ``proposid`` column of every row of the ``master``
+    table in which it is ``NULL`` from the ``<detector>_raw_0`` table
+    of its detector.
+
+    Parameters
+    ----------
+    engine : obj
+        The ``engine`` used to connect to the ``acsql`` database.
+    """
+
+    master = Master.__table__
+
+    with engine.begin() as connection:
+        for detector in ['WFC', 'HRC', 'SBC']:
+            table = getattr(database_interface,
+                            '{}_raw_0'.format(detector)).__table__
+            proposid = select([table.c.proposid])\
+                .where(table.c.rootname == master.c.rootname)\
+                .limit(1).as_scalar()
+            update = master.update()\
+                .where(master.c.detector == detector)\
+                .where(master.c.proposid.is_(None))\
+                .values(proposid=proposid)
+            result = connection.execute(update)
+            logging.info('Filled proposid of {} {} rows of master table'
+                         .format(result.rowcount, detector))
+
+
+def migrate_master_proposid():
+    """The main function of the ``migrate_master_proposid`` module.
+    See module documentation for further details.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+
+    add_proposid_column(engine)
+    fill_proposids(engine)
+
+    session.close()
+    engine.dispose()
+
+    logging.info('Process Complete.')
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    migrate_master_proposid()
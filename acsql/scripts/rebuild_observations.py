@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+
+"""Rebuilds the ``observations`` table of the ``acsql`` database from
+the ``master`` and ``<detector>_raw_0`` tables.
+
+The ``observations`` table is kept in sync during ingestion (see
+``acsql.ingest.ingest.update_observations_table``), as are the name
+index used for wildcard searches (see ``acsql.database.name_index``)
+and the aggregate counts (see ``acsql.database.aggregates``).
+This script is intended to be used to populate these tables for an
+existing database, or to re-sync them after tables have been modified
+by hand.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This script is inteneded to be executed from the command line as
+    such:
+    ::
+
+        python rebuild_observations.py
+"""
+
+import logging
+import os
+
+from sqlalchemy import bindparam
+from sqlalchemy import func
+from sqlalchemy import null
+from sqlalchemy import select
+
+from acsql.database import database_interface
+from acsql.database.aggregates import rebuild_aggregates
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import Master
+from acsql.database.database_interface import Observations
+from acsql.database.name_index import rebuild_name_index
+from acsql.database.sky_index import get_sky_pixel
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import setup_logging
+
+
+def update_sky_pixels(engine):
+    """Set the ``sky_pixel`` column of every row in the
+    ``observations`` table from its ``ra_targ`` and ``dec_targ``.
+
+    Parameters
+    ----------
+    engine : obj
+        The ``engine`` used to connect to the ``acsql`` database.
+    """
+
+    observations = Observations.__table__
+    results = engine.execute(select([observations.c.rootname,
+                                     observations.c.ra_targ,
+                                     observations.c.dec_targ])).fetchall()
+
+    update = observations.update()\
+        .where(observations.c.rootname == bindparam('_rootname'))\
+        .values(sky_pixel=bindparam('_sky_pixel'))
+    rows = [{'_rootname': rootname, '_sky_pixel': get_sky_pixel(ra, dec)}
+            for rootname, ra, dec in results]
+
+    with engine.begin() as connection:
+        for i in range(0, len(rows), 1000):
+            connection.execute(update, rows[i:i + 1000])
+
+    logging.info('Updated sky pixels for {} rows'.format(len(rows)))
+
+
+def rebuild_observations():
+    """Delete all rows from the ``observations`` table and repopulate
+    it with one ``INSERT ... SELECT`` statement per detector.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    observations = Observations.__table__
+    columns = [column.name for column in observations.columns]
+
+    with engine.begin() as connection:
+        connection.execute(observations.delete())
+
+        for detector in ['WFC', 'HRC', 'SBC']:
+            table = getattr(database_interface, '{}_raw_0'.format(detector))
+            select_columns = []
+            for column in columns:
+                if column == 'sky_pixel':
+                    select_columns.append(null())
+                elif column == 'detector':
+                    select_columns.append(func.upper(Master.detector))
+                elif column == 'proposal_type':
+                    select_columns.append(Master.proposal_type)
+                else:
+                    select_columns.append(getattr(table, column))
+            statement = select(select_columns)\
+                .select_from(table.__table__.join(Master.__table__))
+            result = connection.execute(
+                observations.insert().from_select(columns, statement))
+            logging.info('Inserted {} {} rows into observations table'
+                         .format(result.rowcount, detector))
+
+    # Compute the sky pixels, which cannot be computed by the database
+    update_sky_pixels(engine)
+
+    # Rebuild the name index used for wildcard searches
+    rebuild_name_index(engine)
+
+    # Recompute the aggregate counts, which depend on the observations
+    rebuild_aggregates(engine)
+
+    session.close()
+    engine.dispose()
+
+    logging.info('Process Complete.')
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    rebuild_observations()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+
+"""Rebuilds or compacts the Parquet mirror of the header tables of the
+``acsql`` database (see ``acsql.database.parquet_mirror``).
+
+The mirror is kept up to date during ingestion, which writes one small
+Parquet file per ingested file.  This script is intended to be used to
+export the mirror for an existing database, or to periodically merge
+the small files of each partition (with the ``-c`` option) so that
+column scans remain fast.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This script is inteneded to be executed from the command line as
+    such:
+    ::
+
+        python rebuild_parquet_mirror.py [-d|--datasets] [-c|--compact]
+
+    Parameters:
+    (Optional) [-d|--datasets] - A comma-separated list of the datasets
+        (e.g. ``flt_1,raw_0``) to rebuild or compact.  By default, every
+        dataset is rebuilt or compacted.
+    (Optional) [-c|--compact] - Compact the existing mirror instead of
+        rebuilding it.
+"""
+
+import argparse
+import logging
+import os
+
+from acsql.database.parquet_mirror import compact_parquet_mirror
+from acsql.database.parquet_mirror import rebuild_parquet_mirror
+from acsql.utils.utils import setup_logging
+
+
+def parse_args():
+    """Parse command line arguments. Returns ``args`` object
+
+    Returns
+    -------
+    args : obj
+        An argparse object containing all of the arguments
+    """
+
+    # Create help strings
+    datasets_help = 'A comma-separated list of the datasets (e.g. '
+    datasets_help += 'flt_1,raw_0) to rebuild or compact.  By default, '
+    datasets_help += 'every dataset is rebuilt or compacted.'
+    compact_help = 'Compact the existing mirror instead of rebuilding it.'
+
+    # Add arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d --datasets',
+                        dest='datasets',
+                        action='store',
+                        type=str,
+                        required=False,
+                        default=None,
+                        help=datasets_help)
+    parser.add_argument('-c --compact',
+                        dest='compact',
+                        action='store_true',
+                        required=False,
+                        help=compact_help)
+
+    # Parse args
+    args = parser.parse_args()
+
+    return args
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    args = parse_args()
+    datasets = args.datasets.split(',') if args.datasets else None
+
+    if args.compact:
+        compact_parquet_mirror(datasets)
+    else:
+        rebuild_parquet_mirror(datasets)
+
+    logging.info('Process Complete.')
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+
+"""Rebuilds the ``reference_files`` table of the ``acsql`` database
+from the reference file keywords (e.g. ``DARKFILE``) of the header
+tables.
+
+The ``reference_files`` table is kept in sync during ingestion (see
+``acsql.ingest.ingest.update_reference_files_table``).  This script is
+intended to be used to populate the table for an existing database, or
+to re-sync it after tables have been modified by hand.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This script is inteneded to be executed from the command line as
+    such:
+    ::
+
+        python rebuild_reference_files.py
+"""
+
+import logging
+import os
+
+from sqlalchemy import select
+
+from acsql.database import database_interface
+from acsql.database.database_interface import load_connection
+from acsql.database.database_interface import ReferenceFiles
+from acsql.ingest.ingest import get_reference_files
+from acsql.utils.utils import SETTINGS
+from acsql.utils.utils import setup_logging
+from acsql.utils.utils import TABLE_DEFS
+
+
+def rebuild_reference_files():
+    """Delete all rows from the ``reference_files`` table and
+    repopulate it from each header table that has reference file
+    keywords.
+    """
+
+    session, base, engine = load_connection(SETTINGS['connection_string'])
+    reference_files_table = ReferenceFiles.__table__
+    tables = database_interface.base.metadata.tables
+
+    with engine.begin() as connection:
+        connection.execute(reference_files_table.delete())
+
+        for table_name in sorted(TABLE_DEFS):
+            table = tables.get(table_name)
+            if table is None:
+                continue
+            keywords = [column.name for column in table.columns
+                        if column.name.endswith('file')
+                        or column.name.endswith('tab')]
+            if not keywords:
+                continue
+
+            columns = [table.c.rootname, table.c.filename]
+            columns.extend([table.c[keyword] for keyword in keywords])
+            results = connection.execute(select(columns)).fetchall()
+
+            rows = []
+            for result in results:
+                header_dict = dict(zip(keywords, result[2:]))
+                for keyword, reference_file in get_reference_files(header_dict):
+                    rows.append({'reference_file': reference_file,
+                                 'keyword': keyword,
+                                 'table_name': table_name,
+                                 'filename': result[1],
+                                 'rootname': result[0]})
+
+            for i in range(0, len(rows), 1000):
+                connection.execute(reference_files_table.insert(),
+                                   rows[i:i + 1000])
+            logging.info('Inserted {} {} rows into reference_files table'
+                         .format(len(rows), table_name))
+
+    session.close()
+    engine.dispose()
+
+    logging.info('Process Complete.')
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    rebuild_reference_files()
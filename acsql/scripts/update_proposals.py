@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+
+"""Refreshes the proposal status information (e.g. proposal title,
+cycle, and schedule) stored in the ``proposals`` table of the
+``acsql`` database.
+
+New proposals are added to the ``proposals`` table during ingestion.
+This script is intended to be run periodically in the background (e.g.
+via a cron job) to keep the status information of existing proposals
+up to date, as well as to fill in any proposals that could not be
+scraped during ingestion.
+
+See ``acsql.ingest.proposal_status.py`` module docstrings for further
+information.
+
+Authors
+-------
+    Matthew Bourque
+
+Use
+---
+    This script is inteneded to be executed from the command line as
+    such:
+    ::
+
+        python update_proposals.py [-d|--days] [-p|--proposal_dir]
+
+    Parameters:
+    (Optional) [-d|--days] - Only refresh proposals that have not been
+        updated in this many days.  The default is 7.
+    (Optional) [-p|--proposal_dir] - A directory containing saved
+        proposal status webpages (``<proposid>.html``) to use instead
+        of the STScI proposal status webpage.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+
+from acsql.database.database_interface import Master
+from acsql.database.database_interface import Proposals
+from acsql.database.database_interface import session
+from acsql.ingest.proposal_status import get_scraper
+from acsql.ingest.proposal_status import make_file_scraper
+from acsql.ingest.proposal_status import update_proposals_table
+from acsql.utils.utils import setup_logging
+
+
+def get_proposals_to_update(days):
+    """Return a list of proposal IDs whose status information is
+    either missing or older than the given number of ``days``.
+
+    Parameters
+    ----------
+    days : int
+        The age (in days) after which a proposal is refreshed.
+
+    Returns
+    -------
+    proposals_to_update : list
+        A list of proposal IDs.
+    """
+
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+
+    results = session.query(Master.proposid).distinct()\
+        .filter(Master.proposid.isnot(None)).all()
+    all_proposals = set([item[0] for item in results])
+
+    results = session.query(Proposals.proposid)\
+        .filter(Proposals.last_updated >= cutoff).all()
+    current_proposals = set([item[0] for item in results])
+
+    session.close()
+
+    proposals_to_update = sorted(all_proposals - current_proposals)
+
+    logging.info('{} proposals in database'.format(len(all_proposals)))
+    logging.info('{} proposals to update'.format(len(proposals_to_update)))
+
+    return proposals_to_update
+
+
+def update_proposals(days, proposal_dir):
+    """Refresh the ``proposals`` table entries that are missing or
+    older than the given number of ``days``.
+
+    Parameters
+    ----------
+    days : int
+        The age (in days) after which a proposal is refreshed.
+    proposal_dir : str or None
+        A directory of saved proposal status webpages to use instead
+        of the STScI proposal status webpage.
+    """
+
+    if proposal_dir:
+        scraper = make_file_scraper(proposal_dir)
+    else:
+        scraper = get_scraper()
+
+    for proposid in get_proposals_to_update(days):
+        update_proposals_table(proposid, scraper=scraper, refresh=True)
+
+    logging.info('Process Complete.')
+
+
+def parse_args():
+    """Parse command line arguments. Returns ``args`` object
+
+    Returns
+    -------
+    args : obj
+        An argparse object containing all of the arguments
+    """
+
+    # Create help strings
+    days_help = 'Only refresh proposals that have not been updated in this '
+    days_help += 'many days.  The default is 7.'
+    proposal_dir_help = 'A directory containing saved proposal status '
+    proposal_dir_help += 'webpages (<proposid>.html) to use instead of the '
+    proposal_dir_help += 'STScI proposal status webpage.'
+
+    # Add arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d --days',
+                        dest='days',
+                        action='store',
+                        type=int,
+                        required=False,
+                        default=7,
+                        help=days_help)
+    parser.add_argument('-p --proposal_dir',
+                        dest='proposal_dir',
+                        action='store',
+                        required=False,
+                        default=None,
+                        help=proposal_dir_help)
+
+    # Parse args
+    args = parser.parse_args()
+
+    # Ensure that the proposal_dir exists
+    if args.proposal_dir:
+        assert os.path.exists(args.proposal_dir),\
+            '{} does not exist.'.format(args.proposal_dir)
+
+    return args
+
+
+if __name__ == '__main__':
+
+    module = os.path.basename(__file__).strip('.py')
+    setup_logging(module)
+
+    args = parse_args()
+    update_proposals(args.days, args.proposal_dir)
@@ -21,6 +21,7 @@ Use
     ::
 
         from acsql.utils.utils import FILE_EXTS
+        from acsql.utils.utils import INDEX_DEFS
         from acsql.utils.utils import TABLE_DEFS
 
 Dependencies
@@ -105,6 +106,11 @@ SKIPPABLE_HEADER_KEYWORDS = ['SIMPLE', 'BITPIX', 'NAXIS', 'EXTEND']
 # as foreign keys (root/file name, etc.)
 FOREIGN_KEY_HEADER_KEYWORDS = ['ROOTNAME', 'Filename', 'FILENAME', 'Ext']
 
+# Define header keywords which are never columns of the header tables, and
+# so are neither surveyed for the table definitions nor recorded as missing
+EXCLUDED_HEADER_KEYWORDS = ['HISTORY', 'COMMENT', 'CONTINUE', ''] \
+    + FOREIGN_KEY_HEADER_KEYWORDS + SKIPPABLE_HEADER_KEYWORDS
+
 def get_settings():
     """Returns the settings that are located in the acsql config file.
 
@@ -258,6 +264,54 @@ def build_keyword_list(files, ext):
     return keytypes
 
 
+def get_keyword_type(value):
+    """Return the table definition data type (e.g. ``Float``) of the
+    given header keyword ``value``.
+
+    Parameters
+    ----------
+    value : obj
+        The header keyword value.
+
+    Returns
+    -------
+    keyword_type : str or None
+        The data type (``String``, ``Integer``, ``Float``, or
+        ``Bool``), or ``None`` if the value is of an unsupported type.
+    """
+
+    keyword_types = {str: 'String', int: 'Integer', bool: 'Bool',
+                     float: 'Float'}
+
+    return keyword_types.get(type(value))
+
+
+def widen_keyword_type(keyword_type, other_keyword_type):
+    """Return the table definition data type that can hold values of
+    both of the given data types, i.e. ``Float`` for ``Integer`` and
+    ``Float``, and ``String`` for any other differing types.
+
+    Parameters
+    ----------
+    keyword_type : str
+        A data type (e.g. ``Integer``).
+    other_keyword_type : str
+        Another data type (e.g. ``Float``).
+
+    Returns
+    -------
+    keyword_type : str
+        The widened data type.
+    """
+
+    if keyword_type == other_keyword_type:
+        return keyword_type
+    elif set([keyword_type, other_keyword_type]) == set(['Integer', 'Float']):
+        return 'Float'
+    else:
+        return 'String'
+
+
 def get_table_defs():
     """Return a dictionary containing the columns for each database
     table, as taken from the table_definition text files.
@@ -292,13 +346,36 @@ def get_table_defs():
 TABLE_DEFS = get_table_defs()
 
 
-def insert_or_update(table, data_dict):
+def get_index_defs():
+    """Return a dictionary containing the index definitions for the
+    header tables, as taken from the ``index_definitions.yaml`` file.
+
+    Returns
+    -------
+    index_defs : dict
+        A dictionary whose keys are table name patterns (e.g.
+        '*_raw_0') and whose values are lists of indexes, where each
+        index is a list of column names.
+    """
+
+    index_def_file = os.path.join(os.path.dirname(__config__), 'database',
+                                  'index_definitions.yaml')
+    with open(index_def_file, 'r') as f:
+        index_defs = yaml.load(f)
+
+    return index_defs
+
+INDEX_DEFS = get_index_defs()
+
+
+def insert_or_update(table, data_dict, connection=None):
     """Insert or update a record in the given ``table`` with the data
     in the ``data_dict``.
 
     A record is inserted if the primary key of the record does not
     already exist in the ``table``.  A record is updated if it does
-    already exist.
+    already exist, in which case only the columns in the ``data_dict``
+    are changed.
 
     Parameters
     ----------
@@ -306,9 +383,37 @@ def insert_or_update(table, data_dict):
         The name of the table to insert/update into.
     data_dict : dict
         A dictionary containing the data to insert/update.
+    connection : obj, optional
+        If supplied, the record is written with the given
+        ``sqlalchemy`` connection, as part of its current transaction
+        (which the caller commits).  By default, a new connection is
+        made and the record is committed immediately.
+
+    Returns
+    -------
+    inserted : bool or None
+        ``True`` if a new record was inserted, ``False`` if an existing
+        record was updated, or ``None`` if the insert failed.
     """
 
     table_obj = getattr(acsql.database.database_interface, table)
+
+    if connection is not None:
+        tab = table_obj.__table__
+        where = tab.c.rootname == data_dict['rootname']
+        exists = connection.execute(
+            sqlalchemy.select([tab.c.rootname]).where(where)).first()
+        if exists is not None:
+            connection.execute(tab.update().where(where).values(data_dict))
+            return False
+        try:
+            connection.execute(tab.insert(), data_dict)
+            return True
+        except (DataError, IntegrityError, InternalError) as e:
+            logging.warning('\tUnable to insert {} into {}: {}'.format(
+                            data_dict['rootname'], table, e))
+            return None
+
     session, base, engine = acsql.database.database_interface.\
         load_connection(SETTINGS['connection_string'])
 
@@ -318,14 +423,17 @@ def insert_or_update(table, data_dict):
     query_count = query.count()
 
     # If there are no results, then perform an insert
+    inserted = False
     if not query_count:
         tab = Table(table.lower(), base.metadata, autoload=True)
         insert_obj = tab.insert()
         try:
             insert_obj.execute(data_dict)
+            inserted = True
         except (DataError, IntegrityError, InternalError) as e:
             logging.warning('\tUnable to insert {} into {}: {}'.format(
                             data_dict['rootname'], table, e))
+            inserted = None
 
     else:
         query.update(data_dict)
@@ -333,3 +441,59 @@ def insert_or_update(table, data_dict):
     session.commit()
     session.close()
     engine.dispose()
+
+    return inserted
+
+
+def replace_rows(table, keys, rows, matches=None, connection=None):
+    """Replace the records of the given ``table`` that match the given
+    ``rows`` (or ``matches``) on their ``keys`` columns with the
+    ``rows``.
+
+    The matching records are deleted with a single batched ``DELETE``
+    statement, and the ``rows`` are inserted with a single batched
+    ``INSERT`` statement.
+
+    Parameters
+    ----------
+    table : str
+        The name of the table (i.e. its ORM, e.g. ``Headers``).
+    keys : list
+        The columns that identify the records to replace (e.g.
+        ``['filename', 'ext']``).
+    rows : list
+        A list of dictionaries containing the data to insert.
+    matches : list, optional
+        A list of tuples of ``keys`` values whose records are deleted
+        in addition to those that match the ``rows``, so that records
+        can be removed even when there are no ``rows`` to replace them.
+    connection : obj, optional
+        If supplied, the records are written with the given
+        ``sqlalchemy`` connection, as part of its current transaction.
+        By default, they are written in a transaction of their own.
+    """
+
+    matches = set(tuple(match) for match in matches or []) | \
+        set(tuple(row[key] for key in keys) for row in rows)
+    if not matches:
+        return
+
+    if connection is None:
+        session, base, engine = acsql.database.database_interface.\
+            load_connection(SETTINGS['connection_string'])
+        with engine.begin() as connection:
+            replace_rows(table, keys, rows, matches, connection=connection)
+        session.close()
+        engine.dispose()
+        return
+
+    tab = getattr(acsql.database.database_interface, table).__table__
+
+    delete = tab.delete()
+    for key in keys:
+        delete = delete.where(tab.c[key] == sqlalchemy.bindparam('b_' + key))
+    connection.execute(delete, [{'b_' + key: value for key, value in
+                                 zip(keys, match)} for match in matches])
+
+    if rows:
+        connection.execute(tab.insert(), rows)
@@ -28,17 +28,15 @@ Dependencies
 
     - ``acsql``
     - ``flask``
-    - ``numpy``
 """
 
 from collections import OrderedDict
-import glob
-import os
 
-from flask import Flask, render_template, request, Response
-import numpy as np
+from flask import Flask, make_response, render_template, request, Response, url_for
 
 from acsql.utils.utils import SETTINGS
+from acsql.website.data_containers import get_proposal_index
+from acsql.website.data_containers import get_view_header_dict
 from acsql.website.data_containers import get_view_image_dict
 from acsql.website.data_containers import get_view_proposal_dict
 from acsql.website.data_containers import get_view_query_results_dict
@@ -49,6 +47,35 @@ from acsql.website.query_lib import get_query_results
 app = Flask(__name__)
 
 
+def _get_page_urls(page, num_pages):
+    """Return the URLs of the previous and next pages of the results
+    of the current query.
+
+    Parameters
+    ----------
+    page : int
+        The current page of results.
+    num_pages : int
+        The number of pages of results.
+
+    Returns
+    -------
+    page_urls : dict
+        A dictionary with ``prev`` and ``next`` keys, whose values are
+        ``None`` on the first and last page, respectively.
+    """
+
+    args = request.args.to_dict(flat=False)
+
+    page_urls = {'prev': None, 'next': None}
+    if page > 1:
+        page_urls['prev'] = url_for('database', **dict(args, page=page - 1))
+    if page < num_pages:
+        page_urls['next'] = url_for('database', **dict(args, page=page + 1))
+
+    return page_urls
+
+
 @app.route('/archive/')
 def archive():
     """Returns webpage containing links to all ACS archive proposals.
@@ -59,15 +86,7 @@ def archive():
         The ``archive.html`` template.
     """
 
-    # Get list of all proposal numbers
-    proposal_list = glob.glob(os.path.join(SETTINGS['jpeg_dir'], '*'))
-    proposal_list = sorted([int(os.path.basename(item)) for item in proposal_list])
-
-    # rearrange list so that it appears in multiple columns
-    ncols = 12
-    if len(proposal_list) % ncols != 0:
-            proposal_list.extend([''] * (ncols - (len(proposal_list) % ncols)))
-    proposal_array = np.asarray(proposal_list).reshape(ncols, int(len(proposal_list) / ncols)).T
+    proposal_array = get_proposal_index()['proposal_array']
 
     return render_template('archive.html', proposal_array=proposal_array)
 
@@ -95,6 +114,9 @@ def database():
             num_results = query_results_dict['num_results']
             output_format = query_results_dict['output_format']
             output_columns = query_results_dict['output_columns']
+            page = query_results_dict['page']
+            num_pages = query_results_dict['num_pages']
+            page_urls = _get_page_urls(page, num_pages)
 
             # If something went wrong with the query
             if num_results is None:
@@ -120,7 +142,10 @@ def database():
                         'database_table.html',
                         results=results,
                         num_results=num_results,
-                        output_columns=output_columns)
+                        output_columns=output_columns,
+                        page=page,
+                        num_pages=num_pages,
+                        page_urls=page_urls)
 
                 # For CSV output format
                 elif output_format == ['csv']:
@@ -130,7 +155,7 @@ def database():
                 # For Thumbnail output format
                 elif output_format == ['thumbnails']:
                     thumbnail_dict = get_view_query_results_dict(query_results_dict)
-                    template = render_template('view_query_results.html', thumbnail_dict=thumbnail_dict)
+                    template = render_template('view_query_results.html', thumbnail_dict=thumbnail_dict, page_urls=page_urls)
 
                 else:
                     template = render_template('database_error.html', form=query_form)
@@ -195,13 +220,48 @@ def page_not_found(error):
     return render_template('404.html'), 404
 
 
-# @app.route('/archive/<proposal>/<filename>/<fits_type/header/')
-# def view_header(proposal, filename, fits_type):
-#     """
-#     """
+@app.route('/archive/<proposal>/<filename>/<fits_type>/headers/')
+def view_header(proposal, filename, fits_type):
+    """Returns webpage for viewing the headers of a single FITS file.
 
-#     header_dict = get_view_header_dict()
-#     return render_template('header.html', header_dict=header_dict)
+    The headers are served from the ``headers`` table of the ``acsql``
+    database, so the FITS file is never opened.  Since the headers of
+    a file rarely change, the response carries an ``ETag`` (derived
+    from the header checksums) and may be cached by the browser; a
+    request whose ``If-None-Match`` matches the ``ETag`` receives an
+    empty ``304`` response.
+
+    If an invalid ``fits_type`` is supplied, a 404 page is returned.
+
+    Parameters
+    ----------
+    proposal : str
+        The proposal ID (e.g. ``'12345'``).
+    filename : str
+        The 9-character IPPPSSOOT rootname (e.g. ``jcye04zsq``.)
+    fits_type : str
+        The FITS type of the file (e.g. ``flt``).
+
+    Returns
+    -------
+    response : obj
+        The ``header.html`` template response.
+    """
+
+    if not fits_type.isalnum():
+        return render_template('404.html'), 404
+
+    header_dict = get_view_header_dict(filename, fits_type)
+    response = make_response(render_template('header.html',
+                                             header_dict=header_dict))
+
+    if header_dict['etag']:
+        response.set_etag(header_dict['etag'])
+        response.headers['Cache-Control'] = 'public, max-age={}'.format(
+            SETTINGS.get('header_cache_max_age', 86400))
+        response = response.make_conditional(request)
+
+    return response
 
 
 @app.route('/archive/<proposal>/<filename>/')
@@ -254,10 +314,7 @@ def view_proposal(proposal):
         The ``view_proposal.html`` template.
     """
 
-    proposal_list = glob.glob(os.path.join(SETTINGS['jpeg_dir'], '*'))
-    proposal_list = [item.split('/')[-1] for item in proposal_list]
-
-    if proposal in proposal_list:
+    if proposal in get_proposal_index()['proposals']:
         proposal_dict = get_view_proposal_dict(proposal)
         return render_template('view_proposal.html', proposal_dict=proposal_dict)
     else:
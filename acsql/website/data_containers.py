@@ -18,9 +18,12 @@ Use
     as such:
     ::
 
+        from acsql.website.data_containers import get_proposal_index
+        from acsql.website.data_containers import get_view_header_dict
         from acsql.website.data_containers import get_view_image_dict
         from acsql.website.data_containers import get_view_proposal_dict
 
+        header_dict = get_view_header_dict(filename, fits_type)
         image_dict = get_view_image_dict(proposal, filename, fits_type)
         proposal_dict = get_view_proposal_dict(proposal)
 
@@ -28,18 +31,40 @@ Dependencies
 ------------
 
     - ``acsql``
+    - ``numpy``
+    - ``sqlalchemy``
 """
 
 
+from collections import OrderedDict
 import glob
-import html
+import hashlib
+from html import escape
 import os
-import requests
+import time
+import zlib
+
+import numpy as np
+from sqlalchemy import func
 
 from acsql.database import database_interface
+from acsql.database.database_interface import Datasets
+from acsql.database.database_interface import Headers
 from acsql.database.database_interface import Master
+from acsql.database.database_interface import Proposals
+from acsql.ingest.proposal_status import get_status_page_url
 from acsql.utils.utils import SETTINGS
 
+# The maximum number of rootnames to place in a single ``IN`` clause
+METADATA_CHUNK_SIZE = 500
+
+# The in-memory proposal index (see ``get_proposal_index``)
+PROPOSAL_INDEX = {'proposals': frozenset(), 'proposal_array': None,
+                  'num_images': {}, 'expires': 0, 'built': 0}
+
+# The file in the ``jpeg_dir`` whose modification time marks the last
+# time that the proposal index was invalidated
+PROPOSAL_INDEX_STAMP = '.proposal_index'
 
 def _get_image_lists(data_dict, fits_type):
     """Add a list of JPEG and Thumbnail paths to the ``data_dict``
@@ -67,10 +92,77 @@ def _get_image_lists(data_dict, fits_type):
     return data_dict
 
 
+def _get_image_position(data_dict):
+    """Add the position of the image within its proposal (``page``,
+    ``num_images``) and the filenames of the images before and after
+    it (``prev_filename``, ``next_filename``) to the ``data_dict``.
+
+    The images of a proposal are the rootnames in the ``master`` table
+    with the given ``proposid`` that have an ``flt`` file, ordered by
+    rootname.  Each neighbour is found with an ``ORDER BY ... LIMIT 1``
+    lookup on the ``proposid``/``rootname`` index of the ``master``
+    table, and the ``page`` with a count of the images before the
+    image on the same index.  The number of images of the proposal is
+    taken from the proposal index (see ``get_proposal_index``).
+
+    Parameters
+    ----------
+    data_dict : dict
+        A dictionary containing data used to render a webpage.
+
+    Returns
+    -------
+    data_dict : dict
+        A dictionary containing data used to render a webpage.
+    """
+
+    data_dict['page'] = None
+    data_dict['num_images'] = 0
+    data_dict['prev_filename'] = None
+    data_dict['next_filename'] = None
+
+    if not data_dict['proposal_id'].isdigit():
+        return data_dict
+
+    session = getattr(database_interface, 'session')
+
+    rootname = data_dict['rootname']
+    images = session.query(Master.rootname, Datasets.flt)\
+        .join(Datasets, Datasets.rootname == Master.rootname)\
+        .filter(Master.proposid == int(data_dict['proposal_id']))\
+        .filter(Datasets.flt.isnot(None))
+
+    prev_image = images.filter(Master.rootname < rootname)\
+        .order_by(Master.rootname.desc()).first()
+    next_image = images.filter(Master.rootname > rootname)\
+        .order_by(Master.rootname).first()
+    data_dict['page'] = images.filter(Master.rootname < rootname)\
+        .with_entities(func.count(Master.rootname)).scalar() + 1
+
+    session.close()
+
+    # The cached count may predate images ingested since it was made
+    num_images = get_proposal_index()['num_images'].get(
+        data_dict['proposal_id'], 0)
+    data_dict['num_images'] = max(num_images, data_dict['page'])
+
+    if prev_image:
+        data_dict['prev_filename'] = prev_image[1].split('_')[0]
+    if next_image:
+        data_dict['next_filename'] = next_image[1].split('_')[0]
+
+    return data_dict
+
+
 def _get_metadata_from_database(data_dict):
     """Add observation metadata (e.g. ``aperture``, ``exptime``, etc.)
     to the ``data_dict`` by querying the ``acsql`` database.
 
+    Rather than querying each rootname individually, the metadata is
+    fetched with one ``rootname IN (...)`` query per detector table
+    (chunked to keep the statements a reasonable size).  The results
+    are then put back in the order of ``data_dict['rootnames']``.
+
     Parameters
     ----------
     data_dict : dict
@@ -84,26 +176,30 @@ def _get_metadata_from_database(data_dict):
 
     session = getattr(database_interface, 'session')
 
-    results = []
-    for rootname in data_dict['rootnames']:
-
-        detector = session.query(Master.detector)\
-            .filter(Master.rootname == rootname).one()[0]
-
+    rootnames = data_dict['rootnames']
+    results_by_rootname = {}
+    for detector in ['WFC', 'HRC', 'SBC']:
         table = getattr(database_interface, '{}_raw_0'.format(detector))
-        result = session.query(
-            table.aperture, table.exptime, table.filter1, table.filter2,
-            table.targname, table.date_obs, table.time_obs, table.expstart,
-            table.expflag, table.quality, table.ra_targ, table.dec_targ,
-            table.pr_inv_f, table.pr_inv_l).filter(table.rootname == rootname).one()
-        result = [item for item in result]
-        result.append(detector)
-        results.append(result)
+        for i in range(0, len(rootnames), METADATA_CHUNK_SIZE):
+            chunk = rootnames[i:i + METADATA_CHUNK_SIZE]
+            query = session.query(
+                table.rootname, table.aperture, table.exptime,
+                table.filter1, table.filter2, table.targname, table.date_obs,
+                table.time_obs, table.expstart, table.expflag, table.quality,
+                table.ra_targ, table.dec_targ, table.pr_inv_f,
+                table.pr_inv_l).filter(table.rootname.in_(chunk))
+            for result in query.all():
+                results_by_rootname[result[0]] = list(result[1:]) + [detector]
 
     session.close()
 
+    # Put the results back in the order of the rootnames
+    empty_result = [None] * 15
+    results = [results_by_rootname.get(rootname, empty_result)
+               for rootname in rootnames]
+
     # Parse the results
-    data_dict['detectors'] = [detector for item in results]
+    data_dict['detectors'] = [item[14] for item in results]
     data_dict['apertures'] = [item[0] for item in results]
     data_dict['exptimes'] = [item[1] for item in results]
     data_dict['filter1s'] = [item[2] for item in results]
@@ -126,6 +222,12 @@ def _get_buttons_dict(data_dict):
     """Add data used for various buttons on the ``/archive/<proposal>``
     page or ``/database/results/`` page to the ``data_dict``.
 
+    The buttons are built from the ``facet_rows`` of the ``data_dict``,
+    which are the ``(detector, visit, targname, filter1, filter2,
+    count)`` rows returned by a ``GROUP BY`` query (see
+    ``_get_proposal_facets`` and ``query_lib._get_facet_rows``).  Each
+    button is a ``(value, count)`` tuple.
+
     Parameters
     ----------
     data_dict : dict
@@ -141,24 +243,30 @@ def _get_buttons_dict(data_dict):
         ``visits`` and ``targnames``
     """
 
+    counts = {'detector': {}, 'visit': {}, 'target': {}, 'filter': {}}
+    for detector, visit, targname, filter1, filter2, count in data_dict['facet_rows']:
+        facet_values = {'detector': detector,
+                        'visit': visit,
+                        'target': targname,
+                        'filter': '{}/{}'.format(filter1, filter2)}
+        for facet, value in facet_values.items():
+            counts[facet][value] = counts[facet].get(value, 0) + count
+
     data_dict['buttons'] = {}
-    data_dict['buttons']['detector'] = sorted(set(data_dict['detectors']))
-    data_dict['buttons']['visit'] = sorted(set(data_dict['visits']))
-    data_dict['buttons']['target'] = sorted(set(data_dict['targnames']))
-    data_dict['buttons']['filter'] = sorted(set([
-        '{}/{}'.format(filter1, filter2)
-        for filter1, filter2
-        in zip(data_dict['filter1s'], data_dict['filter2s'])]))
+    for facet in ['detector', 'visit', 'target', 'filter']:
+        data_dict['buttons'][facet] = sorted(counts[facet].items(),
+                                             key=lambda item: str(item[0]))
 
     return data_dict
 
 
-def _get_proposal_status(data_dict):
-    """Add proposal status information (e.g. ``proposal_title``,
-    ``cycle``, etc.) to the ``data_dict``.
+def _get_proposal_facets(data_dict):
+    """Add the facet counts (``facet_rows``) for the images of the
+    proposal to the ``data_dict``.
 
-    The proposal status information is scraped from the proposal
-    status webpage.
+    The counts are computed by the database with one ``GROUP BY``
+    query per detector table.  See ``_get_buttons_dict`` for further
+    details.
 
     Parameters
     ----------
@@ -171,27 +279,66 @@ def _get_proposal_status(data_dict):
         A dictionary containing data used to render a webpage.
     """
 
-    data_dict['status_page'] = (
-        'http://www.stsci.edu/cgi-bin/get-proposal-info?id={}'
-        '&submit=Go&observatory=HST').format(data_dict['proposal_id'])
+    data_dict['facet_rows'] = []
+
+    if not data_dict['proposal_id'].isdigit():
+        return data_dict
+
+    session = getattr(database_interface, 'session')
+
+    for detector in ['WFC', 'HRC', 'SBC']:
+        table = getattr(database_interface, '{}_raw_0'.format(detector))
+        visit = func.upper(func.substr(table.rootname, 5, 2))
+        query = session.query(visit, table.targname, table.filter1,
+                              table.filter2, func.count(table.rootname))\
+            .join(Master, Master.rootname == table.rootname)\
+            .join(Datasets, Datasets.rootname == table.rootname)\
+            .filter(Master.proposid == int(data_dict['proposal_id']))\
+            .filter(Datasets.flt.isnot(None))\
+            .group_by(visit, table.targname, table.filter1, table.filter2)
+        for result in query.all():
+            data_dict['facet_rows'].append((detector,) + tuple(result))
+
+    session.close()
+
+    return data_dict
+
+
+def _get_proposal_status(data_dict):
+    """Add proposal status information (e.g. ``proposal_title``,
+    ``cycle``, etc.) to the ``data_dict``.
+
+    The proposal status information is read from the ``proposals``
+    table, which is populated during ingestion (see
+    ``acsql.ingest.proposal_status``).
 
-    req = requests.get(data_dict['status_page'], timeout=3)
+    Parameters
+    ----------
+    data_dict : dict
+        A dictionary containing data used to render a webpage.
 
-    if req.ok:
+    Returns
+    -------
+    data_dict : dict
+        A dictionary containing data used to render a webpage.
+    """
 
-        status_string = req.content.decode()
-        data_dict['proposal_title'] = html.unescape(status_string.\
-            split('<b>Title:</b> ')[1].\
-            split('<br>')[0])
-        data_dict['cycle'] = html.unescape(status_string.\
-            split('<b>Cycle:</b> ')[1].\
-            split('<br>')[0])
-        data_dict['schedule'] = html.unescape(status_string.\
-            split('/proposal-help-HST.html#')[2].\
-            split('">')[0])
+    data_dict['status_page'] = get_status_page_url(data_dict['proposal_id'])
 
+    result = None
+    if data_dict['proposal_id'].isdigit():
+        session = getattr(database_interface, 'session')
+        result = session.query(
+            Proposals.title, Proposals.cycle, Proposals.schedule)\
+            .filter(Proposals.proposid == int(data_dict['proposal_id']))\
+            .first()
+        session.close()
+
+    if result:
+        data_dict['proposal_title'] = result[0]
+        data_dict['cycle'] = result[1]
+        data_dict['schedule'] = result[2]
     else:
-        print('Request failed: {}'.format(data_dict['status_page']))
         data_dict['proposal_title'] = 'proposal title unavailable'
         data_dict['cycle'] = None
         data_dict['schedule'] = None
@@ -228,20 +375,126 @@ def _initialize_data_dict(proposal, fits_type='flt'):
     return data_dict
 
 
-# def get_view_header_dict(filename, fits_type='flt'):
-#     """
-#     """
+def get_view_header_dict(filename, fits_type='flt'):
+    """Return a dictionary containing data used for the
+    ``/archive/<proposal>/<filename>/<fits_type>/headers/`` webpage.
 
-#     header_dict = {}
-#     header_dict['filename'] = filename
-#     header_dict['fits_type'] = fits_type.upper
+    The headers are read from the ``headers`` table of the ``acsql``
+    database rather than from the FITS file itself.
+
+    Parameters
+    ----------
+    filename : str
+        The 9-character IPPPSSOOT rootname (e.g. ``jcye04zsq``.)
+    fits_type : str
+        The FITS type of the file (e.g. ``flt``).
+
+    Returns
+    -------
+    header_dict : dict
+        A dictionary containing data used for the webpage.  The
+        ``header`` key holds an ``OrderedDict`` of the HTML of each
+        extension's header, and the ``etag`` key holds an identifier
+        that changes whenever any of the headers change (or ``None``
+        if there are no headers for the file).
+    """
+
+    header_dict = {}
+    header_dict['filename'] = filename
+    header_dict['fits_type'] = fits_type.upper()
+    header_dict['header'] = OrderedDict()
+
+    session = getattr(database_interface, 'session')
+    results = session.query(Headers.ext, Headers.header, Headers.checksum)\
+        .filter(Headers.filename == '{}_{}.fits'.format(filename, fits_type))\
+        .order_by(Headers.ext).all()
+    session.close()
+
+    for ext, header, checksum in results:
+        header_string = zlib.decompress(header).decode('ascii')
+        header_html = '<br>'.join([escape(line).replace(' ', '&nbsp;')
+                                   for line in header_string.split('\n')])
+        header_dict['header']['Extension {}'.format(ext)] = header_html
+
+    if results:
+        checksums = ''.join([item[2] for item in results])
+        header_dict['etag'] = hashlib.md5(checksums.encode()).hexdigest()
+    else:
+        header_dict['etag'] = None
+
+    return header_dict
+
+
+def get_proposal_index():
+    """Return the proposal index, which contains the set of all
+    proposals in the ``acsql`` database (``proposals``) and the layout
+    of the ``/archive/`` webpage (``proposal_array``).
+
+    The proposal index contains the proposals in the ``master`` table
+    that have images, i.e. at least one rootname with an ``flt`` file,
+    and is held in memory by each web server process.  It is rebuilt
+    once it is older than the ``proposal_index_ttl`` setting (in
+    seconds, 600 by default), or once ``invalidate_proposal_index()``
+    has been called (e.g. by an ingest) since it was built.
+
+    Returns
+    -------
+    proposal_index : dict
+        A dictionary with ``proposals`` (a ``frozenset`` of proposal
+        ID strings), ``proposal_array``, and ``num_images`` (the
+        number of images of each proposal) keys.
+    """
+
+    global PROPOSAL_INDEX
+
+    try:
+        invalidated = os.path.getmtime(os.path.join(SETTINGS['jpeg_dir'],
+                                                    PROPOSAL_INDEX_STAMP))
+    except OSError:
+        invalidated = 0
+
+    if time.time() < PROPOSAL_INDEX['expires'] \
+            and invalidated < PROPOSAL_INDEX['built']:
+        return PROPOSAL_INDEX
+
+    built = time.time()
+    session = getattr(database_interface, 'session')
+    results = session.query(Master.proposid, func.count(Master.rootname))\
+        .join(Datasets, Datasets.rootname == Master.rootname)\
+        .filter(Master.proposid.isnot(None))\
+        .filter(Datasets.flt.isnot(None))\
+        .group_by(Master.proposid).all()
+    session.close()
+
+    proposal_list = sorted([item[0] for item in results])
+
+    # Rearrange list so that it appears in multiple columns
+    ncols = 12
+    proposal_layout = list(proposal_list)
+    if len(proposal_layout) % ncols != 0:
+        proposal_layout.extend([''] * (ncols - (len(proposal_layout) % ncols)))
+    proposal_array = np.asarray(proposal_layout).reshape(ncols, int(len(proposal_layout) / ncols)).T
+
+    ttl = SETTINGS.get('proposal_index_ttl', 600)
+    PROPOSAL_INDEX = {'proposals': frozenset([str(item) for item in proposal_list]),
+                      'proposal_array': proposal_array,
+                      'num_images': {str(proposid): num_images
+                                     for proposid, num_images in results},
+                      'expires': built + ttl,
+                      'built': built}
+
+    return PROPOSAL_INDEX
 
-#     return header_dict
 
 def get_view_image_dict(proposal, filename, fits_type='flt'):
     """Return a dictionary containing data used for the
     ``/archive/<proposal>/<filename>/`` webpage.
 
+    Only the metadata for the requested image is retrieved; its
+    position within the proposal and its neighbouring images are
+    determined from the ``proposid``/``rootname`` index of the
+    ``master`` table (see ``_get_image_position``).
+
     Parameters
     ----------
     proposal : str
@@ -259,29 +512,31 @@ def get_view_image_dict(proposal, filename, fits_type='flt'):
         ``/archive/<proposal>/<filename>`` webpage.
     """
 
-    image_dict = _initialize_data_dict(proposal, fits_type)
+    image_dict = {}
+    image_dict['proposal_id'] = proposal
     image_dict['fits_type'] = fits_type.upper()
     image_dict['filename'] = filename
     image_dict['rootname'] = filename[:-1]
+    image_dict['rootnames'] = [image_dict['rootname']]
+    image_dict = _get_proposal_status(image_dict)
     image_dict = _get_metadata_from_database(image_dict)
-    image_dict['index'] = image_dict['filenames'].index(image_dict['filename'])
-    image_dict['page'] = image_dict['index'] + 1
-    image_dict['expstart'] = image_dict['expstarts'][image_dict['index']]
-    image_dict['filter1'] = image_dict['filter1s'][image_dict['index']]
-    image_dict['filter2'] = image_dict['filter2s'][image_dict['index']]
-    image_dict['aperture'] = image_dict['apertures'][image_dict['index']]
-    image_dict['exptime'] = image_dict['exptimes'][image_dict['index']]
-    image_dict['expflag'] = image_dict['expflags'][image_dict['index']]
-    image_dict['quality'] = image_dict['qualitys'][image_dict['index']]
-    image_dict['ra'] = image_dict['ras'][image_dict['index']]
-    image_dict['dec'] = image_dict['decs'][image_dict['index']]
-    image_dict['targname'] = image_dict['targnames'][image_dict['index']]
-    image_dict['pi_first_name'] = image_dict['pi_firsts'][image_dict['index']]
-    image_dict['pi_last_name'] = image_dict['pi_lasts'][image_dict['index']]
+    image_dict = _get_image_position(image_dict)
+    image_dict['expstart'] = image_dict['expstarts'][0]
+    image_dict['filter1'] = image_dict['filter1s'][0]
+    image_dict['filter2'] = image_dict['filter2s'][0]
+    image_dict['aperture'] = image_dict['apertures'][0]
+    image_dict['exptime'] = image_dict['exptimes'][0]
+    image_dict['expflag'] = image_dict['expflags'][0]
+    image_dict['quality'] = image_dict['qualitys'][0]
+    image_dict['ra'] = image_dict['ras'][0]
+    image_dict['dec'] = image_dict['decs'][0]
+    image_dict['targname'] = image_dict['targnames'][0]
+    image_dict['pi_first_name'] = image_dict['pi_firsts'][0]
+    image_dict['pi_last_name'] = image_dict['pi_lasts'][0]
     image_dict['view_url'] = 'archive/{}/{}/{}'.format(image_dict['proposal_id'], image_dict['filename'], fits_type)
     image_dict['fits_links'] = {}
-    image_dict['first'] = image_dict['index'] == 0
-    image_dict['last'] = image_dict['index'] == image_dict['num_images'] - 1
+    image_dict['first'] = image_dict['prev_filename'] is None
+    image_dict['last'] = image_dict['next_filename'] is None
 
     # Determine path to JPEG
     jpeg_path = '/static/img/jpegs/{}/{}_{}.jpg'.format(image_dict['proposal_id'], image_dict['filename'], fits_type)
@@ -293,9 +548,9 @@ def get_view_image_dict(proposal, filename, fits_type='flt'):
 
     # Determine next and previous images, if possible
     if not image_dict['last']:
-        image_dict['next'] = {'proposal': image_dict['proposal_id'], 'filename': image_dict['filenames'][image_dict['index'] + 1], 'fits_type': fits_type}
+        image_dict['next'] = {'proposal': image_dict['proposal_id'], 'filename': image_dict['next_filename'], 'fits_type': fits_type}
     if not image_dict['first']:
-        image_dict['prev'] = {'proposal': image_dict['proposal_id'], 'filename': image_dict['filenames'][image_dict['index'] - 1], 'fits_type': fits_type}
+        image_dict['prev'] = {'proposal': image_dict['proposal_id'], 'filename': image_dict['prev_filename'], 'fits_type': fits_type}
 
     # Determine other available JPEGs for given observation
     jpeg_types = glob.glob(jpeg_path_abs.replace('{}.jpg'.format(fits_type), '*.jpg'))
@@ -336,6 +591,7 @@ def get_view_proposal_dict(proposal):
     proposal_dict['visits'] = [os.path.basename(item).split('_')[0][4:6].upper() for item in proposal_dict['jpegs']]
     proposal_dict['num_visits'] = len(set(proposal_dict['visits']))
     proposal_dict = _get_metadata_from_database(proposal_dict)
+    proposal_dict = _get_proposal_facets(proposal_dict)
     proposal_dict = _get_buttons_dict(proposal_dict)
     proposal_dict['viewlinks'] = ['/archive/{}/{}/'.format(proposal_dict['proposal_id'], filename) for filename in proposal_dict['filenames']]
 
@@ -361,19 +617,27 @@ def get_view_query_results_dict(query_results_dict):
     """
 
     query_results = query_results_dict['query_results']
+    query_columns = query_results_dict['query_columns']
+
+    def _column(name):
+        return [item[query_columns.index(name)] for item in query_results]
 
     thumbnail_dict = {}
-    thumbnail_dict['num_images'] = query_results_dict['num_results']
-    thumbnail_dict['rootnames'] = [item[3] for item in query_results]
-    thumbnail_dict['filenames'] = [item[4].split('_')[0] for item in query_results]
-    thumbnail_dict['detectors'] = [item[5] for item in query_results]
-    thumbnail_dict['expstarts'] = [item[6] for item in query_results]
-    thumbnail_dict['filter1s'] = [item[7] for item in query_results]
-    thumbnail_dict['filter2s'] = [item[8] for item in query_results]
-    thumbnail_dict['exptimes'] = [item[9] for item in query_results]
-    thumbnail_dict['targnames'] = [item[10] for item in query_results]
-    thumbnail_dict['proposal_ids'] = [item[11] for item in query_results]
+    thumbnail_dict['num_images'] = len(query_results)
+    thumbnail_dict['num_results'] = query_results_dict['num_results']
+    thumbnail_dict['page'] = query_results_dict['page']
+    thumbnail_dict['num_pages'] = query_results_dict['num_pages']
+    thumbnail_dict['rootnames'] = _column('rootname')
+    thumbnail_dict['filenames'] = [item.split('_')[0] for item in _column('filename')]
+    thumbnail_dict['detectors'] = _column('detector')
+    thumbnail_dict['expstarts'] = _column('expstart')
+    thumbnail_dict['filter1s'] = _column('filter1')
+    thumbnail_dict['filter2s'] = _column('filter2')
+    thumbnail_dict['exptimes'] = _column('exptime')
+    thumbnail_dict['targnames'] = _column('targname')
+    thumbnail_dict['proposal_ids'] = _column('proposid')
     thumbnail_dict['visits'] = [item[4:6] for item in thumbnail_dict['rootnames']]
+    thumbnail_dict['facet_rows'] = query_results_dict['facet_rows']
     thumbnail_dict = _get_buttons_dict(thumbnail_dict)
     thumbnail_dict['thumbs'] = ['static/img/thumbnails/{}/{}_flt.thumb'.format(proposid, filename)
         for proposid, filename in zip(thumbnail_dict['proposal_ids'], thumbnail_dict['filenames'])]
@@ -381,3 +645,16 @@ def get_view_query_results_dict(query_results_dict):
         for proposid, filename in zip(thumbnail_dict['proposal_ids'], thumbnail_dict['filenames'])]
 
     return thumbnail_dict
+
+
+def invalidate_proposal_index():
+    """Force the proposal index of every web server process to be
+    rebuilt the next time ``get_proposal_index()`` is called, by
+    updating the modification time of the ``PROPOSAL_INDEX_STAMP`` file
+    in the ``jpeg_dir``."""
+
+    stamp = os.path.join(SETTINGS['jpeg_dir'], PROPOSAL_INDEX_STAMP)
+    with open(stamp, 'a'):
+        os.utime(stamp, None)
+
+    PROPOSAL_INDEX['expires'] = 0
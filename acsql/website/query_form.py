@@ -186,6 +186,21 @@ class QueryForm(Form):
     exptime = FormField(ExptimeForm,
               'Exposure Time',
               description='span4')
+    cone_ra = DecimalField('Cone Search RA',
+              [validators.Optional(),
+              validators.NumberRange(min=0, max=360,
+              message='Please enter a right ascension between 0 and 360')],
+              description='Degrees span4')
+    cone_dec = DecimalField('Cone Search Dec',
+               [validators.Optional(),
+               validators.NumberRange(min=-90, max=90,
+               message='Please enter a declination between -90 and 90')],
+               description='Degrees span4')
+    cone_radius = DecimalField('Cone Search Radius',
+                  [validators.Optional(),
+                  validators.NumberRange(min=0, max=600,
+                  message='Please enter a radius between 0 and 600 arcminutes')],
+                  description='Arcminutes span4')
     proposal_type = CheckboxField('Proposal Type',
                     [validators.Optional()],
                     description='span3',
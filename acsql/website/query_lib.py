@@ -31,17 +31,33 @@ Dependencies
     - ``sqlalchemy``
 """
 
-from sqlalchemy import create_engine
+from collections import OrderedDict
+import time
+
+from sqlalchemy import func
 from sqlalchemy import literal_column
 from sqlalchemy import or_
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
 
+from acsql.database.database_interface import load_connection
 from acsql.database.database_interface import Master
+from acsql.database.database_interface import Observations
 from acsql.database.database_interface import WFC_raw_0
 from acsql.database.database_interface import HRC_raw_0
 from acsql.database.database_interface import SBC_raw_0
+from acsql.database.name_index import find_names
+from acsql.database.name_index import NAME_INDEX_COLUMNS
+from acsql.database.sky_index import get_cone_clause
 from acsql.utils.utils import SETTINGS
 
+# Cache of facet counts for recently performed queries
+FACET_CACHE = OrderedDict()
+FACET_CACHE_SIZE = 100
+FACET_CACHE_TTL = 600
+
+# The number of results on each page of the ``/database/results/`` page
+RESULTS_PAGE_SIZE = 1000
+
 
 def _apply_query_filter(table, key, values, query):
     """Apply a filter to the given ``query`` based on the ``table``,
@@ -72,8 +88,16 @@ def _apply_query_filter(table, key, values, query):
     # Fields that allow operators
     operator_keys = ['date_obs', 'exptime']
 
+    # Use the name index to match names, which supports wildcards
+    if key in NAME_INDEX_COLUMNS:
+        parsed_value = values[0].replace(' ', '').split(',')
+        names = set()
+        for pattern in parsed_value:
+            names.update(find_names(key, pattern))
+        query = query.filter(getattr(table, key).in_(sorted(names)))
+
     # Parse the key/value pairs for comma-separated values
-    if key in csv_keys:
+    elif key in csv_keys:
         parsed_value = values[0].replace(' ', '').split(',')
         parsed_value = [item.replace('*', '%') for item in parsed_value]
         conditions = [getattr(table, key).like(val) for val in parsed_value]
@@ -97,7 +121,42 @@ def _apply_query_filter(table, key, values, query):
             query = query.filter(getattr(table, key).op(values['op'])(values['val1']))
 
     # Else the filtering is straightforward
-    query = query.filter(getattr(table, key).in_(values))
+    else:
+        query = query.filter(getattr(table, key).in_(values))
+
+    return query
+
+
+def _build_observations_query(output_columns, query_form_dict):
+    """Build the query for the requested columns and filters against
+    the ``observations`` table.
+
+    Parameters
+    ----------
+    output_columns : list
+        List of columns desired for query output
+    query_form_dict : dict
+        The (converted) query form data to filter on.
+
+    Returns
+    -------
+    query : obj
+        The ``SQLAlchemy`` ``query`` object, or ``None`` if no filters
+        were requested.
+    """
+
+    if not query_form_dict:
+        return None
+
+    session = _get_session()
+    query = session.query(*[getattr(Observations, col) for col in output_columns])
+    session.close()
+
+    for key, value in list(query_form_dict.items()):
+        if key == 'cone':
+            query = query.filter(_get_cone_clause(value))
+        else:
+            query = _apply_query_filter(Observations, key, value, query)
 
     return query
 
@@ -183,6 +242,57 @@ def _build_queries(output_columns):
     return wfc_query, hrc_query, sbc_query
 
 
+def _build_union_query(output_columns, query_form_dict):
+    """Build the query for the requested columns and filters as a
+    union of queries against the ``master`` table and each of the
+    ``<detector>_raw_0`` tables.
+
+    Parameters
+    ----------
+    output_columns : list
+        List of columns desired for query output
+    query_form_dict : dict
+        The (converted) query form data to filter on.
+
+    Returns
+    -------
+    query : obj
+        The ``SQLAlchemy`` ``query`` object with merging applied.
+    """
+
+    wfc_query, hrc_query, sbc_query = _build_queries(output_columns)
+
+    # Perform filtering on the query
+    for key, value in list(query_form_dict.items()):
+        if key == 'cone':
+            rootnames = select([Observations.rootname])\
+                .where(_get_cone_clause(value))
+            if wfc_query:
+                wfc_query = wfc_query.filter(Master.rootname.in_(rootnames))
+            if hrc_query:
+                hrc_query = hrc_query.filter(Master.rootname.in_(rootnames))
+            if sbc_query:
+                sbc_query = sbc_query.filter(Master.rootname.in_(rootnames))
+        if hasattr(Master, key):
+            if wfc_query:
+                wfc_query = _apply_query_filter(Master, key, value, wfc_query)
+            if hrc_query:
+                hrc_query = _apply_query_filter(Master, key, value, hrc_query)
+            if sbc_query:
+                sbc_query = _apply_query_filter(Master, key, value, sbc_query)
+        if wfc_query and hasattr(WFC_raw_0, key) and not hasattr(Master, key):
+            wfc_query = _apply_query_filter(WFC_raw_0, key, value, wfc_query)
+        if hrc_query and hasattr(HRC_raw_0, key) and not hasattr(Master, key):
+            hrc_query = _apply_query_filter(HRC_raw_0, key, value, hrc_query)
+        if sbc_query and hasattr(SBC_raw_0, key) and not hasattr(Master, key):
+            sbc_query = _apply_query_filter(SBC_raw_0, key, value, sbc_query)
+
+    # Combine the results
+    query = _merge_query(wfc_query, hrc_query, sbc_query)
+
+    return query
+
+
 def _convert_query_form_dict(query_form_dict):
     """Converts raw output from ``form.to_dict()`` to a format that is
     more useable for ``acsql`` database queries.
@@ -218,9 +328,91 @@ def _convert_query_form_dict(query_form_dict):
         if len(operator_dict) > 1:
             query_form_dict[operator_key] = operator_dict
 
+    # Combine the cone search fields (the radius is given in arcminutes)
+    cone_keys = ['cone_ra', 'cone_dec', 'cone_radius']
+    cone_values = [query_form_dict.pop(key, None) for key in cone_keys]
+    if all(cone_values):
+        query_form_dict['cone'] = {'ra': float(cone_values[0][0]),
+                                   'dec': float(cone_values[1][0]),
+                                   'radius': float(cone_values[2][0]) / 60.}
+
     return query_form_dict
 
 
+def _get_cone_clause(cone):
+    """Return the clause that selects the rows of the ``observations``
+    table within the given cone, using its ``sky_pixel`` index (see
+    ``acsql.database.sky_index.get_cone_clause``).
+
+    Parameters
+    ----------
+    cone : dict
+        The ``ra``, ``dec``, and ``radius`` (in degrees) of the cone.
+
+    Returns
+    -------
+    clause : obj
+        The ``SQLAlchemy`` clause.
+    """
+
+    return get_cone_clause(Observations.sky_pixel, Observations.dec_targ,
+                           cone['ra'], cone['dec'], cone['radius'],
+                           ra_column=Observations.ra_targ)
+
+
+def _get_facet_rows(query, query_columns):
+    """Return the facet counts used to build the buttons of the
+    ``/database/results/`` page.
+
+    The counts are computed by the database with a single ``GROUP BY``
+    query over the given ``query``, rather than by loading every row
+    into memory.  Results are cached (keyed by the SQL statement and
+    its parameters) for ``FACET_CACHE_TTL`` seconds.
+
+    Parameters
+    ----------
+    query : obj
+        The ``SQLAlchemy`` ``query`` object of the requested query.
+    query_columns : list
+        The names of the columns returned by the ``query``.
+
+    Returns
+    -------
+    facet_rows : list
+        A list of ``(detector, visit, targname, filter1, filter2,
+        count)`` tuples.
+    """
+
+    statement = query.statement.compile()
+    key = (str(statement), repr(sorted(statement.params.items())))
+
+    cached = FACET_CACHE.get(key)
+    if cached and cached[0] > time.time():
+        FACET_CACHE.move_to_end(key)
+        return cached[1]
+
+    subquery = query.subquery()
+    columns = list(subquery.c)
+    detector = columns[query_columns.index('detector')]
+    visit = func.substr(columns[query_columns.index('rootname')], 5, 2)
+    targname = columns[query_columns.index('targname')]
+    filter1 = columns[query_columns.index('filter1')]
+    filter2 = columns[query_columns.index('filter2')]
+
+    session = _get_session()
+    facet_query = session.query(detector, visit, targname, filter1, filter2,
+                                func.count())\
+        .group_by(detector, visit, targname, filter1, filter2)
+    facet_rows = [tuple(item) for item in facet_query.all()]
+    session.close()
+
+    FACET_CACHE[key] = (time.time() + FACET_CACHE_TTL, facet_rows)
+    if len(FACET_CACHE) > FACET_CACHE_SIZE:
+        FACET_CACHE.popitem(last=False)
+
+    return facet_rows
+
+
 def generate_csv(output_columns, results):
     """Create a CSV file of the database query ouput.
 
@@ -248,18 +440,24 @@ def get_query_results(query_form_dict):
     functions to build and perform the query in order to abstract
     out its complexity.
 
+    The total number of results is determined with a ``COUNT`` query,
+    and only the requested ``page`` of ``RESULTS_PAGE_SIZE`` results is
+    fetched (with ``LIMIT``/``OFFSET``).  For the ``csv`` output format,
+    all of the results are streamed from the database instead.
+
     Parameters
     ----------
     query_form_dict : dict
         A dictionary containing information about the requested query,
-        such as the ``output_format``, ``output_columns`` and the
-        requested values.
+        such as the ``output_format``, ``output_columns``, ``page`` and
+        the requested values.
 
     Returns
     -------
     query_results_dict : dict
         A dictionary containing the query results as well as some
-        metadata such as ``output_format`` and number of results.
+        metadata such as ``output_format``, number of results, and
+        number of pages.
     """
 
     # Determine output format
@@ -273,43 +471,55 @@ def get_query_results(query_form_dict):
     else:
         output_columns = query_form_dict.pop('output_columns')
 
+    # Determine the requested page of results
+    page = query_form_dict.pop('page', ['1'])[0]
+    page = max(int(page), 1) if page.isdigit() else 1
+
     # Remove blank entries from form data
     query_form_dict = _convert_query_form_dict(query_form_dict)
 
-    # Build the query
-    wfc_query, hrc_query, sbc_query = _build_queries(output_columns)
-
-    # Perform filtering on the query
-    for key, value in list(query_form_dict.items()):
-        if hasattr(Master, key):
-            if wfc_query:
-                wfc_query = _apply_query_filter(Master, key, value, wfc_query)
-            if hrc_query:
-                hrc_query = _apply_query_filter(Master, key, value, hrc_query)
-            if sbc_query:
-                sbc_query = _apply_query_filter(Master, key, value, sbc_query)
-        if wfc_query and hasattr(WFC_raw_0, key) and not hasattr(Master, key):
-            wfc_query = _apply_query_filter(WFC_raw_0, key, value, wfc_query)
-        if hrc_query and hasattr(HRC_raw_0, key) and not hasattr(Master, key):
-            hrc_query = _apply_query_filter(HRC_raw_0, key, value, hrc_query)
-        if sbc_query and hasattr(SBC_raw_0, key) and not hasattr(Master, key):
-            sbc_query = _apply_query_filter(SBC_raw_0, key, value, sbc_query)
-
-    # Combine the results
-    query = _merge_query(wfc_query, hrc_query, sbc_query)
+    # Use the observations table if it holds all of the requested columns
+    if _use_observations_table(output_columns, query_form_dict):
+        query = _build_observations_query(output_columns, query_form_dict)
+    else:
+        query = _build_union_query(output_columns, query_form_dict)
 
     # Perform the query
     if query:
-        query_results = query.all()
-        num_results = len(query_results)
+        query_columns = [item['name'] for item in query.column_descriptions]
+        num_results = query.count()
+        num_pages = max(-(-num_results // RESULTS_PAGE_SIZE), 1)
+        page = min(page, num_pages)
+        if output_format == ['csv']:
+            query_results = query.yield_per(RESULTS_PAGE_SIZE)
+        else:
+            # Order by every column (by position, so that the ordering
+            # also applies to union queries) so that pages do not overlap
+            order = [literal_column(str(i + 1))
+                     for i in range(len(query_columns))]
+            query_results = query.order_by(*order)\
+                .limit(RESULTS_PAGE_SIZE)\
+                .offset((page - 1) * RESULTS_PAGE_SIZE).all()
     else:
         query_results = False
         num_results = 0
+        num_pages = 1
+        query_columns = []
+
+    # Determine the facet counts for the thumbnail buttons
+    if query and output_format == ['thumbnails']:
+        facet_rows = _get_facet_rows(query, query_columns)
+    else:
+        facet_rows = []
 
     # Put results in a dictinoary
     query_results_dict = {}
     query_results_dict['num_results'] = num_results
+    query_results_dict['page'] = page
+    query_results_dict['num_pages'] = num_pages
     query_results_dict['query_results'] = query_results
+    query_results_dict['query_columns'] = query_columns
+    query_results_dict['facet_rows'] = facet_rows
     query_results_dict['output_format'] = output_format
     query_results_dict['output_columns'] = output_columns
 
@@ -327,9 +537,7 @@ def _get_session():
         connection to the ``acsql`` database.
     """
 
-    engine = create_engine(SETTINGS['connection_string'], echo=False, pool_timeout=100000)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    session, base, engine = load_connection(SETTINGS['connection_string'])
 
     return session
 
@@ -388,3 +596,30 @@ def _merge_query(wfc_query, hrc_query, sbc_query):
         query = None
 
     return query
+
+
+def _use_observations_table(output_columns, query_form_dict):
+    """Determine if the ``observations`` table holds all of the
+    requested output columns and filter keys, in which case the query
+    can be performed against that single table.
+
+    Parameters
+    ----------
+    output_columns : list
+        List of columns desired for query output
+    query_form_dict : dict
+        The (converted) query form data to filter on.
+
+    Returns
+    -------
+    use_observations : bool
+        ``True`` if the ``observations`` table can be used.
+    """
+
+    # Cone searches filter on the sky pixel index of the observations
+    # table, so they do not prevent its use
+    keys = list(output_columns) + list(query_form_dict)
+    use_observations = all([hasattr(Observations, key) or key == 'cone'
+                            for key in keys])
+
+    return use_observations
@@ -30,8 +30,7 @@ import os
 import matplotlib.pyplot as plt
 import numpy as np
 
-from acsql.database import database_interface
-from acsql.database.database_interface import session
+from acsql.database.aggregates import get_table_counts
 from acsql.utils.utils import HRC_FILE_EXTS
 from acsql.utils.utils import SBC_FILE_EXTS
 from acsql.utils.utils import SETTINGS
@@ -52,30 +51,15 @@ if __name__ == '__main__':
         for extension in WFC_FILE_EXTS[filetype]:
             wfc_tables.append('WFC_{}_{}'.format(filetype, extension))
 
-    # Get the class objects for each table
-    hrc_class_objs = [getattr(database_interface, table) for table in hrc_tables]
-    sbc_class_objs = [getattr(database_interface, table) for table in sbc_tables]
-    wfc_class_objs = [getattr(database_interface, table) for table in wfc_tables]
-
-    # Determine number of records in each table
-    hrc_num_records = []
-    for table in hrc_class_objs:
-        print('Querying {}'.format(table))
-        hrc_num_records.append(session.query(table).count())
-
-    sbc_num_records = []
-    for table in sbc_class_objs:
-        print('Querying {}'.format(table))
-        sbc_num_records.append(session.query(table).count())
-
-    wfc_num_records = []
-    for table in wfc_class_objs:
-        print('Querying {}'.format(table))
-        wfc_num_records.append(session.query(table).count())
+    # Determine number of records in each table from the aggregate counts
+    table_counts = get_table_counts()
+    hrc_num_records = [table_counts.get(table.lower(), 0) for table in hrc_tables]
+    sbc_num_records = [table_counts.get(table.lower(), 0) for table in sbc_tables]
+    wfc_num_records = [table_counts.get(table.lower(), 0) for table in wfc_tables]
 
     # Get number of records for master and datasets tables
-    master_num_records = session.query((getattr(database_interface, 'Master'))).count()
-    datasets_num_records = session.query((getattr(database_interface, 'Datasets'))).count()
+    master_num_records = table_counts.get('master', 0)
+    datasets_num_records = table_counts.get('datasets', 0)
 
     # Aggregate results into two lists
     table_names = wfc_tables